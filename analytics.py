@@ -0,0 +1,356 @@
+import atexit
+import calendar
+import json
+import os
+import shutil
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+import database as db
+
+# Columnar, in-memory copy of one user's transactions for trend reports. The history is
+# loaded once into NumPy arrays and then kept current by applying db.get_changes_since()
+# in Refresh(). Multi-year aggregates are vectorized group-bys over those arrays
+# (np.bincount), with no GROUP BY queries against the database.
+#
+# Columns, one entry per transaction in no particular order:
+#   ids       transaction_id               int64
+#   day       days since 1970-01-01        int32
+#   month     months since 1970-01         int32
+#   amount    signed cents                 int64
+#   category  index into .categories       int32
+#   type      index into TYPES             int8
+#   account   account_id                   int32
+# Totals come back as positive cents for income and expense alike, like the dashboard.
+#
+# Snapshots: the columns are also saved per user as .npy files next to the database
+# (financify.db.snapshots/user-<id>/) with a meta.json holding the data version they match
+# and the schema version they were built under.
+# load_snapshot() memory-maps them without touching SQLite, so the UI can draw last
+# session's numbers immediately; get_history() then patches them forward with only the
+# rows changed since that version.
+
+TYPES = ('Income', 'Expense')
+COLUMNS = ('ids', 'day', 'month', 'amount', 'category', 'type', 'account')
+# Refresh() reloads instead of patching once this share of the rows has changed
+RELOAD_FRACTION = 0.25
+# Months before the projected one whose day-by-day spending shapes its projection
+TRAILING_MONTHS = 3
+SNAPSHOT_FORMAT = 1
+
+_lock = threading.Lock()
+_histories = {}
+_loading = {}  # (DB_NAME, user_id) -> thread loading that history for history_if_loaded
+_loading_lock = threading.Lock()
+
+def day_number(iso_date):
+    return int(np.datetime64(iso_date, 'D').astype(np.int64))
+
+def month_labels(first, count):
+    # 'YYYY-MM' for `count` months from `first` (months since 1970-01)
+    return np.arange(first, first + count).astype('datetime64[M]').astype(str).tolist()
+
+class UserHistory:
+    def __init__(self, user_id, snapshot=None):
+        # snapshot: (version, categories, {column: array}) to start from instead of loading
+        self.user_id = user_id
+        self.saved_version = None
+        if snapshot is None:
+            self.Load()
+            return
+        self.version, categories, columns = snapshot
+        self.categories = list(categories)
+        self.category_codes = {name: code for code, name in enumerate(self.categories)}
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def Load(self):
+        self._Replace(*db.get_changes_since(self.user_id)[:2])
+
+    def _Replace(self, version, rows):
+        self.categories = []
+        self.category_codes = {}
+        for name, column in self._Columns(rows).items():
+            setattr(self, name, column)
+        self.version = version
+
+    def Refresh(self):
+        # Applies the writes made since the last load or refresh; True if anything changed
+        version, rows, deleted = db.get_changes_since(self.user_id, self.version)
+        if version == self.version: return False
+        if deleted is None:
+            # Too far behind: the tombstones it would need have been pruned, these are all the rows
+            self._Replace(version, rows)
+            return True
+        if len(rows) + len(deleted) > RELOAD_FRACTION * max(len(self.ids), 1000):
+            self.Load()
+            return True
+        # Updated rows come back as changed rows: drop the old copy, append the new one
+        keep = ~np.isin(self.ids, np.array([r[0] for r in rows] + deleted, dtype=np.int64))
+        new = self._Columns(rows)
+        for name in COLUMNS:
+            setattr(self, name, np.concatenate([getattr(self, name)[keep], new[name]]))
+        self.version = version
+        return True
+
+    def _Columns(self, rows):
+        ids, accounts, dates, amounts, types, categories = zip(*rows) if rows else ((),) * 6
+        codes = self.category_codes
+        for name in set(categories) - codes.keys():
+            codes[name] = len(self.categories)
+            self.categories.append(name)
+        day = np.array(dates, dtype='datetime64[D]')
+        return {'ids': np.array(ids, dtype=np.int64),
+                'day': day.astype(np.int32),
+                'month': day.astype('datetime64[M]').astype(np.int32),
+                'amount': np.array(amounts, dtype=np.int64),
+                'category': np.fromiter(map(codes.__getitem__, categories), np.int32, len(categories)),
+                'type': np.fromiter(map('Expense'.__eq__, types), np.int8, len(types)),
+                'account': np.array(accounts, dtype=np.int32)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _Mask(self, trans_type=None, start=None, end=None):
+        # start and end are inclusive ISO dates
+        mask = np.ones(len(self.ids), dtype=bool)
+        if trans_type: mask &= self.type == TYPES.index(trans_type)
+        if start: mask &= self.day >= day_number(start)
+        if end: mask &= self.day <= day_number(end)
+        return mask
+
+    @staticmethod
+    def _Sum(keys, amounts, size):
+        # Per-key sums of integer cents. bincount adds in float64, which is exact for
+        # integers below 2**53 (about 90 trillion rupees).
+        return np.bincount(keys, weights=amounts, minlength=size)[:size].round().astype(np.int64)
+
+    def MonthlyTotals(self, start=None, end=None):
+        # Every month from the first transaction to the last, gaps included
+        mask = self._Mask(None, start, end)
+        if not mask.any(): return {'months': [], 'income': [], 'expense': [], 'net': []}
+        months, first = self.month[mask], self.month[mask].min()
+        size = months.max() - first + 1
+        key = (months - first) * 2 + self.type[mask]
+        totals = self._Sum(key, np.abs(self.amount[mask]), size * 2).reshape(size, 2)
+        return {'months': month_labels(first, size), 'income': totals[:, 0].tolist(),
+                'expense': totals[:, 1].tolist(), 'net': (totals[:, 0] - totals[:, 1]).tolist()}
+
+    def CategoryTotals(self, trans_type='Expense', start=None, end=None):
+        # [(category, total)], largest first
+        mask = self._Mask(trans_type, start, end)
+        totals = self._Sum(self.category[mask], np.abs(self.amount[mask]), len(self.categories))
+        order = np.argsort(-totals, kind='stable')
+        return [(self.categories[i], int(totals[i])) for i in order if totals[i]]
+
+    def CategoryByMonth(self, trans_type='Expense', start=None, end=None):
+        # months x categories matrix of totals, for stacked trend charts
+        mask = self._Mask(trans_type, start, end)
+        if not mask.any(): return {'months': [], 'categories': [], 'totals': []}
+        months, first = self.month[mask], self.month[mask].min()
+        size, width = months.max() - first + 1, len(self.categories)
+        totals = self._Sum((months - first) * width + self.category[mask], np.abs(self.amount[mask]), size * width).reshape(size, width)
+        used = totals.any(axis=0)
+        return {'months': month_labels(first, size),
+                'categories': [c for c, u in zip(self.categories, used) if u], 'totals': totals[:, used].tolist()}
+
+    def WeekdayTotals(self, trans_type='Expense', start=None, end=None):
+        # Totals Monday first; 1970-01-01 was a Thursday
+        mask = self._Mask(trans_type, start, end)
+        return self._Sum((self.day[mask] + 3) % 7, np.abs(self.amount[mask]), 7).tolist()
+
+    def RollingTotals(self, window=30, trans_type='Expense', start=None, end=None):
+        # Sum over the `window` days ending on each day from start to end. Windows at the
+        # start of the range still count the days before it.
+        mask = self._Mask(trans_type)
+        if not mask.any(): return {'days': [], 'totals': []}
+        days = self.day[mask]
+        first, last = int(days.min()), int(days.max())
+        lo = day_number(start) if start else first
+        hi = day_number(end) if end else last
+        if hi < lo: return {'days': [], 'totals': []}
+        # Daily totals from `first` (or the window before lo) to hi, then differences of their running sum
+        base = min(first, lo - window + 1)
+        keep = days <= hi
+        daily = self._Sum(days[keep] - base, np.abs(self.amount[mask][keep]), hi - base + 1)
+        running = np.concatenate([[0], np.cumsum(daily)])
+        upto = np.arange(lo - base + 1, hi - base + 2)
+        totals = running[upto] - running[upto - window]
+        return {'days': np.arange(lo, hi + 1).astype('datetime64[D]').astype(str).tolist(), 'totals': totals.tolist()}
+
+    def ProjectMonth(self, month, year, budgets=None, today=None, trailing_months=TRAILING_MONTHS):
+        # End-of-month expense projection for every category in one pass.
+        # budgets: {category: cents}. Returns {category: {'spent', 'projected', 'exhausted_on'}}
+        # for each category with spending this month or a budget. exhausted_on is the ISO day
+        # the budget was or is projected to be used up, or None.
+        #
+        # What is still to come blends two estimates, trusting the first more as the month goes on:
+        #   - this month's pace: spending so far, scaled by how the trailing months continued
+        #     after this day (plain run rate for categories with no history so far)
+        #   - the trailing months' average spending after this day of the month
+        # so rent paid on the 1st isn't extrapolated and a bill due on the 20th is expected.
+        budgets = budgets or {}
+        today = today or date.today()
+        days = calendar.monthrange(year, month)[1]
+        first_day = date(year, month, 1)
+        elapsed = min(max((today - first_day).days + 1, 0), days)
+        with _lock:
+            # get_history may be refreshing this history on another thread: work on one consistent
+            # set of columns, and extend a copy of the categories with the budgeted ones
+            categories = list(self.categories)
+            kind, month_of, day_of, category_of, amount_of = self.type, self.month, self.day, self.category, self.amount
+        codes = {name: code for code, name in enumerate(categories)}
+        for category in budgets.keys() - codes.keys():
+            codes[category] = len(categories)
+            categories.append(category)
+        width = len(categories)
+
+        # months x categories x day-of-month cube of expenses, current month last
+        current = (year - 1970) * 12 + month - 1
+        rows = np.flatnonzero((kind == 1) & (month_of >= current - trailing_months) & (month_of <= current))
+        months = month_of[rows] - (current - trailing_months)
+        month_starts = np.arange(current - trailing_months, current + 1).astype('datetime64[M]').astype('datetime64[D]').astype(np.int32)
+        key = (months * width + category_of[rows]) * 31 + day_of[rows] - month_starts[months]
+        cube = self._Sum(key, np.abs(amount_of[rows]), (trailing_months + 1) * width * 31).reshape(trailing_months + 1, width, 31)
+        this_month, past = cube[-1], cube[:-1]
+
+        spent = this_month.sum(axis=1)
+        to_date = this_month[:, :elapsed].sum(axis=1)
+        left_days = days - elapsed
+        past_to_date = past[:, :, :elapsed].sum(axis=(0, 2))
+        past_after = past[:, :, elapsed:days].sum(axis=(0, 2))  # only days this month still has
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pace = np.where(past_to_date > 0, to_date * past_after / past_to_date, to_date * left_days / max(elapsed, 1))
+        # Averaged over the trailing months the user has any data in, so new users aren't underestimated
+        after_today = past_after / max(past.any(axis=(1, 2)).sum(), 1)
+        weight = np.where(past.any(axis=(0, 2)), elapsed / days, 1.0)
+        projected = spent + np.rint(weight * pace + (1 - weight) * after_today).astype(np.int64)
+
+        # Day the budget runs out: when spending so far crossed it, else at the projected pace
+        budget = np.zeros(width, dtype=np.int64)
+        for category, amount in budgets.items(): budget[codes[category]] = amount
+        crossed = (np.cumsum(this_month[:, :days], axis=1) >= budget[:, None]) & (budget > 0)[:, None]
+        crossed_on = np.where(crossed.any(axis=1), crossed.argmax(axis=1), -1)
+        daily = (projected - spent) / max(left_days, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ahead = np.ceil((budget - spent) / daily)
+        runs_out = np.where(crossed_on >= 0, crossed_on,
+                            np.where((budget > 0) & (projected > budget) & (daily > 0), elapsed - 1 + ahead, -1))
+        runs_out = np.where(runs_out < days, runs_out, -1)
+
+        result = {}
+        for i in np.flatnonzero((spent > 0) | (projected > 0) | (budget > 0)):
+            result[categories[i]] = {'spent': int(spent[i]), 'projected': int(projected[i]),
+                                          'exhausted_on': (first_day + timedelta(days=int(runs_out[i]))).isoformat() if runs_out[i] >= 0 else None}
+        return result
+
+def snapshot_dir(user_id, db_name=None):
+    return os.path.join((db_name or db.DB_NAME) + '.snapshots', f'user-{user_id}')
+
+def load_snapshot(user_id):
+    # Last saved history, memory-mapped and possibly behind the database; None if there is none
+    folder = snapshot_dir(user_id)
+    try:
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != SNAPSHOT_FORMAT or meta.get('schema') != db.SCHEMA_VERSION: return None
+        columns = {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in COLUMNS}
+    except (OSError, ValueError):
+        return None
+    if any(len(column) != meta['rows'] for column in columns.values()): return None
+    history = UserHistory(user_id, (meta['version'], meta['categories'], columns))
+    history.saved_version = meta['version']
+    return history
+
+def save_snapshot(history, db_name=None):
+    # Written to a scratch folder and swapped in, so readers never see half a snapshot.
+    # Returns False if the old one couldn't be replaced (e.g. still mapped on Windows).
+    folder = snapshot_dir(history.user_id, db_name)
+    scratch, old = f"{folder}.tmp-{os.getpid()}", f"{folder}.old-{os.getpid()}"
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    for name in COLUMNS:
+        np.save(os.path.join(scratch, name + '.npy'), getattr(history, name))
+    # meta.json goes last: a folder without it is never loaded
+    with open(os.path.join(scratch, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'format': SNAPSHOT_FORMAT, 'schema': db.SCHEMA_VERSION, 'version': history.version, 'rows': len(history), 'categories': history.categories}, f)
+    try:
+        if os.path.exists(folder): os.replace(folder, old)
+        os.replace(scratch, folder)
+    except OSError:
+        shutil.rmtree(scratch, ignore_errors=True)
+        return False
+    shutil.rmtree(old, ignore_errors=True)
+    history.saved_version = history.version
+    # The snapshot and this process's history are the readers that catch up from here on
+    if (db_name or db.DB_NAME) == db.DB_NAME: db.prune_deleted_transactions(history.user_id, history.version)
+    return True
+
+def _open_history(user_id):
+    # The snapshot patched forward when it is usable, else a full load saved for next time.
+    # A snapshot ahead of the database, from another schema, or whose row count disagrees
+    # after patching, belongs to some other database file and is replaced.
+    history = load_snapshot(user_id)
+    if history is not None and db.get_schema_version() == db.SCHEMA_VERSION and history.version <= db.get_data_version(user_id):
+        history.Refresh()
+        if len(history) == db.count_transactions(user_id): return history
+    history = UserHistory(user_id)
+    save_snapshot(history)
+    return history
+
+def get_history(user_id):
+    # Shared, up-to-date history for the user in the current database
+    key = (db.DB_NAME, user_id)
+    with _lock:
+        history = _histories.get(key)
+        if history is None: history = _histories[key] = _open_history(user_id)
+        else: history.Refresh()
+        return history
+
+def history_if_loaded(user_id, on_ready=None):
+    # get_history() without the wait: the history if it is already loaded, else None while it
+    # loads on a thread of its own, so a cold load never holds up the caller's thread.
+    # on_ready() is called from that thread once it is loaded.
+    key = (db.DB_NAME, user_id)
+    if key in _histories: return get_history(user_id)
+    with _loading_lock:
+        if key not in _loading:
+            _loading[key] = threading.Thread(target=_load_history, args=(key, on_ready), name="financify-history", daemon=True)
+            _loading[key].start()
+    return None
+
+def _load_history(key, on_ready):
+    try: get_history(key[1])
+    finally:
+        with _loading_lock: del _loading[key]
+    if on_ready: on_ready()
+
+def project_run_rate(spent, month, year, budgets=None, today=None):
+    # Stand-in for UserHistory.ProjectMonth until the history is loaded, from this month's
+    # expense totals so far ({category: cents}, e.g. db.get_budget_state) at a plain run rate
+    budgets = budgets or {}
+    today = today or date.today()
+    days = calendar.monthrange(year, month)[1]
+    first_day = date(year, month, 1)
+    elapsed = min(max((today - first_day).days + 1, 0), days)
+    result = {}
+    for category in spent.keys() | budgets.keys():
+        so_far, budget = spent.get(category, 0), budgets.get(category, 0)
+        projected = round(so_far * days / elapsed) if elapsed else so_far
+        runs_out = None
+        if budget > 0 and so_far > 0 and elapsed and projected > budget:
+            day = min(max(-(-budget * elapsed // so_far) - 1, 0), days - 1)
+            runs_out = (first_day + timedelta(days=day)).isoformat()
+        if so_far or projected or budget:
+            result[category] = {'spent': so_far, 'projected': projected, 'exhausted_on': runs_out}
+    return result
+
+def save_snapshots():
+    # Saves the cached histories that moved on since their snapshot; runs at exit
+    with _lock:
+        for (db_name, _), history in _histories.items():
+            if history.version != history.saved_version: save_snapshot(history, db_name)
+
+atexit.register(save_snapshots)
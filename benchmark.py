@@ -0,0 +1,899 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import database as db
+import datagen
+import dateparse
+import exporter
+import instrumentation
+
+# Benchmarks run against a throwaway database, never against financify.db.
+# Usage: python benchmark.py refresh [--transactions 1000000]
+#        python benchmark.py plans      (exits non-zero if a query scans transactions)
+#        python benchmark.py import [--rows 200000] [--compare]
+#        python benchmark.py dates [--rows 200000]
+#        python benchmark.py ingest [--files 12 --rows 240000] [--workers 1 2 4 8]
+#        python benchmark.py export [--sizes 1000 100000 1000000]
+#        python benchmark.py listing [--transactions 1000000]
+#        python benchmark.py search [--transactions 200000]   (exits non-zero if a term finds other rows than LIKE)
+#        python benchmark.py charts     (needs matplotlib; renders headless with Agg)
+#        python benchmark.py startup [--max-first-window-ms 1500]   (needs wxPython and a display)
+#        python benchmark.py instrument [--transactions 100000] [--output stats.json]
+#        python benchmark.py server [--clients 1 4 16 64] [--threads 8]
+#        python benchmark.py stress [--writes 100000 --threads 8]   (exits non-zero on lost updates)
+#        python benchmark.py budgets [--transactions 100000]   (exits non-zero if the budget state drifts)
+#        python benchmark.py writes [--rows 100000 --threads 8]
+#        python benchmark.py suite [--sizes 10000 100000 1000000 10000000] [--output run.json] [--baseline base.json]
+
+CATEGORIES = ['Food', 'Transport', 'Rent', 'Utilities', 'Entertainment', 'Shopping', 'Health', 'Education', 'Groceries', 'Other']
+
+def build_database(path, n_transactions, seed=42):
+    # One user holding all n_transactions, spread over five years of realistic history
+    return datagen.generate(path, users=1, accounts=2, transactions=n_transactions, years=5, seed=seed)[0]
+
+def dashboard_refresh(user_id, pooled=True):
+    # The database calls behind DashboardPanel.RefreshData + ReportsPanel's chart.
+    # With pooled=False every call reconnects, like the old get_db_connection().
+    today = date.today()
+    calls = [
+        lambda: db.get_accounts(user_id),
+        lambda: db.get_dashboard_numbers(user_id, today.month, today.year),
+        lambda: db.get_expense_data_for_pie_chart(user_id, today.month, today.year),
+        lambda: db.get_category_budgets_with_spending(user_id, today.month, today.year),
+        lambda: db.get_monthly_comparison_data(user_id),
+    ]
+    for call in calls:
+        call()
+        if not pooled: db.close_connections()
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples)
+
+def bench_refresh(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        user_id = build_database(os.path.join(tmp, 'bench.db'), args.transactions)
+        print(f"built {args.transactions:,} transactions in {time.perf_counter() - start:.1f}s")
+        dashboard_refresh(user_id)  # warm the page cache
+        for label, pooled in (('per-call connections', False), ('pooled connections', True)):
+            median, best = time_ms(lambda: dashboard_refresh(user_id, pooled), args.repeat)
+            print(f"{label:<22} median {median:8.2f} ms   best {best:8.2f} ms")
+        db.close_connections()
+
+def capture_statements(fn):
+    # Every statement fn() runs on this thread's pooled connection, with parameters bound
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith(('SELECT', 'WITH'))]
+
+def plan_problems(statement, required):
+    # Full scans of transactions, or index searches whose constraint misses `required`
+    problems = []
+    for row in db.get_connection().execute("EXPLAIN QUERY PLAN " + statement).fetchall():
+        detail = row['detail']
+        if detail.startswith(('SCAN transactions', 'SCAN t ')) or detail == 'SCAN t':
+            problems.append(detail)
+        elif required and detail.startswith(('SEARCH transactions', 'SEARCH t ')) and required not in detail:
+            problems.append(detail)
+    return problems
+
+def bench_plans(args):
+    today = date.today()
+    start, end = (today - timedelta(days=90)).isoformat(), today.isoformat()
+    date_range = 'user_id=? AND date>? AND date<?'
+    checks = {
+        # The monthly numbers read monthly_category_totals; these only guard against a return to scanning transactions
+        'get_dashboard_numbers': (lambda uid: db.get_dashboard_numbers(uid, today.month, today.year), None),
+        'get_expense_data_for_pie_chart': (lambda uid: db.get_expense_data_for_pie_chart(uid, today.month, today.year), None),
+        'get_category_budgets_with_spending': (lambda uid: db.get_category_budgets_with_spending(uid, today.month, today.year), None),
+        'get_monthly_comparison_data': (lambda uid: db.get_monthly_comparison_data(uid), None),
+        'export_csv (date range)': (lambda uid: exporter.export_csv(uid, os.path.join(tmp, 'plans.csv'), start, end), date_range),
+        'get_transactions_page (date range)': (lambda uid: db.get_transactions_page(uid, after=next_key, start_date=start, end_date=end), date_range),
+        'get_transactions_page (next page)': (lambda uid: db.get_transactions_page(uid, after=next_key), 'user_id=? AND date<?'),
+        'get_transactions_by_filter': (lambda uid: db.get_transactions_by_filter(uid), None),
+        'get_recent_transactions': (lambda uid: db.get_recent_transactions(uid), None),
+        'get_balance_as_of': (lambda uid: db.get_balance_as_of(db.get_accounts(uid)[0]['account_id'], today.isoformat()), 'account_id=? AND date>? AND date<?'),
+        'get_running_balances': (lambda uid: db.get_running_balances(first_page), 'account_id=? AND date>? AND date<?'),
+    }
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'plans.db'), args.transactions)
+        first_page = db.get_transactions_page(user_id)  # fetched outside the capture
+        next_key = (first_page[-1]['date'], first_page[-1]['transaction_id'])
+        for name, (check, required) in checks.items():
+            problems = [(stmt, p) for stmt in capture_statements(lambda: check(user_id)) for p in plan_problems(stmt, required)]
+            print(f"{'FAIL' if problems else 'ok':<5} {name}")
+            for stmt, problem in problems:
+                print(f"      {problem}\n      in: {' '.join(stmt.split())}")
+            failures += bool(problems)
+        db.close_connections()
+    raise SystemExit(1 if failures else 0)
+
+def write_import_csv(path, n_rows, seed=7):
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=2 * 365)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['Date', 'Amount', 'Type', 'Category', 'Description'])
+        for i in range(n_rows):
+            day = first_day + timedelta(days=rng.randrange(730))
+            w.writerow([day.strftime('%d/%m/%Y'), f"{rng.uniform(1, 300):.2f}", rng.choice(['Expense'] * 9 + ['Income']),
+                        rng.choice(CATEGORIES), f"Statement line {i % (n_rows * 9 // 10 or 1)}"])
+
+def import_row_by_row(user_id, account_id, path):
+    # The pre-bulk OnImportCSV loop, kept here as the comparison baseline
+    with db.transaction() as conn, open(path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
+        for r in reader:
+            d_str = db.smart_date_parse(r['date'])
+            if not db.check_transaction_exists(user_id, d_str, abs(db.to_cents(r['amount'])), r.get('description', ''), conn):
+                t_type = r.get('type', 'Expense').capitalize()
+                if t_type not in ['Income', 'Expense']: t_type = 'Expense'
+                db.add_transaction(user_id, account_id, d_str, abs(db.to_cents(r['amount'])), t_type, r.get('category', 'Other'), r.get('description', ''), "", conn)
+
+def strptime_date(date_str):
+    # The smart_date_parse before dateparse.py: strptime with each format until one fits
+    for fmt in dateparse.FORMATS:
+        try: return datetime.strptime(date_str.strip(), fmt).strftime('%Y-%m-%d')
+        except ValueError: pass
+    return None
+
+def parse_file_strptime(path):
+    # The import parsing before dateparse.py: csv.DictReader and strptime on every row
+    parsed = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
+        for r in reader:
+            d_str = strptime_date(r.get('date') or '')
+            try: amt = abs(db.to_cents(r.get('amount') or ''))
+            except ValueError: continue
+            if d_str is None: continue
+            t_type = 'Income' if (r.get('type') or '').capitalize() == 'Income' else 'Expense'
+            parsed.append((d_str, amt if t_type == 'Income' else -amt, t_type, r.get('category') or 'Other', r.get('description') or ''))
+    return parsed
+
+def bench_dates(args):
+    # DD/MM/YYYY statement: the old parser misses three formats per row before it fits
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'statement.csv')
+        write_import_csv(path, args.rows)
+        with open(path, newline='', encoding='utf-8') as f:
+            column = [row[0] for row in itertools.islice(csv.reader(f), 1, None)]
+        fmt, ambiguous = dateparse.detect_format(column)
+        print(f"{args.rows:,} rows, {len(set(column)):,} distinct dates, detected {fmt}{' (ambiguous)' if ambiguous else ''}")
+        runs = [('strptime per row', lambda: [strptime_date(v) for v in column]),
+                ('compiled per row', lambda: [dateparse.parse_date(v, fmt) for v in column]),
+                ('DateParser.Parse', lambda: list(map(dateparse.DateParser(fmt).Parse, column))),
+                ('DateParser.ParseMany', lambda: dateparse.DateParser().ParseMany(column)),
+                ('file, strptime', lambda: parse_file_strptime(path)),
+                ('file, read_import_file', lambda: sum(len(parsed) for parsed, *_ in db.read_import_file(path)))]
+        baseline = {}
+        for label, fn in runs:
+            median, _ = time_ms(fn, args.repeat)
+            base = baseline.setdefault(label.split(',')[0] == 'file', median)
+            print(f"{label:<22} {median:9.1f} ms  {args.rows / median * 1000:12,.0f} rows/s  {base / median:6.1f}x")
+        new = [row for parsed, *_ in db.read_import_file(path) for row in parsed]
+        old = parse_file_strptime(path)
+        assert [row[1:] for row in new] == [row[1:] for row in old]
+        print(f"rows the old parser dated differently (DD/MM read as MM/DD): {sum(a[0] != b[0] for a, b in zip(new, old)):,}")
+
+def bench_import(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'import.csv')
+        write_import_csv(path, args.rows)
+        runs = [('bulk', None)] + ([('row by row', import_row_by_row)] if args.compare else [])
+        for label, legacy in runs:
+            user_id = build_database(os.path.join(tmp, f'{label}.db'), args.existing)
+            account_id = db.get_accounts(user_id)[0]['account_id']
+            start = time.perf_counter()
+            if legacy:
+                legacy(user_id, account_id, path)
+                print(f"{label:<11} {time.perf_counter() - start:8.2f} s")
+            else:
+                stats = db.import_transactions_csv(user_id, account_id, path)
+                print(f"{label:<11} {stats['seconds']:8.2f} s   {stats['rows_per_sec']:,} rows/s   "
+                      f"imported {stats['imported']:,}  duplicates {stats['duplicates']:,}  rejected {stats['rejected']:,}")
+            db.close_connections()
+
+def bench_ingest(args):
+    # Folder of statements: one file at a time vs the process pool at increasing worker counts
+    import ingest
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f'statement-{i:02d}.csv') for i in range(args.files)]
+        for i, path in enumerate(paths):
+            write_import_csv(path, args.rows // args.files, seed=i)
+        counts = args.workers or sorted({1, 2, 4, os.cpu_count() or 1})
+        for label in ['sequential'] + [f'{n} workers' for n in counts]:
+            user_id = build_database(os.path.join(tmp, f'{label}.db'), args.existing)
+            account_id = db.get_accounts(user_id)[0]['account_id']
+            start = time.perf_counter()
+            if label == 'sequential':
+                imported = sum(db.import_transactions_csv(user_id, account_id, path)['imported'] for path in paths)
+            else:
+                imported = ingest.ingest_files(user_id, account_id, paths, int(label.split()[0]))['imported']
+            seconds = time.perf_counter() - start
+            print(f"{label:<11} {seconds:8.2f} s   {round(args.rows / seconds):,} rows/s   imported {imported:,}")
+            db.close_connections()
+
+EXPORT_PROBE = r"""
+import json, resource, sys, time
+import database as db
+import exporter
+def peak_rss_kib():
+    # ru_maxrss survives fork+exec, so a child reports at least its parent's peak; on Linux
+    # VmHWM is the same high-water mark for this process image alone
+    try:
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+db.DB_NAME = sys.argv[1]
+export = {'csv': exporter.export_csv, 'html': exporter.export_html}[sys.argv[3]]
+base = peak_rss_kib()
+start = time.perf_counter()
+export(int(sys.argv[2]), sys.argv[4])
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'base_kib': base, 'peak_kib': peak_rss_kib()}))
+"""
+
+def bench_export(args):
+    # Each export runs in a fresh process, so its peak RSS is that export's alone;
+    # 'base' is the peak after the imports, before exporting. Pages of the database read through
+    # mmap count towards RSS, so large exports level off near mmap_size plus cache_size
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f'export{n}.db')
+            user_id = build_database(path, n)
+            db.close_connections()
+            for label, kind, name in (('csv', 'csv', 'out.csv'), ('csv.gz', 'csv', 'out.csv.gz'), ('html', 'html', 'out.html')):
+                out = os.path.join(tmp, name)
+                probe = subprocess.run([sys.executable, '-c', EXPORT_PROBE, path, str(user_id), kind, out],
+                                       cwd=here, check=True, capture_output=True, text=True).stdout
+                result = json.loads(probe.strip().splitlines()[-1])
+                print(f"{n:>10,} rows  {label:<7} {result['seconds']:7.2f} s   peak RSS {result['peak_kib'] / 1024:7.1f} MiB "
+                      f"(base {result['base_kib'] / 1024:5.1f})   file {os.path.getsize(out) / 1e6:8.1f} MB")
+
+def bench_listing(args):
+    # What the virtual transaction list costs: the row count, the first page, a page
+    # reached by scrolling, and a jump to the middle of the history
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'listing.db'), args.transactions)
+        size = 100
+        middle = args.transactions // 2
+        first = db.get_transactions_page(user_id, limit=size)
+        after = (first[-1]['date'], first[-1]['transaction_id'])
+        steps = {
+            'count': lambda: db.count_transactions(user_id),
+            'first page': lambda: db.get_transactions_page(user_id, limit=size),
+            'next page': lambda: db.get_transactions_page(user_id, after=after, limit=size),
+            'jump to middle': lambda: db.get_transactions_page(user_id, after=db.get_listing_key_at(user_id, "", middle), limit=size),
+            'full fetch (old)': lambda: db.get_transactions_by_filter(user_id),
+        }
+        for label, step in steps.items():
+            median, best = time_ms(step, args.repeat)
+            print(f"{label:<17} median {median:9.2f} ms   best {best:9.2f} ms")
+        db.close_connections()
+
+SEARCH_TERMS = ['unch', 'mart', 'DMART', 'k lun', 'Benchmark lunch', 'zomato', 'Credit Card', 'ecki', 'Food', 'fo', 'no such thing']
+
+def search_reference(user_id, term):
+    # The listing search's contract: LIKE '%term%' on description, category or account name
+    like = f"%{term}%"
+    with db.connection() as conn:
+        return [r[0] for r in conn.execute("""SELECT t.transaction_id FROM transactions t JOIN accounts a ON t.account_id = a.account_id
+                                              WHERE t.user_id = ? AND (t.category LIKE ? OR t.description LIKE ? OR a.account_name LIKE ?)
+                                              ORDER BY t.date DESC, t.transaction_id DESC""", (user_id, like, like, like))]
+
+def bench_search(args):
+    # The Reports search box: the trigram index must find exactly the rows LIKE '%term%' does
+    # (substrings, not just word prefixes); exits 1 if any term differs
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'search.db'), args.transactions)
+        account_id = db.get_accounts(user_id)[0]['account_id']
+        for description in ("Benchmark lunch", "DMart run", "Lunch at DMART"):
+            db.add_transaction(user_id, account_id, date.today().isoformat(), 10_000, 'Expense', 'Food', description, "")
+        for term in SEARCH_TERMS:
+            expected = search_reference(user_id, term)
+            found = [r['transaction_id'] for r in db.get_transactions_by_filter(user_id, term)]
+            ok = found == expected and db.count_transactions(user_id, term) == len(expected)
+            median, _ = time_ms(lambda: db.count_transactions(user_id, term), args.repeat)
+            like_ms, _ = time_ms(lambda: search_reference(user_id, term), args.repeat)
+            print(f"{'ok' if ok else 'FAIL':<5} {term!r:<18} {len(expected):8,} rows   count {median:8.2f} ms   LIKE {like_ms:8.2f} ms")
+            failures += not ok
+        db.close_connections()
+    raise SystemExit(1 if failures else 0)
+
+def bench_charts(args):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import charts
+
+    labels = CATEGORIES[:7] + ['Remaining']
+    colors = ['#3498DB', '#E74C3C', '#2ECC71', '#F1C40F', '#9B59B6', '#E67E22', '#1ABC9C', '#BDC3C7']
+    rng = random.Random(1)
+    datasets = [[rng.uniform(10, 500) for _ in labels] for _ in range(args.repeat + 1)]
+
+    def old_refresh(axes, figure, canvas, sizes):
+        # What DashboardPanel.RefreshData used to do on every refresh
+        axes.clear()
+        axes.set_title('Monthly Budget: ₹5000')
+        wedges, _, _ = axes.pie(sizes, labels=None, autopct=charts.pie_pct_label, startangle=90, colors=colors)
+        axes.legend(wedges, labels, title="Categories", loc="center left", bbox_to_anchor=(0.9, 0, 0.5, 1))
+        figure.tight_layout()
+        canvas.draw()
+
+    figure = Figure(figsize=(4, 3))
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    it = iter(datasets)
+    print(f"{'rebuild every time (old)':<28} median {time_ms(lambda: old_refresh(axes, figure, canvas, next(it)), args.repeat)[0]:8.2f} ms")
+
+    figure = Figure(figsize=(4, 3))
+    canvas = FigureCanvasAgg(figure)
+    pie = charts.PieChart(figure, canvas)
+    pie.Update(labels, datasets[0], colors, 'Monthly Budget: ₹5000')
+    print(f"{'unchanged data':<28} median {time_ms(lambda: pie.Update(labels, datasets[0], colors, 'Monthly Budget: ₹5000'), args.repeat)[0]:8.2f} ms")
+    it = iter(datasets[1:])
+    print(f"{'new sizes, same slices':<28} median {time_ms(lambda: pie.Update(labels, next(it), colors, 'Monthly Budget: ₹5000'), args.repeat)[0]:8.2f} ms")
+
+def bench_instrument(args):
+    # Cost of instrumentation on a dashboard refresh plus a listing page. "off" runs on plain
+    # sqlite3 connections, which is what the app uses unless FINANCIFY_INSTRUMENT is set.
+    def work():
+        dashboard_refresh(user_id)
+        db.get_transactions_page(user_id)
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'instrument.db'), args.transactions)
+        for label in ('off', 'on'):
+            db.close_connections()
+            if label == 'on': instrumentation.enable(slow_ms=args.slow_ms)
+            work()
+            median, best = time_ms(work, args.repeat)
+            print(f"instrumentation {label:<4} median {median:8.3f} ms   best {best:8.3f} ms")
+        snap = instrumentation.snapshot()
+        instrumentation.disable()
+        db.close_connections()
+    for s in snap['statements'][:5]:
+        print(f"{s['total_ms']:9.1f} ms total  {s['calls']:6} calls  p95 {s['p95_ms']:7.2f} ms  {s['sql'][:90]}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, indent=2)
+
+def bench_analytics(args):
+    # Multi-year trend aggregates: GROUP BY over transactions vs the columnar history, cold
+    # start from its snapshot, the budget projection, and keeping the history current after a write
+    import analytics
+    sql = {
+        'monthly': "SELECT substr(date, 1, 7), type, SUM(abs(amount)) FROM transactions WHERE user_id = ? GROUP BY 1, 2",
+        'category by month': "SELECT substr(date, 1, 7), category, SUM(abs(amount)) FROM transactions WHERE user_id = ? AND type = 'Expense' GROUP BY 1, 2",
+        'weekday': "SELECT strftime('%w', date), SUM(abs(amount)) FROM transactions WHERE user_id = ? AND type = 'Expense' GROUP BY 1",
+        'rolling 30 days': """SELECT date, SUM(SUM(abs(amount))) OVER (ORDER BY julianday(date) RANGE BETWEEN 29 PRECEDING AND CURRENT ROW)
+                              FROM transactions WHERE user_id = ? AND type = 'Expense' GROUP BY date""",
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'analytics.db'), args.transactions)
+        account_id = db.get_accounts(user_id)[0]['account_id']
+        conn = db.get_connection()
+        start = time.perf_counter()
+        history = analytics.UserHistory(user_id)
+        print(f"{'load history':<20} {(time.perf_counter() - start) * 1000:9.1f} ms   {len(history):,} rows, "
+              f"{sum(getattr(history, c).nbytes for c in analytics.COLUMNS) / 1e6:.1f} MB")
+        analytics.save_snapshot(history)
+        start = time.perf_counter()
+        snapshot = analytics.load_snapshot(user_id)
+        snapshot.MonthlyTotals()
+        print(f"{'snapshot + monthly':<20} {(time.perf_counter() - start) * 1000:9.1f} ms   cold start from the memory-mapped snapshot")
+        numpy_steps = {
+            'monthly': history.MonthlyTotals,
+            'category by month': history.CategoryByMonth,
+            'weekday': history.WeekdayTotals,
+            'rolling 30 days': history.RollingTotals,
+        }
+        for name, query in sql.items():
+            sql_ms = time_ms(lambda: conn.execute(query, (user_id,)).fetchall(), args.repeat)[0]
+            numpy_ms = time_ms(numpy_steps[name], args.repeat)[0]
+            print(f"{name:<20} GROUP BY {sql_ms:9.2f} ms   columnar {numpy_ms:7.2f} ms")
+        today = date.today()
+        budgets = {category: 500000 for category in history.categories}
+        print(f"{'budget projection':<20} {time_ms(lambda: history.ProjectMonth(today.month, today.year, budgets), args.repeat)[0]:9.2f} ms   "
+              f"{len(budgets)} categories")
+        def write_and_refresh():
+            db.add_transaction(user_id, account_id, date.today().isoformat(), 12345, 'Expense', 'Food', 'Benchmark', '')
+            history.Refresh()
+        print(f"{'add + Refresh()':<20} {time_ms(write_and_refresh, args.repeat)[0]:9.2f} ms")
+        print(f"{'Refresh() unchanged':<20} {time_ms(history.Refresh, args.repeat)[0]:9.2f} ms")
+        db.close_connections()
+
+def suite_steps(user_id, account_id, import_path):
+    # name -> (callable, repeat override or None). Every public database.py read the UI uses,
+    # plus the write paths. Writes clean up after themselves so a --data-dir database can be reused.
+    today = date.today()
+    added = []
+    def add():
+        ok, message, transaction_id = db.add_transaction(user_id, account_id, today.isoformat(), 25000, 'Expense', 'Food', 'Benchmark lunch', '')
+        if not ok: raise RuntimeError(message)
+        added.append(transaction_id)
+    def update():
+        ok, message = db.update_transaction(added[-1], user_id, {'date': today.isoformat(), 'amount': 27500, 'type': 'Expense', 'category': 'Food',
+                                                                  'description': 'Benchmark dinner', 'account_id': account_id})
+        if not ok: raise RuntimeError(message)
+    def delete():
+        db.delete_transaction(added.pop(), user_id)
+    def import_csv():
+        # Rolled back so the database is unchanged; the import joins this outer transaction
+        conn = db.get_connection()
+        conn.execute("BEGIN")
+        try: db.import_transactions_csv(user_id, account_id, import_path)
+        finally: conn.rollback()
+    return {
+        'get_accounts': (lambda: db.get_accounts(user_id), None),
+        'get_dashboard_numbers': (lambda: db.get_dashboard_numbers(user_id, today.month, today.year), None),
+        'get_expense_data_for_pie_chart': (lambda: db.get_expense_data_for_pie_chart(user_id, today.month, today.year), None),
+        'get_category_budgets_with_spending': (lambda: db.get_category_budgets_with_spending(user_id, today.month, today.year), None),
+        'get_monthly_comparison_data': (lambda: db.get_monthly_comparison_data(user_id), None),
+        'get_recent_transactions': (lambda: db.get_recent_transactions(user_id), None),
+        'count_transactions': (lambda: db.count_transactions(user_id), None),
+        'get_transactions_page': (lambda: db.get_transactions_page(user_id), None),
+        'get_transactions_page(search)': (lambda: db.get_transactions_page(user_id, "swiggy"), None),
+        'get_transactions_by_filter': (lambda: db.get_transactions_by_filter(user_id), 3),
+        'get_transactions_by_filter(search)': (lambda: db.get_transactions_by_filter(user_id, "swiggy"), 3),
+        'get_balance_as_of': (lambda: db.get_balance_as_of(account_id, (today - timedelta(days=400)).isoformat()), None),
+        'get_running_balances': (lambda: db.get_running_balances(db.get_transactions_page(user_id)), None),
+        'add_transaction': (add, None),
+        'update_transaction': (update, None),
+        'delete_transaction': (delete, None),
+        'set_category_budget': (lambda: db.set_category_budget(user_id, 'Food', 500000, today.month, today.year), None),
+        'import_transactions_csv': (import_csv, 3),
+    }
+
+def suite_database(args, n, tmp):
+    # Generated databases are expensive at 10M rows; --data-dir keeps them between runs
+    folder = args.data_dir or tmp
+    path = os.path.join(folder, f'suite-{n}-seed{args.seed}.db')
+    if os.path.exists(path):
+        db.close_connections()
+        db.DB_NAME = path
+        db.initialize_database()
+        user_id = db.get_users()[0]['user_id']
+    else:
+        start = time.perf_counter()
+        user_id = datagen.generate(path, users=args.users, accounts=2, transactions=n, years=args.years, seed=args.seed)[0]
+        print(f"generated {n:,} rows in {time.perf_counter() - start:.1f}s")
+    return user_id
+
+def compare_to_baseline(results, baseline, tolerance, min_delta_ms):
+    # Slower than the baseline by more than tolerance (relative) and min_delta_ms (absolute)
+    regressions = []
+    for size, steps in results['sizes'].items():
+        for name, now in steps.items():
+            before = baseline['sizes'].get(size, {}).get(name)
+            if not before: continue
+            change = now['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+            slower = change > tolerance and now['median_ms'] - before['median_ms'] > min_delta_ms
+            print(f"{'SLOWER' if slower else '':<7}{int(size):>11,}  {name:<36} {before['median_ms']:10.2f} -> {now['median_ms']:10.2f} ms  {change:+7.1%}")
+            if slower: regressions.append((size, name))
+    return regressions
+
+def bench_suite(args):
+    results = {'meta': {'python': sys.version.split()[0], 'sqlite': db.sqlite3.sqlite_version, 'platform': sys.platform,
+                        'seed': args.seed, 'users': args.users, 'repeat': args.repeat, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'sizes': {}}
+    if args.data_dir: os.makedirs(args.data_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        import_path = os.path.join(tmp, 'suite-import.csv')
+        write_import_csv(import_path, args.import_rows)
+        for n in args.sizes:
+            user_id = suite_database(args, n, tmp)
+            account_id = db.get_accounts(user_id)[0]['account_id']
+            timings = results['sizes'][str(n)] = {}
+            for name, (step, repeat) in suite_steps(user_id, account_id, import_path).items():
+                if name in args.skip: continue
+                median, best = time_ms(step, min(repeat or args.repeat, args.repeat))
+                timings[name] = {'median_ms': round(median, 3), 'min_ms': round(best, 3)}
+                print(f"{n:>11,}  {name:<36} median {median:10.2f} ms   best {best:10.2f} ms")
+            db.close_connections()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"REGRESSION: {len(regressions)} step(s) slower than {args.baseline}")
+            raise SystemExit(1)
+
+# Runs in a fresh interpreter per launch. Prints timings in ms as JSON.
+async def http_request(conn, method, path, body=None, token=None):
+    # One request on a keep-alive connection (reader, writer); returns (status, body bytes)
+    reader, writer = conn
+    data = json.dumps(body).encode() if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+    if token: head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + data)
+    await writer.drain()
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode('latin-1').split("\r\n")
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+    if headers.get('transfer-encoding') == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunks.append(await reader.readexactly(size + 2))
+            if not size: break
+        payload = b''.join(chunk[:-2] for chunk in chunks)
+    else:
+        payload = await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(lines[0].split(' ')[1]), payload
+
+async def load_client(port, username, deadline, latencies, errors, rng):
+    conn = await asyncio.open_connection('127.0.0.1', port, limit=1 << 20)
+    try:
+        status, body = await http_request(conn, 'POST', '/login', {'username': username, 'password': 'password'})
+        token = json.loads(body)['token']
+        today = date.today()
+        # (weight, name, method, path, body)
+        mix = [(30, 'dashboard', 'GET', f'/dashboard?month={today.month}&year={today.year}', None),
+               (30, 'page', 'GET', '/transactions?limit=100', None),
+               (15, 'budgets', 'GET', '/budgets', None),
+               (20, 'add', 'POST', '/transactions', None),
+               (3, 'search', 'GET', '/transactions?search=Swiggy&limit=100', None),
+               (2, 'stream month', 'GET', f'/export?start={(today - timedelta(days=30)).isoformat()}', None)]
+        weights = [m[0] for m in mix]
+        while time.perf_counter() < deadline:
+            _, name, method, path, body = rng.choices(mix, weights)[0]
+            if name == 'add':
+                body = {'date': today.isoformat(), 'amount': f"{rng.uniform(1, 500):.2f}", 'type': 'Expense',
+                        'category': rng.choice(CATEGORIES), 'description': f"load test {rng.random()}"}
+            start = time.perf_counter()
+            status, _ = await http_request(conn, method, path, body, token)
+            latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+            if status != 200: errors[name, status] = errors.get((name, status), 0) + 1
+    finally:
+        conn[1].close()
+
+def stress_writer(user_ids, accounts, writes, seed, failures, lock):
+    # Adds, edits and deletes against every user, so writers contend for the same accounts.
+    # Each writer only edits and deletes its own rows, so "Not found" is never expected.
+    rng = random.Random(seed)
+    mine = {user_id: [] for user_id in user_ids}
+    first_day = date.today() - timedelta(days=365)
+    def details(user_id):
+        return {'date': (first_day + timedelta(days=rng.randrange(365))).isoformat(), 'amount': rng.randint(100, 50_000),
+                'type': rng.choice(['Expense'] * 4 + ['Income']), 'category': rng.choice(CATEGORIES),
+                'description': f"stress {seed}", 'account_id': rng.choice(accounts[user_id])}
+    for _ in range(writes):
+        user_id = rng.choice(user_ids)
+        roll, ids = rng.random(), mine[user_id]
+        if roll < 0.7 or len(ids) < 10:
+            d = details(user_id)
+            ok, message, new_id = db.add_transaction(user_id, d['account_id'], d['date'], d['amount'], d['type'], d['category'], d['description'], "")
+            if ok: ids.append(new_id)
+        elif roll < 0.85:
+            ok, message = db.update_transaction(rng.choice(ids), user_id, details(user_id))
+        else:
+            ok, message = db.delete_transaction(ids.pop(rng.randrange(len(ids))), user_id)
+        if not ok:
+            with lock: failures[message] = failures.get(message, 0) + 1
+
+def consistency_problems():
+    # Balances, checkpoints and the monthly rollup against what the transactions say
+    problems = []
+    with db.connection() as conn:
+        for account_id, balance, total in conn.execute("""SELECT a.account_id, a.current_balance, COALESCE(SUM(t.amount), 0) FROM accounts a
+                                                          LEFT JOIN transactions t ON t.account_id = a.account_id
+                                                          GROUP BY a.account_id HAVING a.current_balance != COALESCE(SUM(t.amount), 0)"""):
+            problems.append(f"account {account_id}: balance {balance} != SUM(amount) {total}")
+        for account_id, year, month, balance, total in conn.execute("""SELECT c.account_id, c.year, c.month, c.balance,
+                   (SELECT COALESCE(SUM(amount), 0) FROM transactions t WHERE t.account_id = c.account_id AND t.date < printf('%04d-%02d-32', c.year, c.month))
+                   FROM balance_checkpoints c""").fetchall():
+            if balance != total: problems.append(f"account {account_id}: {year}-{month:02d} checkpoint {balance} != {total}")
+        rollup = conn.execute("SELECT * FROM monthly_category_totals ORDER BY 1, 2, 3, 4, 5").fetchall()
+    for (db_name, user_id, year, month) in list(db._budget_states):
+        if db_name != db.DB_NAME: continue
+        cached = sorted(tuple(r.values()) for r in db.get_budget_state(user_id, month, year))
+        if cached != sorted(tuple(r) for r in db.get_category_budgets_with_spending(user_id, month, year)):
+            problems.append(f"user {user_id}: {year}-{month:02d} budget state differs from get_category_budgets_with_spending")
+    db.rebuild_monthly_totals()
+    with db.connection() as conn:
+        if [tuple(r) for r in rollup] != [tuple(r) for r in conn.execute("SELECT * FROM monthly_category_totals ORDER BY 1, 2, 3, 4, 5")]:
+            problems.append("monthly_category_totals differs from a rebuild")
+    return problems
+
+def bench_stress(args):
+    # Concurrent writer threads (plus, optionally, a bulk import) against one database; exits 1
+    # if a write failed or balances no longer match the transactions
+    import threading
+    with tempfile.TemporaryDirectory() as tmp:
+        datagen.generate(os.path.join(tmp, 'stress.db'), users=args.users, accounts=3, transactions=args.existing, years=1)
+        user_ids = [u['user_id'] for u in db.get_users()]
+        accounts = {user_id: [a['account_id'] for a in db.get_accounts(user_id)] for user_id in user_ids}
+        failures, lock = {}, threading.Lock()
+        threads = [threading.Thread(target=stress_writer, args=(user_ids, accounts, args.writes // args.threads, i, failures, lock))
+                   for i in range(args.threads)]
+        if args.import_rows:
+            path = os.path.join(tmp, 'import.csv')
+            write_import_csv(path, args.import_rows)
+            threads.append(threading.Thread(target=db.import_transactions_csv, args=(user_ids[0], accounts[user_ids[0]][0], path)))
+        start = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        seconds = time.perf_counter() - start
+        writes = args.writes // args.threads * args.threads
+        print(f"{writes:,} writes from {args.threads} threads{' and an import' if args.import_rows else ''} in {seconds:.1f}s "
+              f"({writes / seconds:,.0f} writes/s)")
+        problems = [f"{n} writes failed: {message}" for message, n in failures.items()] + consistency_problems()
+        db.close_connections()
+    for problem in problems[:20]: print("  " + problem)
+    if problems: raise SystemExit(1)
+    print("balances, checkpoints and rollup consistent")
+
+def bench_budgets(args):
+    # The budget alert in DashboardPanel.OnSubmitTransaction: the budgets/rollup query vs the budget state
+    with tempfile.TemporaryDirectory() as tmp:
+        user_id = build_database(os.path.join(tmp, 'budgets.db'), args.transactions)
+        account_id = db.get_accounts(user_id)[0]['account_id']
+        today = date.today()
+        for category in CATEGORIES[:6]: db.set_category_budget(user_id, category, 500_000, today.month, today.year)
+        def query(category):
+            this_cat = next((r for r in db.get_category_budgets_with_spending(user_id, today.month, today.year) if r['category'] == category), None)
+            return (this_cat['budget'], this_cat['spent']) if this_cat else (0, 0)
+        def state(category):
+            return db.get_category_budget(user_id, category, today.month, today.year)
+        rng = random.Random(3)
+        for label, check in (('query', query), ('budget state', state)):
+            median, best = time_ms(lambda: check(rng.choice(CATEGORIES)), args.repeat)
+            print(f"alert check, {label:<13} median {median * 1000:8.1f} us   best {best * 1000:8.1f} us")
+        # Keep it busy: every submit updates the state in place
+        problems = []
+        for i in range(args.writes):
+            category = rng.choice(CATEGORIES)
+            if state(category) != query(category):
+                problems.append(f"{category} after {i:,} submits: budget state {state(category)} != query {query(category)}")
+                break
+            db.add_transaction(user_id, account_id, today.isoformat(), rng.randint(100, 10_000), 'Expense', category, "bench", "")
+            if i % 100 == 0: db.set_category_budget(user_id, category, rng.randint(1, 10) * 100_000, today.month, today.year)
+        problems += consistency_problems()
+        db.close_connections()
+    for problem in problems[:20]: print("  " + problem)
+    if problems: raise SystemExit(1)
+    print(f"budget state matches the query after {args.writes:,} submits")
+
+def bench_writes(args):
+    # add_transaction committing per row vs the group-commit WriteQueue, same producer threads
+    import threading
+    with tempfile.TemporaryDirectory() as tmp:
+        datagen.generate(os.path.join(tmp, 'writes.db'), users=2, accounts=2, transactions=args.existing, years=1)
+        targets = [(a['account_id'], u['user_id']) for u in db.get_users() for a in db.get_accounts(u['user_id'])]
+        first_day = date.today() - timedelta(days=365)
+        def rows(seed, n):
+            rng = random.Random(seed)
+            for _ in range(n):
+                account_id, user_id = rng.choice(targets)
+                yield (user_id, account_id, (first_day + timedelta(days=rng.randrange(365))).isoformat(), rng.randint(100, 50_000),
+                       rng.choice(['Expense', 'Income']), rng.choice(CATEGORIES), "feed", "")
+        write_queue = db.WriteQueue(args.batch_rows, args.batch_ms)
+        def per_row(seed, n):
+            for row in rows(seed, n): db.add_transaction(*row)
+        def queued(seed, n):
+            futures = [write_queue.AddTransaction(*row) for row in rows(seed, n)]
+            for future in futures: future.result()
+        for label, target, n in [('per-row commit', per_row, args.rows // 10), ('write queue', queued, args.rows)]:
+            threads = [threading.Thread(target=target, args=(i, n // args.threads)) for i in range(args.threads)]
+            start = time.perf_counter()
+            for t in threads: t.start()
+            for t in threads: t.join()
+            seconds = time.perf_counter() - start
+            print(f"{label:<15} {n // args.threads * args.threads:9,} rows  {seconds:6.2f} s  {n / seconds:9,.0f} inserts/s")
+        write_queue.Close()
+        problems = consistency_problems()
+        db.close_connections()
+    for problem in problems[:20]: print("  " + problem)
+    if problems: raise SystemExit(1)
+
+def bench_server(args):
+    # server.py in a subprocess on localhost, driven by N concurrent keep-alive clients
+    import socket
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'server.db')
+        datagen.generate(path, users=args.users, accounts=2, transactions=args.transactions, years=2)
+        usernames = [u['username'] for u in db.get_users()]
+        db.close_connections()
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = subprocess.Popen([sys.executable, 'server.py', '--db', path, '--port', str(port), '--threads', str(args.threads)],
+                                  cwd=here, stdout=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError: time.sleep(0.1)
+            print(f"{args.transactions:,} transactions, {args.users} users, {args.threads} database threads, {args.seconds}s per run")
+            for clients in args.clients:
+                latencies, errors = {}, {}
+                async def run():
+                    deadline = time.perf_counter() + args.seconds
+                    await asyncio.gather(*(load_client(port, usernames[i % len(usernames)], deadline, latencies, errors, random.Random(i))
+                                           for i in range(clients)))
+                start = time.perf_counter()
+                asyncio.run(run())
+                elapsed = time.perf_counter() - start
+                total = sum(len(v) for v in latencies.values())
+                print(f"\n{clients} clients: {total:,} requests, {total / elapsed:,.0f} req/s, "
+                      f"errors: {', '.join(f'{name} {status} x{n}' for (name, status), n in errors.items()) or 'none'}")
+                for name, samples in sorted(latencies.items()):
+                    samples.sort()
+                    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)]
+                    print(f"  {name:<13} {len(samples):7,}  p50 {pick(0.5):7.1f} ms  p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+STARTUP_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import wx
+import database as db
+import login
+t_import = time.perf_counter()
+db.DB_NAME = sys.argv[1]
+db.initialize_database()
+t_schema = time.perf_counter()
+app = wx.App(False)
+frame = login.LoginFrame()
+frame.Show()
+def shown():
+    t_window = time.perf_counter()
+    print(json.dumps({'import_ms': (t_import - t0) * 1000, 'schema_ms': (t_schema - t_import) * 1000,
+                      'first_window_ms': (t_window - t0) * 1000, 'plotting_loaded': 'matplotlib.figure' in sys.modules}))
+    frame.Destroy()
+wx.CallAfter(shown)
+app.MainLoop()
+"""
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        launch = [sys.executable, '-c', STARTUP_PROBE, path]
+        subprocess.run(launch, cwd=here, check=True, capture_output=True)  # creates the schema
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = subprocess.run(launch, cwd=here, check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            result['process_ms'] = (time.perf_counter() - start) * 1000
+            runs.append(result)
+    summary = {key: statistics.median(r[key] for r in runs) for key in ('import_ms', 'schema_ms', 'first_window_ms', 'process_ms')}
+    for key, value in summary.items():
+        print(f"{key:<16} median {value:8.1f} ms")
+    print(f"{'plotting loaded':<16} {'yes' if any(r['plotting_loaded'] for r in runs) else 'no'} when the login window appeared")
+    if summary['first_window_ms'] > args.max_first_window_ms:
+        print(f"REGRESSION: time to first window above {args.max_first_window_ms} ms")
+        raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Financify benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('refresh', help="dashboard refresh latency, per-call vs pooled connections")
+    p.add_argument('--transactions', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_refresh)
+    p = sub.add_parser('plans', help="EXPLAIN QUERY PLAN guard against full scans of transactions")
+    p.add_argument('--transactions', type=int, default=10_000)
+    p.set_defaults(func=bench_plans)
+    p = sub.add_parser('import', help="bulk CSV import throughput")
+    p.add_argument('--rows', type=int, default=200_000)
+    p.add_argument('--existing', type=int, default=100_000, help="transactions already in the database")
+    p.add_argument('--compare', action='store_true', help="also time the old row-by-row import")
+    p.set_defaults(func=bench_import)
+    p = sub.add_parser('dates', help="import date parsing: strptime per row vs the detected, memoized parser")
+    p.add_argument('--rows', type=int, default=200_000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_dates)
+    p = sub.add_parser('ingest', help="multi-file import: sequential vs the parser process pool")
+    p.add_argument('--files', type=int, default=12)
+    p.add_argument('--rows', type=int, default=240_000, help="total across the files")
+    p.add_argument('--existing', type=int, default=100_000, help="transactions already in the database")
+    p.add_argument('--workers', type=int, nargs='+', help="worker counts to try (default: 1, 2, 4 and one per core)")
+    p.set_defaults(func=bench_ingest)
+    p = sub.add_parser('export', help="streaming export time and peak RSS, one process per export")
+    p.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    p.set_defaults(func=bench_export)
+    p = sub.add_parser('listing', help="keyset-paginated listing vs fetching the whole history")
+    p.add_argument('--transactions', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_listing)
+    p = sub.add_parser('search', help="listing search: trigram index vs LIKE '%%term%%', same rows required")
+    p.add_argument('--transactions', type=int, default=200_000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_search)
+    p = sub.add_parser('charts', help="pie chart refresh: full rebuild vs persistent artists")
+    p.add_argument('--repeat', type=int, default=30)
+    p.set_defaults(func=bench_charts)
+    p = sub.add_parser('startup', help="import time and time to the login window, with a regression threshold")
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--max-first-window-ms', type=float, default=1500)
+    p.set_defaults(func=bench_startup)
+    p = sub.add_parser('instrument', help="query instrumentation overhead, and its per-statement report")
+    p.add_argument('--transactions', type=int, default=100_000)
+    p.add_argument('--repeat', type=int, default=200)
+    p.add_argument('--slow-ms', type=float, default=50)
+    p.add_argument('--output', help="write the instrumentation snapshot as JSON")
+    p.set_defaults(func=bench_instrument)
+    p = sub.add_parser('analytics', help="trend aggregates: GROUP BY queries vs the columnar history")
+    p.add_argument('--transactions', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_analytics)
+    p = sub.add_parser('server', help="load test server.py on localhost with concurrent clients")
+    p.add_argument('--transactions', type=int, default=200_000)
+    p.add_argument('--users', type=int, default=4, help="household members; clients log in round-robin")
+    p.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64])
+    p.add_argument('--threads', type=int, default=8, help="server database threads")
+    p.add_argument('--seconds', type=float, default=10)
+    p.set_defaults(func=bench_server)
+    p = sub.add_parser('stress', help="concurrent writers, then check balances equal SUM(amount); exits 1 on any failure")
+    p.add_argument('--writes', type=int, default=100_000)
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--users', type=int, default=2)
+    p.add_argument('--existing', type=int, default=20_000, help="transactions already in the database")
+    p.add_argument('--import-rows', type=int, default=20_000, help="rows bulk-imported while the writers run (0: none)")
+    p.set_defaults(func=bench_stress)
+    p = sub.add_parser('budgets', help="budget alert check: the budgets/rollup query vs the in-memory budget state")
+    p.add_argument('--transactions', type=int, default=100_000)
+    p.add_argument('--repeat', type=int, default=2000)
+    p.add_argument('--writes', type=int, default=2000, help="submits checked against the query afterwards")
+    p.set_defaults(func=bench_budgets)
+    p = sub.add_parser('writes', help="inserts/s: add_transaction per row vs the group-commit WriteQueue")
+    p.add_argument('--rows', type=int, default=100_000, help="rows through the queue; the per-row run does a tenth")
+    p.add_argument('--threads', type=int, default=8, help="producer threads")
+    p.add_argument('--existing', type=int, default=20_000)
+    p.add_argument('--batch-rows', type=int, default=db.WRITE_BATCH_ROWS)
+    p.add_argument('--batch-ms', type=float, default=db.WRITE_BATCH_MS)
+    p.set_defaults(func=bench_writes)
+    p = sub.add_parser('suite', help="time every public database.py call at several sizes, JSON output and baseline comparison")
+    p.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000])
+    p.add_argument('--users', type=int, default=1, help="users in the generated database; the first one is measured")
+    p.add_argument('--years', type=float, default=5)
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--repeat', type=int, default=9)
+    p.add_argument('--import-rows', type=int, default=5_000)
+    p.add_argument('--skip', nargs='+', default=[], metavar='STEP', help="step names to leave out")
+    p.add_argument('--data-dir', help="keep generated databases here and reuse them")
+    p.add_argument('--output', help="write the results as JSON (use as a later --baseline)")
+    p.add_argument('--baseline', help="results JSON to compare against; exits 1 on regressions")
+    p.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+    p.add_argument('--min-delta-ms', type=float, default=1.0, help="ignore slowdowns smaller than this")
+    p.set_defaults(func=bench_suite)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
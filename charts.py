@@ -0,0 +1,156 @@
+import math
+
+# Chart renderers that keep their matplotlib artists between refreshes.
+# Update() compares the new data with what is on screen and does the least work possible:
+#   'skipped'  - same data, nothing is drawn
+#   'blitted'  - same slices/bars, new sizes: existing artists are moved in place and only
+#                they are re-rendered over a cached background
+#   'drawn'    - artists moved in place, but something outside them changed (title, axis
+#                limits), so the figure is drawn once without being rebuilt
+#   'rebuilt'  - the set of slices/bars changed: axes cleared and recreated, as before
+# Works with any Agg-based canvas (FigureCanvasWxAgg in the app, FigureCanvasAgg headless).
+
+def pie_pct_label(pct):
+    return '%1.1f%%' % pct if pct > 5 else ''
+
+class _BlitChart:
+    def __init__(self, figure, canvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.axes = figure.add_subplot(111)
+        self.key = None
+        self.animated = []
+        self.background = None
+        canvas.mpl_connect('draw_event', self._OnDraw)
+
+    def _OnDraw(self, event):
+        # After every full draw (including resizes): remember the figure without the
+        # animated artists, then paint them on top
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._DrawAnimated()
+
+    def _DrawAnimated(self):
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    def _Blit(self):
+        if self.background is None:
+            self.canvas.draw()
+            return 'drawn'
+        self.canvas.restore_region(self.background)
+        self._DrawAnimated()
+        self.canvas.blit(self.figure.bbox)
+        return 'blitted'
+
+    def _Animate(self, artists):
+        self.animated = list(artists)
+        for artist in self.animated:
+            artist.set_animated(True)
+
+class PieChart(_BlitChart):
+    def __init__(self, figure, canvas, startangle=90, pctdistance=0.6):
+        super().__init__(figure, canvas)
+        self.startangle = startangle
+        self.pctdistance = pctdistance
+        self.labels = None
+        self.title = None
+        self.wedges = []
+        self.autotexts = []
+
+    def Update(self, labels, sizes, colors, title):
+        key = (tuple(labels), tuple(sizes), tuple(colors), title)
+        if key == self.key: return 'skipped'
+        self.key = key
+        if not self.wedges or tuple(labels) != self.labels or min(sizes) <= 0:
+            self._Rebuild(labels, sizes, colors, title)
+            return 'rebuilt'
+        self._MoveWedges(sizes, colors)
+        if title != self.title:
+            self.title = title
+            self.axes.set_title(title)
+            self.canvas.draw()
+            return 'drawn'
+        return self._Blit()
+
+    def _MoveWedges(self, sizes, colors):
+        # Same geometry as Axes.pie: counter-clockwise from startangle, labels at pctdistance
+        total = float(sum(sizes))
+        theta = self.startangle
+        for wedge, text, size, color in zip(self.wedges, self.autotexts, sizes, colors):
+            span = 360.0 * size / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + span)
+            wedge.set_facecolor(color)
+            mid = math.radians(theta + span / 2)
+            text.set_position((self.pctdistance * math.cos(mid), self.pctdistance * math.sin(mid)))
+            text.set_text(pie_pct_label(100.0 * size / total))
+            theta += span
+
+    def _Rebuild(self, labels, sizes, colors, title):
+        self.axes.clear()
+        self.labels, self.title = tuple(labels), title
+        self.axes.set_title(title)
+        if not sizes:
+            self.wedges, self.autotexts = [], []
+            self.axes.text(0.5, 0.5, 'No Data', ha='center', va='center')
+        else:
+            self.wedges, _, self.autotexts = self.axes.pie(sizes, labels=None, autopct=pie_pct_label, startangle=self.startangle,
+                                                           pctdistance=self.pctdistance, colors=colors)
+            self.axes.legend(self.wedges, labels, title="Categories", loc="center left", bbox_to_anchor=(0.9, 0, 0.5, 1))
+        self._Animate(self.wedges + self.autotexts)
+        self.figure.tight_layout()
+        self.canvas.draw()
+
+class BarChart(_BlitChart):
+    # Grouped bars, one group per label, one series per entry in `series`
+    def __init__(self, figure, canvas, series, colors, title, ylabel, width=0.35):
+        super().__init__(figure, canvas)
+        self.series = series
+        self.colors = colors
+        self.title = title
+        self.ylabel = ylabel
+        self.width = width
+        self.labels = None
+        self.bars = []
+
+    def Update(self, labels, values):
+        # values: one list per series, aligned with labels
+        key = (tuple(labels), tuple(tuple(v) for v in values))
+        if key == self.key: return 'skipped'
+        self.key = key
+        if not self.bars or tuple(labels) != self.labels:
+            self._Rebuild(labels, values)
+            return 'rebuilt'
+        for bars, series_values in zip(self.bars, values):
+            for bar, value in zip(bars, series_values):
+                bar.set_height(value)
+        # Rescale only when the tallest bar no longer fits or would look tiny
+        top = max([max(v) for v in values if v] + [0])
+        ylim_top = self.axes.get_ylim()[1]
+        if top > ylim_top or top < ylim_top * 0.5:
+            self.axes.relim()
+            self.axes.autoscale_view()
+            self.canvas.draw()
+            return 'drawn'
+        return self._Blit()
+
+    def _Rebuild(self, labels, values):
+        self.axes.clear()
+        self.labels = tuple(labels)
+        self.bars = []
+        if not labels:
+            self.axes.text(0.5, 0.5, 'No Data Available', ha='center')
+        else:
+            n = len(self.series)
+            x = list(range(len(labels)))
+            for i, (name, color, series_values) in enumerate(zip(self.series, self.colors, values)):
+                offset = (i - (n - 1) / 2) * self.width
+                self.bars.append(list(self.axes.bar([p + offset for p in x], series_values, self.width, label=name, color=color)))
+            self.axes.set_ylabel(self.ylabel)
+            self.axes.set_title(self.title)
+            self.axes.set_xticks(x)
+            self.axes.set_xticklabels(labels)
+            self.axes.legend()
+            self.figure.autofmt_xdate()
+        self._Animate([bar for bars in self.bars for bar in bars])
+        self.canvas.draw()
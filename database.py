@@ -1,18 +1,140 @@
+import atexit
 import sqlite3
 import hashlib
+import csv
+import itertools
 import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import dateparse
 
 # --- CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_NAME = os.path.join(BASE_DIR, 'financify.db')
 SECRET_SALT = "s0m3_r4nd0m_s4lt_v4lu3" 
+# Stored in PRAGMA user_version once initialize_database has brought the schema up to date.
+# Bump it whenever initialize_database gains new schema work.
+SCHEMA_VERSION = 6
+IMPORT_CHUNK_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+MIGRATION_CHUNK_SIZE = 50000
+WRITE_BATCH_ROWS = 1000  # group commit: rows per transaction...
+WRITE_BATCH_MS = 5       # ...or the longest a queued row waits for company
+
+# --- CONNECTION MANAGEMENT ---
+# Connections are long-lived and pooled per (thread, database file). The session
+# PRAGMAs below are applied once when a connection is opened, and sqlite3 keeps
+# up to STATEMENT_CACHE_SIZE prepared statements per connection for reuse.
+SESSION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+STATEMENT_CACHE_SIZE = 256
+# Writers take the write lock up front (BEGIN IMMEDIATE) and queue for it for up to
+# BUSY_TIMEOUT_MS, rather than failing on a read-to-write upgrade half way through. If the lock
+# is still taken after that, BEGIN is retried WRITE_RETRIES times, backing off from RETRY_BACKOFF
+# seconds (doubling, with jitter), before "database is locked" reaches the caller.
+BUSY_TIMEOUT_MS = 5000
+WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.05
+# Connection class for new pooled connections; instrumentation.enable() swaps in a timing subclass
+CONNECTION_FACTORY = sqlite3.Connection
+
+# Each thread keeps its own {db path: connection}; _pool maps every open one to the finalizer that
+# closes it when the owning thread ends, so close_connections() can still reach them all
+class _ThreadConnections(dict):
+    pass
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+_local = threading.local()
+_pool = {}
+_pool_lock = threading.Lock()
+
+def _open_connection(path):
+    # isolation_level=None: no implicit BEGINs, transactions are opened by transaction()
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE, factory=CONNECTION_FACTORY)
     conn.row_factory = sqlite3.Row
+    for pragma in SESSION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_connection():
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = _ThreadConnections()
+    conn = conns.get(DB_NAME)
+    if conn is None:
+        conn = conns[DB_NAME] = _open_connection(DB_NAME)
+        finalizer = weakref.finalize(conns, _release_connection, conn)
+        finalizer.atexit = False  # at exit the connection is still in use, e.g. by atexit handlers
+        with _pool_lock: _pool[conn] = finalizer
     return conn
 
+def _release_connection(conn):
+    with _pool_lock: _pool.pop(conn, None)
+    conn.close()
+
+def close_connections():
+    with _pool_lock:
+        owned = list(_pool.items())
+        _pool.clear()
+    for conn, finalizer in owned:
+        alive = finalizer.detach()
+        if alive is not None:
+            conns = alive[0]
+            for path in [path for path, c in conns.items() if c is conn]:
+                del conns[path]
+        conn.close()
+
+@contextmanager
+def connection():
+    yield get_connection()
+
+def _begin_write(conn):
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == WRITE_RETRIES or 'locked' not in str(e): raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+@contextmanager
+def transaction(conn=None, write=True):
+    # write=False opens a plain deferred transaction: one consistent snapshot for several reads,
+    # without holding up writers
+    conn = conn if conn is not None else get_connection()
+    if conn.in_transaction:
+        # Join the caller's transaction; it decides whether to commit.
+        yield conn
+        return
+    if write: _begin_write(conn)
+    else: conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        _budget_pending.pop(conn, None)
+        conn.rollback()
+        raise
+    try: conn.commit()
+    except BaseException:
+        _budget_pending.pop(conn, None)
+        raise
+    _commit_budget_changes(conn)
+
 def hash_data(data):
     salted = data + SECRET_SALT
     return hashlib.sha256(salted.encode()).hexdigest()
@@ -20,56 +142,297 @@ def hash_data(data):
 def verify_hash(stored_hash, provided_data):
     return stored_hash == hash_data(provided_data)
 
-def initialize_database():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Updated Users Table with Security Question
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            security_hash TEXT NOT NULL
-        )
-    ''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS accounts (
-        account_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        account_name TEXT NOT NULL,
-        account_type TEXT,
-        current_balance REAL DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-    )''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS transactions (
-        transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        account_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        amount REAL NOT NULL,
-        type TEXT NOT NULL,
-        category TEXT NOT NULL,
-        description TEXT,
-        tags TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-        FOREIGN KEY (account_id) REFERENCES accounts(account_id)
-    )''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS budgets (
-        budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        category TEXT NOT NULL,
-        amount REAL NOT NULL,
-        month INTEGER NOT NULL,
-        year INTEGER NOT NULL,
-        UNIQUE(user_id, category, month, year),
-        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-    )''')
-    
-    conn.commit()
-    conn.close()
+# Tables holding money, created with integer minor-unit columns. Templates, so the
+# cents migration can build the new copies next to the old ones.
+MONEY_TABLES = {
+    'accounts': '''CREATE TABLE IF NOT EXISTS {name} (
+            account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_name TEXT NOT NULL,
+            account_type TEXT,
+            current_balance INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )''',
+    'transactions': '''CREATE TABLE IF NOT EXISTS {name} (
+            transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            tags TEXT,
+            row_version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (account_id) REFERENCES accounts(account_id)
+        )''',
+    'budgets': '''CREATE TABLE IF NOT EXISTS {name} (
+            budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            UNIQUE(user_id, category, month, year),
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )''',
+}
+ROLLUP_TABLE = '''CREATE TABLE IF NOT EXISTS {name} (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, year, month, type, category)
+        ) WITHOUT ROWID'''
+TRANSACTION_INDEXES = (
+    # Covering index for the monthly aggregates (dashboard, pie chart, budgets, trend)
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_type_date ON transactions (user_id, type, date, category, amount)",
+    # Listing order used by the reports list and recent transactions
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date DESC, transaction_id DESC)",
+    # One account's rows in date order, for balances as of a date and running balances
+    "CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, date, transaction_id, amount)",
+    # Rows written since a data version, for get_changes_since
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_version ON transactions (user_id, row_version)",
+)
+
+def initialize_database(progress=None):
+    # Launches against an up-to-date database stop at this one PRAGMA read
+    conn = get_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    if _money_is_real(conn):
+        migrate_money_to_cents(progress)
+    with transaction(conn):
+        cursor = conn.cursor()
+        
+        # Updated Users Table with Security Question
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                security_hash TEXT NOT NULL
+            )
+        ''')
+        
+        for name, ddl in MONEY_TABLES.items():
+            cursor.execute(ddl.format(name=name))
+        if 'row_version' not in _columns(conn, 'transactions'):
+            cursor.execute("ALTER TABLE transactions ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+
+        for ddl in TRANSACTION_INDEXES:
+            cursor.execute(ddl)
+
+        # Per-month, per-category sums kept exact by the transaction write functions.
+        # total is SUM(abs(amount)), like the dashboard figures.
+        rollup_exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_category_totals'").fetchone()
+        cursor.execute(ROLLUP_TABLE.format(name='monthly_category_totals'))
+        if not rollup_exists:
+            rebuild_monthly_totals(conn=conn)
+
+        # Closing balance of each account at the end of every month it has transactions in
+        checkpoints_exist = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='balance_checkpoints'").fetchone()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS balance_checkpoints (
+            account_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            balance INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, year, month)
+        ) WITHOUT ROWID''')
+        if not checkpoints_exist:
+            rebuild_balance_checkpoints(conn=conn)
+
+        # Bumped by every write that changes what a user sees, so the UI can tell
+        # whether a panel is out of date without re-running its queries
+        # pruned_version: tombstones up to it are gone, see prune_deleted_transactions
+        cursor.execute('''CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            pruned_version INTEGER NOT NULL DEFAULT 0
+        )''')
+        if 'pruned_version' not in _columns(conn, 'data_versions'):
+            cursor.execute("ALTER TABLE data_versions ADD COLUMN pruned_version INTEGER NOT NULL DEFAULT 0")
+        # Every transaction row carries the data version that last wrote it (row_version),
+        # and deletes leave a tombstone here, so readers can catch up with get_changes_since
+        cursor.execute('''CREATE TABLE IF NOT EXISTS deleted_transactions (
+            transaction_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, version, transaction_id)
+        ) WITHOUT ROWID''')
+
+        _create_search_index(conn)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def get_schema_version():
+    with connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _create_search_index(conn):
+    # Trigram full-text index over description, category and account name, keyed by
+    # transaction_id and kept in sync by triggers. Trigrams match any substring, like the
+    # LIKE '%term%' search they replace. Skipped when SQLite lacks FTS5 or the trigram
+    # tokenizer (before 3.34), in which case searches fall back to LIKE.
+    existing = conn.execute("SELECT sql FROM sqlite_master WHERE name='transactions_fts'").fetchone()
+    if existing and 'trigram' in existing[0]:
+        return
+    if existing:
+        # Word-prefix index from schema version 4
+        for name in SEARCH_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP TABLE transactions_fts")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE transactions_fts USING fts5(description, category, account_name, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    _create_search_triggers(conn)
+    conn.execute('''INSERT INTO transactions_fts (rowid, description, category, account_name)
+                    SELECT t.transaction_id, t.description, t.category, a.account_name
+                    FROM transactions t LEFT JOIN accounts a ON t.account_id = a.account_id''')
+
+SEARCH_TRIGGERS = ('transactions_fts_insert', 'transactions_fts_delete', 'transactions_fts_update', 'accounts_fts_rename')
+
+def _create_search_triggers(conn):
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, description, category, account_name)
+        VALUES (new.transaction_id, new.description, new.category, (SELECT account_name FROM accounts WHERE account_id = new.account_id));
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+        DELETE FROM transactions_fts WHERE rowid = old.transaction_id;
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description, category, account_id ON transactions BEGIN
+        DELETE FROM transactions_fts WHERE rowid = old.transaction_id;
+        INSERT INTO transactions_fts (rowid, description, category, account_name)
+        VALUES (new.transaction_id, new.description, new.category, (SELECT account_name FROM accounts WHERE account_id = new.account_id));
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS accounts_fts_rename AFTER UPDATE OF account_name ON accounts BEGIN
+        UPDATE transactions_fts SET account_name = new.account_name
+        WHERE rowid IN (SELECT transaction_id FROM transactions WHERE account_id = new.account_id);
+    END''')
+
+@contextmanager
+def suspended_search_index(conn):
+    # For bulk loads: drop the FTS table and its triggers, then rebuild it in one pass at the end
+    # instead of updating it row by row. Must run inside the caller's transaction.
+    for name in SEARCH_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS transactions_fts")
+    yield conn
+    _create_search_index(conn)
+
+# --- CENTS MIGRATION ---
+# Databases from before schema version 2 hold money as REAL major units. transactions is
+# copied into an INTEGER-cents table MIGRATION_CHUNK_SIZE rows at a time, each chunk in its
+# own short transaction, so other connections keep working in between; triggers on the old
+# table mirror their writes into the copy. The position is kept in migration_state, so an
+# interrupted migration resumes where it stopped. One final transaction swaps the copy in
+# and converts the small tables (accounts, budgets, monthly_category_totals).
+MIGRATION_TRIGGERS = ('transactions_cents_insert', 'transactions_cents_update', 'transactions_cents_delete')
+
+def _money_is_real(conn):
+    return any(c['name'] == 'amount' and c['type'].upper() == 'REAL' for c in conn.execute("PRAGMA table_info(transactions)"))
+
+def _columns(conn, table):
+    return [c['name'] for c in conn.execute(f"PRAGMA table_info({table})")]
+
+def _copy_select(columns, money_columns, prefix=""):
+    # Column list for copying rows across, with money converted to cents
+    return ", ".join(f"CAST(round({prefix}{c} * 100) AS INTEGER)" if c in money_columns else prefix + c for c in columns)
+
+def _swap_table(conn, table, ddl, money_columns):
+    # Rebuilds a small table with integer money columns, keeping its AUTOINCREMENT position
+    columns = ", ".join(_columns(conn, table))
+    conn.execute(ddl.format(name=table + "_cents"))
+    conn.execute(f"INSERT INTO {table}_cents ({columns}) SELECT {_copy_select(_columns(conn, table), money_columns)} FROM {table}")
+    _replace_table(conn, table)
+
+def _replace_table(conn, table):
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_cents RENAME TO {table}")
+    if seq: conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (seq[0], table))
+
+def migrate_money_to_cents(progress=None, chunk_size=MIGRATION_CHUNK_SIZE):
+    # progress(rows_copied, fraction) is called after every chunk
+    conn = get_connection()
+    columns = _columns(conn, 'transactions')
+    names = ", ".join(columns)
+    with transaction(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS migration_state (name TEXT PRIMARY KEY, position INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO migration_state (name, position) VALUES ('cents', 0)")
+        conn.execute(MONEY_TABLES['transactions'].format(name='transactions_cents'))
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS transactions_cents_insert AFTER INSERT ON transactions BEGIN
+            INSERT OR REPLACE INTO transactions_cents ({names}) VALUES ({_copy_select(columns, ('amount',), 'new.')});
+        END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS transactions_cents_update AFTER UPDATE ON transactions BEGIN
+            DELETE FROM transactions_cents WHERE transaction_id = old.transaction_id;
+            INSERT OR REPLACE INTO transactions_cents ({names}) VALUES ({_copy_select(columns, ('amount',), 'new.')});
+        END""")
+        conn.execute("""CREATE TRIGGER IF NOT EXISTS transactions_cents_delete AFTER DELETE ON transactions BEGIN
+            DELETE FROM transactions_cents WHERE transaction_id = old.transaction_id;
+        END""")
+
+    last_id = conn.execute("SELECT max(transaction_id) FROM transactions").fetchone()[0] or 0
+    copied = 0
+    while True:
+        with transaction(conn):
+            position = conn.execute("SELECT position FROM migration_state WHERE name = 'cents'").fetchone()[0]
+            upto = conn.execute("SELECT max(transaction_id) FROM (SELECT transaction_id FROM transactions WHERE transaction_id > ? ORDER BY transaction_id LIMIT ?)",
+                                (position, chunk_size)).fetchone()[0]
+            if upto is None: break
+            copied += conn.execute(f"INSERT OR REPLACE INTO transactions_cents ({names}) SELECT {_copy_select(columns, ('amount',))} FROM transactions "
+                                   "WHERE transaction_id > ? AND transaction_id <= ?", (position, upto)).rowcount
+            conn.execute("UPDATE migration_state SET position = ? WHERE name = 'cents'", (upto,))
+        if progress: progress(copied, min(upto / last_id, 1.0) if last_id else 1.0)
+
+    with transaction(conn):
+        # Triggers referring to the tables being replaced would block the renames
+        for name in MIGRATION_TRIGGERS + SEARCH_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        _replace_table(conn, 'transactions')
+        for ddl in TRANSACTION_INDEXES:
+            conn.execute(ddl)
+        _swap_table(conn, 'accounts', MONEY_TABLES['accounts'], ('current_balance',))
+        _swap_table(conn, 'budgets', MONEY_TABLES['budgets'], ('amount',))
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_category_totals'").fetchone():
+            _swap_table(conn, 'monthly_category_totals', ROLLUP_TABLE, ('total',))
+        if _search_enabled(conn): _create_search_triggers(conn)
+        conn.execute("DELETE FROM migration_state WHERE name = 'cents'")
+    if progress: progress(copied, 1.0)
+
+# --- MONEY ---
+# Money is stored and passed around as integer minor units (paise). Conversion happens
+# only where people and files are involved: to_cents() when reading input, and
+# format_money() / from_cents() for display, CSV and JSON.
+def to_cents(value):
+    # Major units (str, int, float or Decimal) to exact integer cents, half-up
+    if isinstance(value, int) and not isinstance(value, bool): return value * 100
+    text = str(value).strip().replace(',', '')
+    negative = text[:1] == '-'
+    whole, dot, frac = (text[1:] if text[:1] in '+-' else text).partition('.')
+    if whole.isdigit() and (not dot or (frac.isdigit() and len(frac) <= 2)):
+        cents = int(whole) * 100 + (int(frac.ljust(2, '0')) if dot else 0)
+        return -cents if negative else cents
+    try: major = Decimal(text)
+    except InvalidOperation: raise ValueError(f"Invalid amount: {value!r}")
+    if not major.is_finite(): raise ValueError(f"Invalid amount: {value!r}")
+    return int((major * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    return cents / 100
+
+def format_money(cents):
+    # 123456 -> "1234.56", -5 -> "-0.05"
+    return f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def _require_cents(amount):
+    if isinstance(amount, bool) or not isinstance(amount, int):
+        raise ValueError("Amounts are integer cents; convert with to_cents()")
+    return amount
 
 # --- USER FUNCTIONS ---
 
@@ -79,102 +442,299 @@ def register_user(username, password, security_ans):
     if len(password) < 4:
         return False, "Password too short (min 4)"
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        p_hash = hash_data(password)
-        s_hash = hash_data(security_ans.lower().strip()) 
-        
-        cursor.execute("INSERT INTO users (username, password_hash, security_hash) VALUES (?, ?, ?)", 
-                       (username, p_hash, s_hash))
-        new_id = cursor.lastrowid
-        
-        cursor.execute("INSERT INTO accounts (user_id, account_name, account_type, current_balance) VALUES (?, ?, ?, ?)", 
-                       (new_id, 'Checking', 'Checking', 0))
-        conn.commit()
+        with transaction() as conn:
+            p_hash = hash_data(password)
+            s_hash = hash_data(security_ans.lower().strip()) 
+            
+            cursor = conn.execute("INSERT INTO users (username, password_hash, security_hash) VALUES (?, ?, ?)", 
+                                  (username, p_hash, s_hash))
+            new_id = cursor.lastrowid
+            
+            conn.execute("INSERT INTO accounts (user_id, account_name, account_type, current_balance) VALUES (?, ?, ?, ?)", 
+                         (new_id, 'Checking', 'Checking', 0))
         return True, "Success"
     except sqlite3.IntegrityError:
         return False, "Username taken"
     except sqlite3.OperationalError:
         return False, "Database Error: Please delete 'financify.db' and restart."
-    finally:
-        conn.close()
 
 def login_user(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT user_id, password_hash FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        with connection() as conn:
+            user = conn.execute("SELECT user_id, password_hash FROM users WHERE username = ?", (username,)).fetchone()
     except:
-        conn.close()
         return False, "DB Error. Delete financify.db", None
-        
-    conn.close()
     
     if user and verify_hash(user['password_hash'], password):
         return True, "Success", user['user_id']
     return False, "Invalid credentials", None
 
 def get_username(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT username FROM users WHERE user_id = ?", (user_id,))
-        res = cursor.fetchone()
-        conn.close()
+        with connection() as conn:
+            res = conn.execute("SELECT username FROM users WHERE user_id = ?", (user_id,)).fetchone()
         return res['username'] if res else "User"
     except: return "User"
 
+def get_users(usernames=None):
+    # All users, or only the named ones, as (user_id, username) rows
+    with connection() as conn:
+        if usernames is None:
+            return conn.execute("SELECT user_id, username FROM users ORDER BY user_id").fetchall()
+        marks = ",".join("?" * len(usernames))
+        return conn.execute(f"SELECT user_id, username FROM users WHERE username IN ({marks}) ORDER BY user_id", list(usernames)).fetchall()
+
 def verify_security_answer(username, answer):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT security_hash FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        user = conn.execute("SELECT security_hash FROM users WHERE username = ?", (username,)).fetchone()
     
     if not user: return False
     return verify_hash(user['security_hash'], answer.lower().strip())
 
 def reset_password(username, new_password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        new_hash = hash_data(new_password)
-        cursor.execute("UPDATE users SET password_hash = ? WHERE username = ?", (new_hash, username))
-        conn.commit()
+        with transaction() as conn:
+            new_hash = hash_data(new_password)
+            conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (new_hash, username))
         return True
     except:
         return False
-    finally:
-        conn.close()
 
 # --- HELPER FUNCTIONS ---
 def check_and_create_default_account(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM accounts WHERE user_id = ?", (user_id,))
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO accounts (user_id, account_name, account_type, current_balance) VALUES (?, ?, ?, ?)", (user_id, 'Checking', 'Checking', 0))
-        conn.commit()
-    conn.close()
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM accounts WHERE user_id = ?", (user_id,)).fetchone():
+            conn.execute("INSERT INTO accounts (user_id, account_name, account_type, current_balance) VALUES (?, ?, ?, ?)", (user_id, 'Checking', 'Checking', 0))
+            _bump_version(conn, user_id)
 
 def get_accounts(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT account_id, account_name, current_balance FROM accounts WHERE user_id = ?", (user_id,))
-    data = cursor.fetchall()
-    conn.close()
-    return data
+    with connection() as conn:
+        return conn.execute("SELECT account_id, account_name, current_balance FROM accounts WHERE user_id = ?", (user_id,)).fetchall()
 
 def wipe_user_data(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
-    cursor.execute("UPDATE accounts SET current_balance = 0 WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        # No tombstone per row: readers from before the wipe start over (from nothing)
+        version = _bump_version(conn, user_id)
+        conn.execute("DELETE FROM deleted_transactions WHERE user_id = ?", (user_id,))
+        conn.execute("UPDATE data_versions SET pruned_version = ? WHERE user_id = ?", (version, user_id))
+        conn.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM monthly_category_totals WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM balance_checkpoints WHERE account_id IN (SELECT account_id FROM accounts WHERE user_id = ?)", (user_id,))
+        conn.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
+        conn.execute("UPDATE accounts SET current_balance = 0 WHERE user_id = ?", (user_id,))
+        _record_budget_change(conn, 'reset', user_id)
+
+# --- DATA VERSIONS ---
+def _bump_version(conn, user_id):
+    conn.execute("INSERT INTO data_versions (user_id, version) VALUES (?, 1) ON CONFLICT (user_id) DO UPDATE SET version = version + 1", (user_id,))
+    version = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()[0]
+    _record_budget_change(conn, 'version', user_id, version)
+    return version
+
+def _next_version(conn, user_id):
+    # The version _bump_version will return next in this transaction
+    row = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return (row[0] if row else 0) + 1
+
+def get_data_version(user_id):
+    with connection() as conn:
+        row = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+CHANGE_COLUMNS = "transaction_id, account_id, date, amount, type, category"
+
+def get_changes_since(user_id, version=None):
+    # (current version, rows written after `version`, transaction_ids deleted after it), read
+    # from one snapshot. Deleted is None when rows are every row instead: for version=None (a
+    # first load), or a version older than the tombstones still kept, which has to start over.
+    with transaction(write=False) as conn:
+        current = conn.execute("SELECT version, pruned_version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+        if version is None or (current and version < current[1]):
+            rows = conn.execute(f"SELECT {CHANGE_COLUMNS} FROM transactions WHERE user_id = ?", (user_id,)).fetchall()
+            deleted = None
+        else:
+            rows = conn.execute(f"SELECT {CHANGE_COLUMNS} FROM transactions WHERE user_id = ? AND row_version > ?", (user_id, version)).fetchall()
+            deleted = [r[0] for r in conn.execute("SELECT transaction_id FROM deleted_transactions WHERE user_id = ? AND version > ?", (user_id, version))]
+    return (current[0] if current else 0), rows, deleted
+
+def prune_deleted_transactions(user_id, version):
+    # Drops the tombstones nobody at `version` or later still needs; get_changes_since from
+    # an older version then returns every row. Called with the oldest version a reader keeps.
+    with transaction() as conn:
+        conn.execute("DELETE FROM deleted_transactions WHERE user_id = ? AND version <= ?", (user_id, version))
+        conn.execute("UPDATE data_versions SET pruned_version = max(pruned_version, ?) WHERE user_id = ?", (version, user_id))
+
+def month_range(month, year):
+    # Half-open [start, end) ISO date range, so `date >= ? AND date < ?` can use the indexes
+    start = f"{year:04d}-{month:02d}-01"
+    end = f"{year + 1:04d}-01-01" if month == 12 else f"{year:04d}-{month + 1:02d}-01"
+    return start, end
+
+# --- BUDGET STATE ---
+# Each category's budget and expense total for a user and month, the same numbers as
+# get_category_budgets_with_spending, held in memory so budget alerts and the dashboard's
+# category list need no query. A state is loaded once, then kept current by the writers:
+# _bump_version, _apply_to_rollup and the budget setters record their changes on the
+# connection and transaction() applies them once it has committed (a rollback drops them).
+# A state is carried to a new data version only from the version before it, so writes from
+# another process, or a wipe or rebuild, drop it to be loaded again. verify=True compares
+# the data version first, for views that should also pick up other processes' writes.
+BUDGET_STATES = 64  # (user, month) states kept
+
+_budget_states = {}    # (DB_NAME, user_id, year, month) -> {'version', 'budgets': {category: cents}, 'spent': {category: [cents, count]}}
+_budget_versions = {}  # (DB_NAME, user_id) -> latest data version committed from this process
+_budget_pending = {}   # connection -> changes recorded in its open transaction
+_budget_lock = threading.Lock()
+
+def _record_budget_change(conn, kind, user_id, *details):
+    change = (kind, (DB_NAME, user_id), *details)
+    if conn.in_transaction: _budget_pending.setdefault(conn, []).append(change)
+    else: _apply_budget_changes([change])
+
+def _commit_budget_changes(conn):
+    changes = _budget_pending.pop(conn, None)
+    if changes: _apply_budget_changes(changes)
+
+def _apply_budget_changes(changes):
+    with _budget_lock:
+        versions = {}  # user -> [version before the transaction, version after]
+        for kind, user, *details in changes:
+            if kind == 'version': versions.setdefault(user, [details[0] - 1, 0])[1] = details[0]
+        for user, (before, after) in versions.items():
+            _budget_versions[user] = max(_budget_versions.get(user, 0), after)
+            for key in [k for k in _budget_states if k[:2] == user]:
+                if _budget_states[key]['version'] == before: _budget_states[key]['version'] = after
+                else: del _budget_states[key]
+        for kind, user, *details in changes:
+            if kind == 'reset' or (kind != 'version' and user not in versions):
+                for key in [k for k in _budget_states if k[:2] == user or (user[1] is None and k[0] == user[0])]:
+                    del _budget_states[key]
+            elif kind == 'spent':
+                year, month, category, amount, count = details
+                state = _budget_states.get((*user, year, month))
+                if state is None: continue
+                spent = state['spent'].setdefault(category, [0, 0])
+                spent[0] += amount
+                spent[1] += count
+                if spent[1] <= 0: del state['spent'][category]
+            elif kind == 'budget':
+                year, month, category, amount = details
+                state = _budget_states.get((*user, year, month))
+                if state is None: continue
+                if amount is None: state['budgets'].pop(category, None)
+                else: state['budgets'][category] = amount
+
+def _budget_state(user_id, month, year, verify=False):
+    key = (DB_NAME, user_id, year, month)
+    state = _budget_states.get(key)
+    if state is not None and verify and state['version'] != get_data_version(user_id): state = None
+    if state is None:
+        with transaction(write=False) as conn:
+            row = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+            budgets = dict(conn.execute("SELECT category, amount FROM budgets WHERE user_id=? AND month=? AND year=? AND category != '##TOTAL##'",
+                                        (user_id, month, year)).fetchall())
+            spent = {r[0]: [r[1], r[2]] for r in conn.execute("SELECT category, total, count FROM monthly_category_totals WHERE user_id=? AND year=? AND month=? AND type='Expense'",
+                                                               (user_id, year, month))}
+        state = {'version': row[0] if row else 0, 'budgets': budgets, 'spent': spent}
+        with _budget_lock:
+            # Keep it unless a commit from this process landed after the snapshot was taken
+            if state['version'] >= _budget_versions.get(key[:2], 0):
+                _budget_states.pop(key, None)
+                if len(_budget_states) >= BUDGET_STATES: del _budget_states[next(iter(_budget_states))]
+                _budget_states[key] = state
+    return state
+
+def get_budget_state(user_id, month, year, verify=False):
+    # get_category_budgets_with_spending from memory: budgeted categories by name, then the rest
+    state = _budget_state(user_id, month, year, verify)
+    with _budget_lock:
+        budgets, spent = state['budgets'], state['spent']
+        return ([{'category': c, 'budget': budgets[c], 'spent': spent[c][0] if c in spent else 0} for c in sorted(budgets)] +
+                [{'category': c, 'budget': 0, 'spent': spent[c][0]} for c in sorted(spent) if c not in budgets])
+
+def get_category_budget(user_id, category, month, year):
+    # (budget, spent) in cents for one category, 0 where there is none
+    state = _budget_state(user_id, month, year)
+    with _budget_lock:
+        spent = state['spent'].get(category)
+        return state['budgets'].get(category, 0), spent[0] if spent else 0
+
+# --- MONTHLY ROLLUP ---
+def _apply_to_rollup(conn, user_id, date, trans_type, category, amount, count):
+    # amount is signed like count: pass (-abs(amount), -1) to take a transaction out
+    year, month = int(date[:4]), int(date[5:7])
+    conn.execute("""INSERT INTO monthly_category_totals (user_id, year, month, type, category, total, count) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, year, month, type, category) DO UPDATE SET total = total + excluded.total, count = count + excluded.count""",
+                 (user_id, year, month, trans_type, category, amount, count))
+    if trans_type == 'Expense': _record_budget_change(conn, 'spent', user_id, year, month, category, amount, count)
+    if count < 0:
+        conn.execute("DELETE FROM monthly_category_totals WHERE user_id=? AND year=? AND month=? AND type=? AND category=? AND count <= 0",
+                     (user_id, year, month, trans_type, category))
+
+def rebuild_monthly_totals(user_id=None, conn=None):
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    with transaction(conn) as conn:
+        conn.execute(f"DELETE FROM monthly_category_totals {where}", params)
+        _record_budget_change(conn, 'reset', user_id)
+        conn.execute(f"""INSERT INTO monthly_category_totals (user_id, year, month, type, category, total, count)
+                         SELECT user_id, CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER), type, category, SUM(abs(amount)), COUNT(*)
+                         FROM transactions {where} GROUP BY 1, 2, 3, 4, 5""", params)
+
+# --- BALANCE CHECKPOINTS ---
+# balance_checkpoints holds each account's closing balance for every month it has
+# transactions in, kept exact by the transaction write functions. The balance on any date
+# is the closing balance of the latest earlier month plus that month's rows up to the date:
+# an index seek and one month of rows instead of the whole history. Accounts open at 0,
+# so an account's latest checkpoint equals its current_balance.
+def _apply_to_checkpoints(conn, account_id, date, amount):
+    # amount is the signed change to the balance on `date`; it moves every closing balance from that month on
+    year, month = int(date[:4]), int(date[5:7])
+    conn.execute("INSERT OR IGNORE INTO balance_checkpoints (account_id, year, month, balance) VALUES (?, ?, ?, ?)",
+                 (account_id, year, month, _closing_before(conn, account_id, year, month)))
+    conn.execute("UPDATE balance_checkpoints SET balance = balance + ? WHERE account_id = ? AND (year, month) >= (?, ?)", (amount, account_id, year, month))
+
+def _closing_before(conn, account_id, year, month):
+    row = conn.execute("SELECT balance FROM balance_checkpoints WHERE account_id = ? AND (year, month) < (?, ?) ORDER BY year DESC, month DESC LIMIT 1",
+                       (account_id, year, month)).fetchone()
+    return row[0] if row else 0
+
+def rebuild_balance_checkpoints(user_id=None, conn=None):
+    where, params = ("WHERE account_id IN (SELECT account_id FROM accounts WHERE user_id = ?)", (user_id,)) if user_id is not None else ("", ())
+    with transaction(conn) as conn:
+        conn.execute(f"DELETE FROM balance_checkpoints {where}", params)
+        conn.execute(f"""INSERT INTO balance_checkpoints (account_id, year, month, balance)
+                         SELECT account_id, year, month, SUM(SUM(amount)) OVER (PARTITION BY account_id ORDER BY year, month)
+                         FROM (SELECT account_id, CAST(substr(date, 1, 4) AS INTEGER) AS year, CAST(substr(date, 6, 2) AS INTEGER) AS month, amount
+                               FROM transactions {where})
+                         GROUP BY account_id, year, month""", params)
+
+def get_balance_as_of(account_id, date):
+    # Balance in cents at the end of `date` (YYYY-MM-DD)
+    year, month = int(date[:4]), int(date[5:7])
+    with connection() as conn:
+        opening = _closing_before(conn, account_id, year, month)
+        in_month = conn.execute("SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE account_id = ? AND date >= ? AND date <= ?",
+                                (account_id, month_range(month, year)[0], date)).fetchone()[0]
+    return opening + in_month
+
+def get_running_balances(rows):
+    # {transaction_id: balance of its account just after it} for listing rows (a page).
+    # Reads one month of each account the rows fall in, up to the latest row in it.
+    months = {}  # (account_id, 'YYYY-MM') -> [transaction_ids, latest date]
+    for r in rows:
+        entry = months.setdefault((r['account_id'], r['date'][:7]), [set(), r['date']])
+        entry[0].add(r['transaction_id'])
+        entry[1] = max(entry[1], r['date'])
+    balances = {}
+    with connection() as conn:
+        for (account_id, month), (ids, last) in months.items():
+            running = _closing_before(conn, account_id, int(month[:4]), int(month[5:7]))
+            for transaction_id, amount in conn.execute("""SELECT transaction_id, amount FROM transactions WHERE account_id = ? AND date >= ? AND date <= ?
+                                                          ORDER BY date, transaction_id""", (account_id, month + "-01", last)):
+                running += amount
+                if transaction_id in ids: balances[transaction_id] = running
+    return balances
 
 # --- TRANSACTION FUNCTIONS ---
 def check_transaction_exists(user_id, date, amount, description, conn):
@@ -183,177 +743,490 @@ def check_transaction_exists(user_id, date, amount, description, conn):
     return cursor.fetchone() is not None
 
 def add_transaction(user_id, account_id, date, amount, trans_type, category, description, tags, conn_ext=None):
+    # amount in cents; its sign is taken from trans_type
     try:
-        amt = float(amount)
-        if trans_type == 'Expense': amt = -abs(amt)
-        else: amt = abs(amt)
-        amt = round(amt, 2)
+        amt = abs(_require_cents(amount))
+        if trans_type == 'Expense': amt = -amt
     except ValueError: return False, "Invalid amount", None
     
-    conn = conn_ext if conn_ext else get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT current_balance FROM accounts WHERE account_id = ?", (account_id,))
-        row = cursor.fetchone()
-        if not row: return False, "Account error", None
-        old_bal = row['current_balance']
-        
-        cursor.execute("INSERT INTO transactions (user_id, account_id, date, amount, type, category, description, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
-                       (user_id, account_id, date, amt, trans_type, category, description, tags))
-        new_id = cursor.lastrowid
-        cursor.execute("UPDATE accounts SET current_balance = ? WHERE account_id = ?", (round(old_bal + amt, 2), account_id))
-        
-        if not conn_ext: conn.commit()
+        with transaction(conn_ext) as conn:
+            cursor = conn.cursor()
+            # A delta in SQL, never read-modify-write, so concurrent writers cannot lose an update
+            cursor.execute("UPDATE accounts SET current_balance = current_balance + ? WHERE account_id = ?", (amt, account_id))
+            if cursor.rowcount == 0: return False, "Account error", None
+            version = _bump_version(conn, user_id)
+            
+            cursor.execute("INSERT INTO transactions (user_id, account_id, date, amount, type, category, description, tags, row_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+                           (user_id, account_id, date, amt, trans_type, category, description, tags, version))
+            new_id = cursor.lastrowid
+            _apply_to_rollup(conn, user_id, date, trans_type, category, abs(amt), 1)
+            _apply_to_checkpoints(conn, account_id, date, amt)
         return True, "Added", new_id
     except Exception as e:
-        if not conn_ext: conn.rollback()
         return False, str(e), None
-    finally:
-        if not conn_ext: conn.close()
+
+def _add_transaction_group(conn, rows):
+    # add_transaction for many (user_id, account_id, date, amount, trans_type, category, description, tags)
+    # rows in the caller's transaction. Balances, rollup, checkpoints and versions are updated once per
+    # group. Returns the new transaction_id or an error message per row; a failed row leaves nothing behind.
+    accounts = {r[0] for r in conn.execute(f"SELECT account_id FROM accounts WHERE account_id IN ({','.join('?' * len({r[1] for r in rows}))})",
+                                           tuple({r[1] for r in rows}))}
+    versions, balances, rollup, month_deltas, results = {}, {}, {}, {}, []
+    for user_id, account_id, date, amount, trans_type, category, description, tags in rows:
+        try: amt = abs(_require_cents(amount))
+        except ValueError:
+            results.append("Invalid amount")
+            continue
+        if account_id not in accounts:
+            results.append("Account error")
+            continue
+        if trans_type == 'Expense': amt = -amt
+        if user_id not in versions: versions[user_id] = _next_version(conn, user_id)
+        try:
+            cursor = conn.execute("INSERT INTO transactions (user_id, account_id, date, amount, type, category, description, tags, row_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (user_id, account_id, date, amt, trans_type, category, description, tags, versions[user_id]))
+        except sqlite3.Error as e:
+            results.append(str(e))
+            continue
+        results.append(cursor.lastrowid)
+        balances[account_id] = balances.get(account_id, 0) + amt
+        cell = rollup.setdefault((user_id, date[:8] + '01', trans_type, category), [0, 0])
+        cell[0] += abs(amt)
+        cell[1] += 1
+        month_deltas[account_id, date[:8] + '01'] = month_deltas.get((account_id, date[:8] + '01'), 0) + amt
+    conn.executemany("UPDATE accounts SET current_balance = current_balance + ? WHERE account_id = ?", [(delta, a) for a, delta in balances.items()])
+    for (user_id, month_start, trans_type, category), (total, count) in rollup.items():
+        _apply_to_rollup(conn, user_id, month_start, trans_type, category, total, count)
+    for (account_id, month_start), delta in month_deltas.items():
+        _apply_to_checkpoints(conn, account_id, month_start, delta)
+    for user_id in versions: _bump_version(conn, user_id)
+    return results
 
 def delete_transaction(transaction_id, user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT account_id, amount FROM transactions WHERE transaction_id = ? AND user_id = ?", (transaction_id, user_id))
-        trans = cursor.fetchone()
-        if not trans: return False, "Not found"
-        cursor.execute("UPDATE accounts SET current_balance = round(current_balance - ?, 2) WHERE account_id = ?", (trans['amount'], trans['account_id']))
-        cursor.execute("DELETE FROM transactions WHERE transaction_id = ?", (transaction_id,))
-        conn.commit()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT account_id, amount, date, type, category FROM transactions WHERE transaction_id = ? AND user_id = ?", (transaction_id, user_id))
+            trans = cursor.fetchone()
+            if not trans: return False, "Not found"
+            cursor.execute("UPDATE accounts SET current_balance = current_balance - ? WHERE account_id = ?", (trans['amount'], trans['account_id']))
+            cursor.execute("DELETE FROM transactions WHERE transaction_id = ?", (transaction_id,))
+            cursor.execute("INSERT INTO deleted_transactions (transaction_id, user_id, version) VALUES (?, ?, ?)", (transaction_id, user_id, _bump_version(conn, user_id)))
+            _apply_to_rollup(conn, user_id, trans['date'], trans['type'], trans['category'], -abs(trans['amount']), -1)
+            _apply_to_checkpoints(conn, trans['account_id'], trans['date'], -trans['amount'])
         return True, "Deleted"
     except Exception as e:
-        conn.rollback()
         return False, str(e)
-    finally: conn.close()
 
 def update_transaction(transaction_id, user_id, new_details):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT account_id, amount FROM transactions WHERE transaction_id = ? AND user_id = ?", (transaction_id, user_id))
-        old = cursor.fetchone()
-        if not old: raise Exception("Not found")
-        cursor.execute("UPDATE accounts SET current_balance = round(current_balance - ?, 2) WHERE account_id = ?", (old['amount'], old['account_id']))
-        
-        new_amt = float(new_details['amount'])
-        if new_details['type'] == 'Expense': new_amt = -abs(new_amt)
-        else: new_amt = abs(new_amt)
-        new_amt = round(new_amt, 2)
-        
-        cursor.execute("UPDATE accounts SET current_balance = round(current_balance + ?, 2) WHERE account_id = ?", (new_amt, new_details['account_id']))
-        cursor.execute("UPDATE transactions SET date=?, amount=?, type=?, category=?, description=?, account_id=? WHERE transaction_id=?", 
-                       (new_details['date'], new_amt, new_details['type'], new_details['category'], new_details['description'], new_details['account_id'], transaction_id))
-        conn.commit()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT account_id, amount, date, type, category FROM transactions WHERE transaction_id = ? AND user_id = ?", (transaction_id, user_id))
+            old = cursor.fetchone()
+            if not old: raise Exception("Not found")
+            cursor.execute("UPDATE accounts SET current_balance = current_balance - ? WHERE account_id = ?", (old['amount'], old['account_id']))
+            
+            new_amt = abs(_require_cents(new_details['amount']))
+            if new_details['type'] == 'Expense': new_amt = -new_amt
+            
+            cursor.execute("UPDATE accounts SET current_balance = current_balance + ? WHERE account_id = ?", (new_amt, new_details['account_id']))
+            cursor.execute("UPDATE transactions SET date=?, amount=?, type=?, category=?, description=?, account_id=?, row_version=? WHERE transaction_id=?", 
+                           (new_details['date'], new_amt, new_details['type'], new_details['category'], new_details['description'], new_details['account_id'],
+                            _bump_version(conn, user_id), transaction_id))
+            _apply_to_rollup(conn, user_id, old['date'], old['type'], old['category'], -abs(old['amount']), -1)
+            _apply_to_rollup(conn, user_id, new_details['date'], new_details['type'], new_details['category'], abs(new_amt), 1)
+            _apply_to_checkpoints(conn, old['account_id'], old['date'], -old['amount'])
+            _apply_to_checkpoints(conn, new_details['account_id'], new_details['date'], new_amt)
         return True, "Updated"
     except Exception as e:
-        conn.rollback()
         return False, str(e)
-    finally: conn.close()
 
-def get_transactions_by_filter(user_id, search_term=""):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = "SELECT t.transaction_id, t.date, t.type, t.amount, t.category, t.description, a.account_name, t.account_id FROM transactions t JOIN accounts a ON t.account_id = a.account_id WHERE t.user_id = ?"
+# --- GROUP COMMIT ---
+# WriteQueue takes add_transaction calls from any thread and commits them from one writer
+# thread in groups, one transaction per WRITE_BATCH_ROWS rows or WRITE_BATCH_MS, so a
+# sustained feed pays for one commit (and one balance/rollup/checkpoint update) per group
+# instead of per row. A row that fails (bad amount, unknown account, a constraint) fails only
+# its own future; if the commit itself fails, every future in the group gets that error.
+
+class WriteQueue:
+    def __init__(self, batch_rows=WRITE_BATCH_ROWS, batch_ms=WRITE_BATCH_MS):
+        self.batch_rows = batch_rows
+        self.batch_ms = batch_ms
+        self.jobs = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()  # nothing is queued behind Close's sentinel
+        self.thread = threading.Thread(target=self._Run, name="financify-writes", daemon=True)
+        self.thread.start()
+
+    def AddTransaction(self, user_id, account_id, date, amount, trans_type, category, description, tags=""):
+        # Future of the new transaction_id; ValueError(message) where add_transaction would return False
+        future = Future()
+        with self.lock:
+            if self.closed: raise RuntimeError("WriteQueue is closed")
+            self.jobs.put(((user_id, account_id, date, amount, trans_type, category, description, tags), future))
+        return future
+
+    def Flush(self, timeout=None):
+        # Blocks until everything queued before the call is committed (or has failed)
+        future = Future()
+        with self.lock:
+            if self.closed: raise RuntimeError("WriteQueue is closed")
+            self.jobs.put((None, future))
+        future.result(timeout)
+
+    def Close(self, timeout=None):
+        with self.lock:
+            if self.closed: return
+            self.closed = True
+            self.jobs.put(None)
+        self.thread.join(timeout)
+
+    def _Run(self):
+        stop = False
+        while not stop:
+            job = self.jobs.get()
+            if job is None: break
+            batch, deadline = [job], time.monotonic() + self.batch_ms / 1000
+            while len(batch) < self.batch_rows and batch[-1][0] is not None:
+                try: job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty: break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._Commit(batch)
+
+    def _Commit(self, batch):
+        rows = [(args, future) for args, future in batch if args is not None and future.set_running_or_notify_cancel()]
+        try:
+            if rows:
+                with transaction() as conn:
+                    results = _add_transaction_group(conn, [args for args, _ in rows])
+                for (_, future), result in zip(rows, results):
+                    if isinstance(result, str): future.set_exception(ValueError(result))
+                    else: future.set_result(result)
+        except Exception as e:
+            for _, future in rows: future.set_exception(e)
+        for args, future in batch:
+            if args is None: future.set_result(None)
+
+_write_queue = None
+
+def get_write_queue():
+    # The process-wide queue, started on first use and flushed at exit
+    global _write_queue
+    with _pool_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+            atexit.register(_write_queue.Close)
+        return _write_queue
+
+# --- BULK IMPORT ---
+class _ImportCancelled(Exception): pass
+
+def smart_date_parse(date_str):
+    # ISO date for the first matching import format, None if nothing matches
+    return dateparse.parse_date(date_str)
+
+_PLAIN_AMOUNT = re.compile(r'[+-]?\d+\.\d\d').fullmatch
+
+def _column_cents(values):
+    # to_cents over a column, None where it fails; "1234.56" (nearly every statement) skips the general path
+    cents = []
+    for value in values:
+        if _PLAIN_AMOUNT(value): cents.append(int(value.replace('.', '', 1)))
+        else:
+            try: cents.append(to_cents(value))
+            except ValueError: cents.append(None)
+    return cents
+
+def read_import_file(path, chunk_size=IMPORT_CHUNK_SIZE, dates=None):
+    # Parses and validates a statement CSV without touching the database. Yields
+    # (parsed rows, rows read, rows rejected, fraction of the file read) for every chunk_size rows,
+    # a parsed row being (date, signed amount, type, category, description). The date format is
+    # detected from the first chunk by `dates` (a dateparse.DateParser), which the caller can keep
+    # to see what was detected. ValueError if the header has no date or amount column.
+    if dates is None: dates = dateparse.DateParser()
+    total_bytes = os.path.getsize(path) or 1
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        columns = {name.lower().strip(): i for i, name in enumerate(next(reader, []))}
+        if 'date' not in columns or 'amount' not in columns:
+            raise ValueError("CSV must have 'date' and 'amount' columns")
+        width = max(columns.values()) + 1
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if not chunk: break
+            # Blank lines are skipped and short rows read as empty fields, as with csv.DictReader
+            rows = [row if len(row) >= width else row + [''] * (width - len(row)) for row in chunk if row]
+            def column(name):
+                at = columns.get(name)
+                return [row[at] for row in rows] if at is not None else [''] * len(rows)
+            parsed, rejected = [], 0
+            for d_str, amt, t_type, category, description in zip(dates.ParseMany(column('date')), _column_cents(column('amount')),
+                                                                  column('type'), column('category'), column('description')):
+                if d_str is None or amt is None:
+                    rejected += 1
+                    continue
+                amt = abs(amt)
+                if t_type.capitalize() == 'Income': parsed.append((d_str, amt, 'Income', category or 'Other', description))
+                else: parsed.append((d_str, -amt, 'Expense', category or 'Other', description))
+            yield parsed, len(rows), rejected, f.buffer.tell() / total_bytes if len(chunk) == chunk_size else 1.0
+
+class ImportWriter:
+    # Inserts parsed import rows into one account. Rows already in the database or added
+    # earlier by this writer (same date, amount and description) are skipped. The balance,
+    # monthly rollup, checkpoints and data version are brought up to date once per Flush(),
+    # which must run in the same transaction as the Add() calls before it.
+    def __init__(self, user_id, account_id):
+        self.user_id = user_id
+        self.account_id = account_id
+        self.keys = set()     # (date, amount, description) already in the db or added
+        self.loaded = None    # inclusive date span whose existing keys are in `keys`
+        self._Reset()
+
+    def _Reset(self):
+        self.rollup = {}        # (first of month, type, category) -> [total, count]
+        self.month_deltas = {}  # first of month -> balance change
+        self.balance_delta = 0
+        self.version = None     # row_version of the added rows, the version bumped by Flush()
+        self.added = 0
+
+    def _LoadKeys(self, conn, where, params):
+        for row in conn.execute(f"SELECT date, amount, description FROM transactions WHERE user_id=? AND {where}", (self.user_id, *params)):
+            self.keys.add(tuple(row))
+
+    def Add(self, conn, parsed):
+        # parsed: (date, signed amount, type, category, description) rows. Returns (imported, duplicates).
+        if not parsed: return 0, 0
+        if self.version is None: self.version = _next_version(conn, self.user_id)
+        lo, hi = min(p[0] for p in parsed), max(p[0] for p in parsed)
+        if self.loaded is None:
+            self._LoadKeys(conn, "date >= ? AND date <= ?", (lo, hi))
+            self.loaded = (lo, hi)
+        else:
+            if lo < self.loaded[0]: self._LoadKeys(conn, "date >= ? AND date < ?", (lo, self.loaded[0]))
+            if hi > self.loaded[1]: self._LoadKeys(conn, "date > ? AND date <= ?", (self.loaded[1], hi))
+            self.loaded = (min(lo, self.loaded[0]), max(hi, self.loaded[1]))
+
+        keys, rollup, month_deltas = self.keys, self.rollup, self.month_deltas
+        new_rows = []
+        for d_str, amt, t_type, category, description in parsed:
+            key = (d_str, amt, description)
+            if key in keys: continue
+            keys.add(key)
+            new_rows.append((self.user_id, self.account_id, d_str, amt, t_type, category, description, "", self.version))
+            self.balance_delta += amt
+            cell = rollup.setdefault((d_str[:8] + '01', t_type, category), [0, 0])
+            cell[0] += abs(amt)
+            cell[1] += 1
+            month_deltas[d_str[:8] + '01'] = month_deltas.get(d_str[:8] + '01', 0) + amt
+        conn.executemany("INSERT INTO transactions (user_id, account_id, date, amount, type, category, description, tags, row_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", new_rows)
+        self.added += len(new_rows)
+        return len(new_rows), len(parsed) - len(new_rows)
+
+    def Flush(self, conn):
+        if self.added:
+            conn.execute("UPDATE accounts SET current_balance = current_balance + ? WHERE account_id = ?", (self.balance_delta, self.account_id))
+            for (month_start, t_type, category), (total, count) in self.rollup.items():
+                _apply_to_rollup(conn, self.user_id, month_start, t_type, category, total, count)
+            for month_start, delta in self.month_deltas.items():
+                _apply_to_checkpoints(conn, self.account_id, month_start, delta)
+            _bump_version(conn, self.user_id)
+        self._Reset()
+
+def import_transactions_csv(user_id, account_id, path, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    # Streams the file in chunks inside one transaction. Rows already in the database or
+    # earlier in the file (same date, amount and description) are skipped. The balance and
+    # the monthly rollup and checkpoints are updated once at the end. progress(rows_read, fraction) may
+    # return False to cancel, which rolls the whole import back.
+    started = time.perf_counter()
+    stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0, 'cancelled': False}
+    writer = ImportWriter(user_id, account_id)
+    dates = dateparse.DateParser()
+    try:
+        with transaction() as conn:
+            if not conn.execute("SELECT 1 FROM accounts WHERE account_id = ? AND user_id = ?", (account_id, user_id)).fetchone():
+                raise ValueError("Account error")
+            for parsed, read, rejected, fraction in read_import_file(path, chunk_size, dates):
+                imported, duplicates = writer.Add(conn, parsed)
+                stats['rows'] += read
+                stats['rejected'] += rejected
+                stats['imported'] += imported
+                stats['duplicates'] += duplicates
+                if progress and progress(stats['rows'], fraction) is False:
+                    raise _ImportCancelled
+            writer.Flush(conn)
+    except _ImportCancelled:
+        stats['imported'] = 0
+        stats['cancelled'] = True
+
+    stats['date_format'], stats['ambiguous_dates'] = dates.format, dates.ambiguous
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_sec'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else stats['rows']
+    return stats
+
+# --- SEARCH ---
+def _search_enabled(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='transactions_fts'").fetchone() is not None
+
+SEARCH_MIN_CHARS = 3  # shorter terms have no trigram to look up and use LIKE
+
+def _fts_query(search_term):
+    # The whole term as one phrase: a case-insensitive substring of the description, category
+    # or account name, the same rows as LIKE '%term%' ("unch" finds "Benchmark lunch")
+    if len(search_term) < SEARCH_MIN_CHARS: return None
+    return '"' + search_term.replace('"', '""') + '"'
+
+# --- LISTING ---
+LISTING_COLUMNS = "t.transaction_id, t.date, t.type, t.amount, t.category, t.description, a.account_name, t.account_id"
+LISTING_ORDER = " ORDER BY t.date DESC, t.transaction_id DESC"
+
+def _listing_filter(user_id, search_term, need_account=True):
+    # Without the LIKE fallback, counts and key lookups skip the join and stay on the index
+    fts = _fts_query(search_term) if search_term else None
+    if fts and not _search_enabled(get_connection()): fts = None
+    like = search_term and not fts
+    join = " JOIN accounts a ON t.account_id = a.account_id" if need_account or like else ""
+    where = " FROM transactions t" + join + " WHERE t.user_id = ?"
     params = [user_id]
-    if search_term:
-        query += " AND (t.category LIKE ? OR t.description LIKE ? OR a.account_name LIKE ?)"
+    if fts:
+        where += " AND t.transaction_id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)"
+        params.append(fts)
+    elif like:
+        where += " AND (t.category LIKE ? OR t.description LIKE ? OR a.account_name LIKE ?)"
         term = f"%{search_term}%"
         params.extend([term, term, term])
-    query += " ORDER BY t.date DESC, t.transaction_id DESC"
-    cursor.execute(query, tuple(params))
-    res = cursor.fetchall()
-    conn.close()
-    return res
+    return where, params
+
+def get_transactions_by_filter(user_id, search_term=""):
+    where, params = _listing_filter(user_id, search_term)
+    with connection() as conn:
+        return conn.execute("SELECT " + LISTING_COLUMNS + where + LISTING_ORDER, tuple(params)).fetchall()
+
+def get_transaction(user_id, transaction_id):
+    with connection() as conn:
+        return conn.execute("SELECT " + LISTING_COLUMNS + " FROM transactions t JOIN accounts a ON t.account_id = a.account_id WHERE t.user_id = ? AND t.transaction_id = ?",
+                            (user_id, transaction_id)).fetchone()
+
+# --- KEYSET PAGINATION ---
+# Pages follow the listing order (date DESC, transaction_id DESC). A page starts after the
+# key (date, transaction_id) of the last row of the previous page, so fetching any page
+# is an index seek no matter how deep into the history it is.
+
+def count_transactions(user_id, search_term=""):
+    where, params = _listing_filter(user_id, search_term, need_account=False)
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*)" + where, tuple(params)).fetchone()[0]
+
+def _range_filter(where, params, start_date=None, end_date=None, trans_type=None):
+    # start_date and end_date are inclusive
+    for condition, value in ((" AND t.date >= ?", start_date), (" AND t.date <= ?", end_date), (" AND t.type = ?", trans_type)):
+        if value:
+            where += condition
+            params.append(value)
+    return where
+
+def get_transactions_page(user_id, search_term="", after=None, limit=100, start_date=None, end_date=None, trans_type=None):
+    where, params = _listing_filter(user_id, search_term)
+    where = _range_filter(where, params, start_date, end_date, trans_type)
+    if after is not None:
+        where += " AND (t.date, t.transaction_id) < (?, ?)"
+        params.extend(after)
+    with connection() as conn:
+        return conn.execute("SELECT " + LISTING_COLUMNS + where + LISTING_ORDER + " LIMIT ?", (*params, limit)).fetchall()
+
+def get_listing_key_at(user_id, search_term, position):
+    # (date, transaction_id) of the row at `position` in the listing, for jumping to a page
+    # whose predecessor has not been fetched. Walks the index without reading the rows.
+    where, params = _listing_filter(user_id, search_term, need_account=False)
+    with connection() as conn:
+        row = conn.execute("SELECT t.date, t.transaction_id" + where + LISTING_ORDER + " LIMIT 1 OFFSET ?", (*params, position)).fetchone()
+    return tuple(row) if row else None
+
+def iter_transaction_batches(user_id, start_date=None, end_date=None, trans_type=None, batch_size=EXPORT_BATCH_SIZE):
+    # Same rows and order as get_transactions_by_filter, fetched batch_size at a time so
+    # exports never hold the whole history. start_date and end_date are inclusive.
+    where, params = _listing_filter(user_id, "")
+    query = "SELECT " + LISTING_COLUMNS + _range_filter(where, params, start_date, end_date, trans_type) + LISTING_ORDER
+    cursor = get_connection().execute(query, tuple(params))
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch: break
+            yield batch
+    finally:
+        cursor.close()
 
 def get_dashboard_numbers(user_id, month, year):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    m, y = f"{month:02d}", str(year)
-    cursor.execute("SELECT amount FROM budgets WHERE user_id=? AND month=? AND year=? AND category='##TOTAL##'", (user_id, month, year))
-    row = cursor.fetchone()
-    bud = row['amount'] if row else 0.0
-    
-    cursor.execute("SELECT SUM(amount) FROM transactions WHERE user_id=? AND type='Income' AND strftime('%Y', date)=? AND strftime('%m', date)=?", (user_id, y, m))
-    row = cursor.fetchone()
-    inc = row[0] if row[0] else 0.0
-    
-    cursor.execute("SELECT SUM(abs(amount)) FROM transactions WHERE user_id=? AND type='Expense' AND strftime('%Y', date)=? AND strftime('%m', date)=?", (user_id, y, m))
-    row = cursor.fetchone()
-    spn = row[0] if row[0] else 0.0
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT amount FROM budgets WHERE user_id=? AND month=? AND year=? AND category='##TOTAL##'", (user_id, month, year))
+        row = cursor.fetchone()
+        bud = row['amount'] if row else 0
+        
+        cursor.execute("SELECT type, SUM(total) FROM monthly_category_totals WHERE user_id=? AND year=? AND month=? GROUP BY type", (user_id, year, month))
+        totals = dict(cursor.fetchall())
+    inc = totals.get('Income') or 0
+    spn = totals.get('Expense') or 0
     return {'budget': bud, 'income': inc, 'spent': spn, 'remaining': bud - spn, 'net': inc - spn}
 
 def get_expense_data_for_pie_chart(user_id, month, year):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT category, SUM(abs(amount)) as total FROM transactions WHERE user_id=? AND type='Expense' AND strftime('%Y', date)=? AND strftime('%m', date)=? GROUP BY category HAVING total > 0", (user_id, str(year), f"{month:02d}"))
-    res = cursor.fetchall()
-    conn.close()
-    return res
+    with connection() as conn:
+        return conn.execute("SELECT category, total FROM monthly_category_totals WHERE user_id=? AND year=? AND month=? AND type='Expense' AND total > 0", (user_id, year, month)).fetchall()
 
 def get_monthly_comparison_data(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT strftime('%Y-%m', date) as month, 
-               SUM(CASE WHEN type='Income' THEN amount ELSE 0 END) as income,
-               SUM(CASE WHEN type='Expense' THEN abs(amount) ELSE 0 END) as expense
-        FROM transactions 
-        WHERE user_id=? AND date >= date('now', '-6 months') 
-        GROUP BY month ORDER BY month ASC
-    """, (user_id,))
-    res = cursor.fetchall()
-    conn.close()
-    return res
+    # Last six months plus the current one
+    today = datetime.now()
+    start_year, start_month = divmod(today.year * 12 + today.month - 1 - 6, 12)
+    with connection() as conn:
+        return conn.execute("""
+            SELECT printf('%04d-%02d', year, month) as month, 
+                   SUM(CASE WHEN type='Income' THEN total ELSE 0 END) as income,
+                   SUM(CASE WHEN type='Expense' THEN total ELSE 0 END) as expense
+            FROM monthly_category_totals 
+            WHERE user_id=? AND (year, month) >= (?, ?) 
+            GROUP BY year, month ORDER BY year, month ASC
+        """, (user_id, start_year, start_month + 1)).fetchall()
 
 def get_recent_transactions(user_id, limit=5):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT date, category, amount, type FROM transactions WHERE user_id = ? ORDER BY date DESC, transaction_id DESC LIMIT ?", (user_id, limit))
-    data = cursor.fetchall()
-    conn.close()
-    return data
+    with connection() as conn:
+        return conn.execute("SELECT date, category, amount, type FROM transactions WHERE user_id = ? ORDER BY date DESC, transaction_id DESC LIMIT ?", (user_id, limit)).fetchall()
 
 def set_monthly_budget(user_id, month, year, amount):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("REPLACE INTO budgets (user_id, category, amount, month, year) VALUES (?, '##TOTAL##', ?, ?, ?)", (user_id, amount, month, year))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("REPLACE INTO budgets (user_id, category, amount, month, year) VALUES (?, '##TOTAL##', ?, ?, ?)", (user_id, _require_cents(amount), month, year))
+        _bump_version(conn, user_id)
 
 def set_category_budget(user_id, category, amount, month, year):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("REPLACE INTO budgets (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)", (user_id, category, amount, month, year))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("REPLACE INTO budgets (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)", (user_id, category, _require_cents(amount), month, year))
+        _record_budget_change(conn, 'budget', user_id, year, month, category, amount)
+        _bump_version(conn, user_id)
     return True, "Saved"
 
 def delete_category_budget(user_id, category, month, year):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM budgets WHERE user_id=? AND category=? AND month=? AND year=?", (user_id, category, month, year))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM budgets WHERE user_id=? AND category=? AND month=? AND year=?", (user_id, category, month, year))
+        _record_budget_change(conn, 'budget', user_id, year, month, category, None)
+        _bump_version(conn, user_id)
     return True, "Deleted"
 
 def get_category_budgets_with_spending(user_id, month, year):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     query = """
-    WITH Spending AS (SELECT category, SUM(abs(amount)) as spent FROM transactions WHERE user_id=? AND type='Expense' AND strftime('%Y', date)=? AND strftime('%m', date)=? GROUP BY category)
+    WITH Spending AS (SELECT category, total as spent FROM monthly_category_totals WHERE user_id=? AND year=? AND month=? AND type='Expense')
     SELECT b.category, b.amount as budget, COALESCE(s.spent, 0) as spent FROM budgets b LEFT JOIN Spending s ON b.category = s.category WHERE b.user_id=? AND b.month=? AND b.year=? AND b.category != '##TOTAL##'
     UNION ALL
     SELECT s.category, 0 as budget, s.spent FROM Spending s LEFT JOIN budgets b ON s.category = b.category AND b.user_id=? AND b.month=? AND b.year=? WHERE b.budget_id IS NULL
     """
-    params = (user_id, str(year), f"{month:02d}", user_id, month, year, user_id, month, year)
-    cursor.execute(query, params)
-    res = cursor.fetchall()
-    conn.close()
-    return res
+    params = (user_id, year, month, user_id, month, year, user_id, month, year)
+    with connection() as conn:
+        return conn.execute(query, params).fetchall()
 
 if __name__ == '__main__':
     initialize_database()
-    
-
+    # python database.py rebuild-rollups  -- recompute monthly_category_totals from transactions
+    if sys.argv[1:] == ['rebuild-rollups']:
+        rebuild_monthly_totals()
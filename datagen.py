@@ -0,0 +1,182 @@
+import argparse
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import database as db
+
+# Reproducible synthetic data: N users with M accounts each and years of history.
+# The same seed always produces the same database.
+# Each user gets a monthly salary and rent from their main account, plus utility bills.
+# The remaining rows are day-to-day spending spread over the user's accounts.
+# That spending is weighted towards weekends and grows slowly over time.
+# Amounts are log-normal around a typical value for each category, stored as cents.
+# Usage: python datagen.py --db big.db --users 50 --accounts 3 --transactions 1000000 --years 5
+
+ACCOUNT_TYPES = [('Checking', 'Checking'), ('Credit Card', 'Credit'), ('Savings', 'Savings'), ('Cash', 'Cash')]
+
+# category: (share of day-to-day spending, median amount, spread, merchants)
+SPENDING = {
+    'Groceries':     (0.26, 850, 0.6, ['BigBasket', 'DMart', 'Reliance Fresh', 'Local Kirana', 'Nature\'s Basket']),
+    'Food':          (0.24, 320, 0.7, ['Swiggy', 'Zomato', 'Cafe Coffee Day', 'Office Canteen', 'Domino\'s']),
+    'Transport':     (0.18, 180, 0.8, ['Uber', 'Ola', 'Metro Card Recharge', 'Indian Oil', 'Rapido']),
+    'Shopping':      (0.10, 1400, 0.9, ['Amazon', 'Flipkart', 'Myntra', 'Decathlon', 'Croma']),
+    'Entertainment': (0.08, 600, 0.7, ['BookMyShow', 'Netflix', 'Spotify', 'PVR Cinemas', 'Steam']),
+    'Health':        (0.06, 700, 0.9, ['Apollo Pharmacy', 'Practo', 'Cult.fit', '1mg', 'City Clinic']),
+    'Education':     (0.03, 1500, 0.8, ['Coursera', 'Udemy', 'Kindle Store', 'Crossword Books']),
+    'Other':         (0.05, 400, 1.0, ['ATM Withdrawal', 'Gift', 'Donation', 'Bank Charges', 'Laundry']),
+}
+UTILITIES = [('Electricity Bill', 1800, 0.3), ('Internet Bill', 799, 0.0), ('Mobile Recharge', 399, 0.0), ('Gas Cylinder', 950, 0.1)]
+WEEKDAY_WEIGHT = [1.0, 0.9, 0.9, 1.0, 1.2, 1.6, 1.4]  # Monday first
+ANNUAL_GROWTH = 0.06
+
+def _months(first_day, last_day):
+    year, month = first_day.year, first_day.month
+    while (year, month) <= (last_day.year, last_day.month):
+        start = max(first_day, date(year, month, 1))
+        end = min(last_day, date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1))
+        yield start, end
+        year, month = year + month // 12, month % 12 + 1
+
+def _profile(rng, index, n_accounts):
+    salary = round(rng.lognormvariate(math.log(65000), 0.5), -2)
+    return {'salary': salary, 'rent': round(salary * rng.uniform(0.2, 0.35), -2), 'pay_day': rng.choice([1, 1, 5, 7, 28]),
+            'spend_scale': rng.uniform(0.7, 1.4), 'account_weights': [1.0] + [rng.uniform(0.2, 0.8) for _ in range(n_accounts - 1)],
+            'username': f"user{index + 1:05d}"}
+
+def _fixed_rows(rng, user, accounts, start, end):
+    # Salary, rent and bills for one (partial) month, from the main account
+    user_id, profile = user
+    main = accounts[0]
+    rows = []
+    def add(day, amount, trans_type, category, description):
+        if start.day <= day <= end.day:
+            rows.append((user_id, main, date(start.year, start.month, day).isoformat(), round(amount * 100), trans_type, category, description, ''))
+    last = end.day if end.day >= 28 else 28
+    add(min(profile['pay_day'], last), profile['salary'], 'Income', 'Salary', 'Monthly Salary')
+    add(min(3, last), -profile['rent'], 'Expense', 'Rent', 'House Rent')
+    for i, (name, median, seasonal) in enumerate(UTILITIES):
+        amount = median * (1 + seasonal * math.cos((start.month - 6) / 6 * math.pi)) * rng.uniform(0.9, 1.1)
+        add(min(8 + 3 * i, last), -round(amount, 2), 'Expense', 'Utilities', name)
+    if rng.random() < 0.08:
+        add(rng.randint(10, 25), round(rng.uniform(2000, 20000), -2), 'Income', 'Freelance', 'Freelance Payment')
+    return rows
+
+def _day_weights(first_day, last_day):
+    span = (last_day - first_day).days or 1
+    return [WEEKDAY_WEIGHT[d.weekday()] * (1 + ANNUAL_GROWTH) ** (i / 365.0)
+            for i, d in enumerate(first_day + timedelta(days=n) for n in range(span + 1))]
+
+def _split(total, weights):
+    # Integer shares of total proportional to weights that add up exactly to total
+    cumulative, running, counts, done = sum(weights), 0.0, [], 0
+    for w in weights:
+        running += w
+        upto = round(total * running / cumulative)
+        counts.append(upto - done)
+        done = upto
+    return counts
+
+def _spending_rows(rng, user, accounts, days, count):
+    user_id, profile = user
+    categories = list(SPENDING)
+    shares = [SPENDING[c][0] for c in categories]
+    rows = []
+    for _ in range(count):
+        category = rng.choices(categories, shares)[0]
+        _, median, spread, merchants = SPENDING[category]
+        cents = round(rng.lognormvariate(math.log(median * profile['spend_scale']), spread) * 100)
+        account = rng.choices(accounts, profile['account_weights'])[0]
+        rows.append((user_id, account, rng.choice(days).isoformat(), -max(cents, 100), 'Expense', category, rng.choice(merchants), ''))
+    return rows
+
+def _expected_spend(profile, purchases, category=None):
+    # Mean monthly day-to-day spending for `purchases` purchases (log-normal mean = median * e^(spread^2 / 2))
+    categories = [category] if category else SPENDING
+    return sum(purchases * SPENDING[c][0] * SPENDING[c][1] * profile['spend_scale'] * math.exp(SPENDING[c][2] ** 2 / 2) for c in categories)
+
+def generate(path, users=1, accounts=1, transactions=100_000, years=5, seed=42, end=None):
+    # Creates (or extends) the database at path and returns the new user_ids.
+    # `transactions` is the exact total across all users, salaries and bills included.
+    db.close_connections()
+    db.DB_NAME = path
+    db.initialize_database()
+    rng = random.Random(seed)
+    last_day = end or date.today()
+    first_day = last_day - timedelta(days=int(years * 365))
+    months = list(_months(first_day, last_day))
+
+    people = []
+    for i in range(users):
+        profile = _profile(rng, i, accounts)
+        ok, message = db.register_user(profile['username'], 'password', 'pizza')
+        if not ok: raise ValueError(f"{profile['username']}: {message}")
+        user_id = db.get_users([profile['username']])[0]['user_id']
+        with db.transaction() as conn:
+            for name, kind in ACCOUNT_TYPES[1:accounts]:
+                conn.execute("INSERT INTO accounts (user_id, account_name, account_type, current_balance) VALUES (?, ?, ?, 0)", (user_id, name, kind))
+        account_ids = [a['account_id'] for a in db.get_accounts(user_id)][:accounts]
+        people.append(((user_id, profile), account_ids))
+
+    # Purchases per user and month, and salaries large enough to pay for them
+    purchases = max(transactions - users * len(months) * (len(UTILITIES) + 2), 0) / max(users * len(months), 1)
+    for (_, profile), _ in people:
+        profile['salary'] = max(profile['salary'], round((_expected_spend(profile, purchases) + profile['rent']) / 0.85, -2))
+    fixed = [[_fixed_rows(rng, user, account_ids, start, stop) for user, account_ids in people] for start, stop in months]
+    fixed_total = sum(len(r) for month in fixed for r in month)
+
+    weights = _day_weights(first_day, last_day)
+    month_weights, offset = [], 0
+    for start, stop in months:
+        n = (stop - start).days + 1
+        month_weights.append(sum(weights[offset:offset + n]))
+        offset += n
+    per_month = _split(max(transactions - fixed_total, 0), month_weights)
+
+    def rows():
+        produced = 0
+        for (start, stop), month_fixed, spending in zip(months, fixed, per_month):
+            days = [start + timedelta(days=n) for n in range((stop - start).days + 1)]
+            shares = _split(spending, [profile['spend_scale'] for (_, profile), _ in people])
+            for (user, account_ids), user_fixed, share in zip(people, month_fixed, shares):
+                month_rows = user_fixed + _spending_rows(rng, user, account_ids, days, share)
+                month_rows.sort(key=lambda r: r[2])
+                for row in month_rows:
+                    if produced == transactions: return
+                    produced += 1
+                    yield row
+
+    with db.transaction() as conn, db.suspended_search_index(conn):
+        conn.executemany("INSERT INTO transactions (user_id, account_id, date, amount, type, category, description, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows())
+        for (user_id, _), _ in people:
+            conn.execute("""UPDATE accounts SET current_balance = (SELECT COALESCE(SUM(amount), 0) FROM transactions t WHERE t.account_id = accounts.account_id)
+                            WHERE user_id = ?""", (user_id,))
+            db.rebuild_monthly_totals(user_id, conn)
+            db.rebuild_balance_checkpoints(user_id, conn)
+
+    # Budgets for the last month, a little above what the user is expected to spend
+    for (user_id, profile), _ in people:
+        db.set_monthly_budget(user_id, last_day.month, last_day.year, db.to_cents(round(_expected_spend(profile, purchases) * 1.1 + profile['rent'], -2)))
+        for category in ('Groceries', 'Food', 'Transport', 'Shopping', 'Entertainment'):
+            budget = _expected_spend(profile, purchases, category) * 1.1
+            db.set_category_budget(user_id, category, db.to_cents(max(round(budget, -2), 100)), last_day.month, last_day.year)
+    return [user_id for (user_id, _), _ in people]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Financify database")
+    parser.add_argument('--db', required=True, help="output database (created or extended)")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=2, choices=range(1, len(ACCOUNT_TYPES) + 1), help="accounts per user")
+    parser.add_argument('--transactions', type=int, default=100_000, help="total across all users")
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    user_ids = generate(os.path.abspath(args.db), args.users, args.accounts, args.transactions, args.years, args.seed)
+    print(f"{len(user_ids)} users, {args.transactions:,} transactions in {time.perf_counter() - start:.1f}s -> {args.db}")
+    db.close_connections()
+
+if __name__ == '__main__':
+    main()
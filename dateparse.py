@@ -0,0 +1,99 @@
+import re
+
+# Date normalization for statement imports. A file's format is detected once from a sample
+# of its date column, then values are parsed with that format's precompiled pattern: no
+# strptime, and no exception per miss. Values that do not fit the detected format fall back
+# to the other FORMATS in order, so files that mix formats still import. Results are
+# memoized per parser; statements repeat the same few hundred dates, so most rows cost one
+# dict lookup.
+#
+# DD/MM vs MM/DD: a sample whose days and months are all <= 12 fits both. The earlier of
+# FORMATS wins (MM/DD, as before) and the parser is flagged ambiguous so callers can warn.
+
+FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%y']
+SAMPLE_SIZE = 1000     # distinct values looked at by detect_format
+CACHE_LIMIT = 100_000  # memoized values per parser before the cache starts over
+
+_FIELDS = {'%Y': r'(\d{4})', '%y': r'(\d{2})', '%m': r'(\d{1,2})', '%d': r'(\d{1,2})'}
+_DAYS_IN_MONTH = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def _compile(fmt):
+    # Function from a stripped string to 'YYYY-MM-DD' or None, accepting what strptime(fmt) accepts
+    fields = re.findall(r'%(\w)', fmt)
+    pattern = re.escape(fmt)
+    for field, group in _FIELDS.items():
+        pattern = pattern.replace(field, group)
+    match = re.compile(pattern, re.ASCII).fullmatch
+    short_year = 'y' in fields
+    year_at, month_at, day_at = fields.index('y' if short_year else 'Y'), fields.index('m'), fields.index('d')
+
+    def parse(value):
+        found = match(value)
+        if found is None: return None
+        groups = found.groups()
+        year, month, day = int(groups[year_at]), int(groups[month_at]), int(groups[day_at])
+        if short_year: year += 1900 if year >= 69 else 2000
+        if not (1 <= month <= 12 and 1 <= day <= _DAYS_IN_MONTH[month - 1]) or year == 0: return None
+        if month == 2 and day == 29 and (year % 4 or (year % 100 == 0 and year % 400)): return None
+        return f"{year:04d}-{month:02d}-{day:02d}"
+    return parse
+
+_PARSERS = {fmt: _compile(fmt) for fmt in FORMATS}
+
+def detect_format(values, sample_size=SAMPLE_SIZE):
+    # (format, ambiguous) for the format that parses the most of a sample of values.
+    # Ambiguous when another format parses just as many and reads some of the same values differently.
+    sample = []
+    for value in dict.fromkeys(v.strip() for v in values if v):
+        if value: sample.append(value)
+        if len(sample) == sample_size: break
+    results = {fmt: [parse(v) for v in sample] for fmt, parse in _PARSERS.items()}
+    hits = {fmt: len(sample) - parsed.count(None) for fmt, parsed in results.items()}
+    best = max(FORMATS, key=lambda fmt: (hits[fmt], -FORMATS.index(fmt)))
+    if not hits[best]: return None, False
+    return best, any(hits[fmt] == hits[best] and any(a and b and a != b for a, b in zip(results[fmt], results[best]))
+                     for fmt in FORMATS if fmt != best)
+
+def parse_date(value, fmt=None):
+    # 'YYYY-MM-DD' for fmt (or the first of FORMATS that fits), None if nothing fits
+    value = value.strip()
+    if fmt:
+        parsed = _PARSERS[fmt](value)
+        if parsed: return parsed
+    for other, parse in _PARSERS.items():
+        if other != fmt:
+            parsed = parse(value)
+            if parsed: return parsed
+    return None
+
+class DateParser:
+    # One per file. The format is detected from the first values given to ParseMany
+    # unless it is passed in.
+    def __init__(self, fmt=None):
+        self.format = fmt
+        self.ambiguous = False
+        self.cache = {}
+
+    def Detect(self, values):
+        self.format, self.ambiguous = detect_format(values)
+        self.cache.clear()
+
+    def Parse(self, value):
+        try: return self.cache[value]
+        except KeyError: pass
+        if len(self.cache) >= CACHE_LIMIT: self.cache.clear()
+        parsed = self.cache[value] = parse_date(value, self.format)
+        return parsed
+
+    def ParseMany(self, values):
+        # Whole column at once: each distinct value is parsed once, then mapped back
+        if self.format is None: self.Detect(values)
+        cache = self.cache
+        missing = set(values).difference(cache)
+        if len(cache) + len(missing) > CACHE_LIMIT:
+            cache.clear()
+            missing = set(values)
+        fmt = self.format
+        for value in missing:
+            cache[value] = parse_date(value, fmt)
+        return list(map(cache.__getitem__, values))
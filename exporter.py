@@ -0,0 +1,46 @@
+import csv
+import gzip
+import html
+from datetime import datetime
+
+import database as db
+
+# Streaming CSV/HTML export. Rows come from database.iter_transaction_batches and are
+# written one batch at a time, so memory stays flat regardless of history size.
+# Paths ending in .gz are gzip-compressed unless compress is given explicitly.
+# Amounts are written in major units ("-250.00"), converted from the stored cents.
+
+CSV_FIELDS = ['transaction_id', 'date', 'type', 'amount', 'category', 'description', 'account_name', 'account_id']
+
+def _open_output(path, compress):
+    if compress is None: compress = path.endswith('.gz')
+    if compress: return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+def export_csv(user_id, path, start_date=None, end_date=None, trans_type=None, compress=None):
+    count = 0
+    with _open_output(path, compress) as f:
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDS)
+        amount = CSV_FIELDS.index('amount')
+        for batch in db.iter_transaction_batches(user_id, start_date, end_date, trans_type):
+            w.writerows([*r[:amount], db.format_money(r[amount]), *r[amount + 1:]] for r in batch)
+            count += len(batch)
+    return count
+
+def export_html(user_id, path, start_date=None, end_date=None, trans_type=None, compress=None):
+    count = 0
+    with _open_output(path, compress) as f:
+        f.write("<html><body style='font-family: sans-serif; padding: 20px;'>"
+                "<h1 style='color: #2C3E50;'>Financify Transaction Report</h1>"
+                f"<p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>"
+                "<table border='1' cellspacing='0' cellpadding='8' style='width:100%; border-collapse: collapse;'>"
+                "<tr style='background-color: #ECF0F1;'><th>Date</th><th>Type</th><th>Amount</th><th>Category</th><th>Description</th></tr>")
+        for batch in db.iter_transaction_batches(user_id, start_date, end_date, trans_type):
+            f.write(''.join(
+                f"<tr><td>{r['date']}</td><td>{r['type']}</td><td style='color:{'green' if r['type'] == 'Income' else 'red'}; font-weight:bold;'>{db.format_money(r['amount'])}</td>"
+                f"<td>{html.escape(r['category'])}</td><td>{html.escape(r['description'] or '')}</td></tr>"
+                for r in batch))
+            count += len(batch)
+        f.write("</table></body></html>")
+    return count
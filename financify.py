@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import Future
+from datetime import datetime
+
+import database as db
+import dateparse
+import exporter
+import instrumentation
+
+# UI-free service layer over database.py, shared by the wx app and the command line.
+# Validation errors raise ValueError with a message fit to show the user.
+# Amounts go in as major units (what people type) and come out of summary() and the CLI as
+# major units; everything in between is integer cents.
+#
+# Usage: python financify.py [--db PATH] <command> (--user NAME [NAME ...] | --all-users) [options]
+#        python financify.py summary --all-users --month 3 --year 2025
+#        python financify.py import --user alice --file statements/{username}.csv
+#        python financify.py import --user alice --file statements/alice/ [--workers 4]
+#        python financify.py export --all-users --out nightly/{username}.csv.gz
+#        python financify.py report --user alice --out alice.html --start 2025-01-01
+#        python financify.py budget --user alice --amount 20000 [--category Food] [--delete]
+#        python financify.py trend --user alice --start 2021-01-01 [--window 30]
+# Prints one JSON object per user (JSON Lines) and exits 1 if any user failed.
+
+# --- SERVICES ---
+
+def parse_amount(value, allow_zero=False):
+    # Major units in, cents out
+    try: amount = db.to_cents(value)
+    except ValueError: raise ValueError("Amount must be a number.")
+    if amount < 0 or (amount == 0 and not allow_zero): raise ValueError("Amount must be greater than 0.")
+    return amount
+
+def default_account_id(user_id):
+    db.check_and_create_default_account(user_id)
+    return db.get_accounts(user_id)[0]['account_id']
+
+def _check_account(user_id, account_id):
+    if account_id is None: return default_account_id(user_id)
+    if account_id not in {a['account_id'] for a in db.get_accounts(user_id)}: raise ValueError("Unknown account.")
+    return account_id
+
+def _transaction_fields(date, amount, trans_type, category, description):
+    d_str = dateparse.parse_date(date or '')
+    if d_str is None: raise ValueError("Date must be YYYY-MM-DD.")
+    if trans_type not in ('Income', 'Expense'): raise ValueError("Type must be Income or Expense.")
+    return d_str, parse_amount(amount), trans_type, category or 'Other', description or ''
+
+def add_transaction(user_id, date, amount, trans_type, category='Other', description='', account_id=None):
+    fields = _transaction_fields(date, amount, trans_type, category, description)
+    ok, message, transaction_id = db.add_transaction(user_id, _check_account(user_id, account_id), *fields, "")
+    if not ok: raise ValueError(message)
+    return {'transaction_id': transaction_id}
+
+def queue_transaction(user_id, date, amount, trans_type, category='Other', description='', account_id=None, write_queue=None):
+    # Like add_transaction, but committed by the group-commit queue: returns a Future of {'transaction_id': ...}
+    fields = _transaction_fields(date, amount, trans_type, category, description)
+    account_id = _check_account(user_id, account_id)
+    future, result = (write_queue or db.get_write_queue()).AddTransaction(user_id, account_id, *fields, ""), Future()
+    def done(f):
+        if f.exception(): result.set_exception(f.exception())
+        else: result.set_result({'transaction_id': f.result()})
+    future.add_done_callback(done)
+    return result
+
+def update_transaction(user_id, transaction_id, date, amount, trans_type, category='Other', description='', account_id=None):
+    # LookupError if the user has no such transaction
+    existing = db.get_transaction(user_id, transaction_id)
+    if existing is None: raise LookupError("Transaction not found.")
+    d_str, amount, trans_type, category, description = _transaction_fields(date, amount, trans_type, category, description)
+    account_id = existing['account_id'] if account_id is None else _check_account(user_id, account_id)
+    ok, message = db.update_transaction(transaction_id, user_id, {'date': d_str, 'amount': amount, 'type': trans_type, 'category': category,
+                                                                  'description': description, 'account_id': account_id})
+    if not ok: raise ValueError(message)
+    return {'transaction_id': transaction_id}
+
+def delete_transaction(user_id, transaction_id):
+    ok, message = db.delete_transaction(transaction_id, user_id)
+    if not ok: raise LookupError("Transaction not found.") if message == "Not found" else ValueError(message)
+    return {'transaction_id': transaction_id, 'deleted': True}
+
+def import_csv(user_id, path, account_id=None, progress=None):
+    if not os.path.isfile(path): raise ValueError(f"File not found: {path}")
+    account_id = _check_account(user_id, account_id)
+    return db.import_transactions_csv(user_id, account_id, path, progress=progress)
+
+def statement_files(paths):
+    # Folders stand for the .csv files directly inside them
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.csv'))
+        elif os.path.isfile(path): files.append(path)
+        else: raise ValueError(f"File not found: {path}")
+    if not files: raise ValueError("No CSV files to import.")
+    return files
+
+def import_files(user_id, paths, account_id=None, workers=None, progress=None):
+    # Several statements (or folders of them) at once, parsed in parallel; see ingest.py
+    import ingest
+    files = statement_files(paths)
+    account_id = _check_account(user_id, account_id)
+    return ingest.ingest_files(user_id, account_id, files, workers, progress)
+
+def export_transactions(user_id, path, start_date=None, end_date=None, trans_type=None, compress=None):
+    rows = exporter.export_csv(user_id, path, start_date, end_date, trans_type, compress)
+    return {'path': os.path.abspath(path), 'rows': rows}
+
+def generate_report(user_id, path="report.html", start_date=None, end_date=None, trans_type=None):
+    rows = exporter.export_html(user_id, path, start_date, end_date, trans_type)
+    return {'path': os.path.abspath(path), 'rows': rows}
+
+def set_budget(user_id, amount, month, year, category=None):
+    # category=None sets the overall monthly budget
+    amount = parse_amount(amount, allow_zero=category is None)
+    if category is None: db.set_monthly_budget(user_id, month, year, amount)
+    else: db.set_category_budget(user_id, category, amount, month, year)
+    return {'category': category, 'amount': db.from_cents(amount), 'month': month, 'year': year}
+
+def delete_budget(user_id, category, month, year):
+    db.delete_category_budget(user_id, category, month, year)
+    return {'category': category, 'deleted': True, 'month': month, 'year': year}
+
+def summary(user_id, month, year):
+    money = db.from_cents
+    numbers = {key: money(value) for key, value in db.get_dashboard_numbers(user_id, month, year).items()}
+    return {'month': month, 'year': year, **numbers,
+            'expenses_by_category': {r['category']: money(r['total']) for r in db.get_expense_data_for_pie_chart(user_id, month, year)},
+            'category_budgets': [{'category': r['category'], 'budget': money(r['budget']), 'spent': money(r['spent'])}
+                                 for r in db.get_category_budgets_with_spending(user_id, month, year)],
+            'accounts': [{'account_id': r['account_id'], 'account_name': r['account_name'], 'current_balance': money(r['current_balance'])}
+                         for r in db.get_accounts(user_id)]}
+
+def trend(user_id, start=None, end=None, window=30):
+    # Multi-year report from the user's columnar history
+    import analytics  # numpy is only needed here
+    history = analytics.get_history(user_id)
+    money = db.from_cents
+    monthly = history.MonthlyTotals(start, end)
+    rolling = history.RollingTotals(window, 'Expense', start, end)
+    peak = max(range(len(rolling['totals'])), key=rolling['totals'].__getitem__, default=None)
+    return {'transactions': len(history), 'start': start, 'end': end,
+            'monthly': [{'month': m, 'income': money(i), 'expense': money(e), 'net': money(n)}
+                        for m, i, e, n in zip(monthly['months'], monthly['income'], monthly['expense'], monthly['net'])],
+            'expenses_by_category': {c: money(total) for c, total in history.CategoryTotals('Expense', start, end)},
+            'expenses_by_weekday': dict(zip(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], map(money, history.WeekdayTotals('Expense', start, end)))),
+            'rolling_expense': {'window_days': window,
+                                'latest': money(rolling['totals'][-1]) if rolling['totals'] else 0,
+                                'peak': money(rolling['totals'][peak]) if peak is not None else 0,
+                                'peak_day': rolling['days'][peak] if peak is not None else None}}
+
+# --- COMMAND LINE ---
+
+def _user_path(template, username):
+    # One file per user when running for several: --out exports/{username}.csv
+    return template.format(username=username)
+
+def _run_command(args, user_id, username):
+    if args.command == 'summary':
+        return summary(user_id, args.month, args.year)
+    if args.command == 'import':
+        paths = [_user_path(path, username) for path in args.file]
+        if len(paths) == 1 and not os.path.isdir(paths[0]): return import_csv(user_id, paths[0])
+        return import_files(user_id, paths, workers=args.workers)
+    if args.command == 'export':
+        return export_transactions(user_id, _user_path(args.out, username), args.start, args.end, args.type)
+    if args.command == 'report':
+        return generate_report(user_id, _user_path(args.out, username), args.start, args.end, args.type)
+    if args.command == 'trend':
+        return trend(user_id, args.start, args.end, args.window)
+    if args.command == 'budget':
+        if args.delete:
+            if not args.category: raise ValueError("--delete needs --category")
+            return delete_budget(user_id, args.category, args.month, args.year)
+        return set_budget(user_id, args.amount, args.month, args.year, args.category)
+
+def run(args, out=sys.stdout):
+    if args.db: db.DB_NAME = os.path.abspath(args.db)
+    db.initialize_database()
+    users = db.get_users(None if args.all_users else args.user)
+    missing = set(args.user or ()) - {u['username'] for u in users}
+    failures = 0
+    for name in sorted(missing):
+        out.write(json.dumps({'user': name, 'ok': False, 'error': "Unknown user"}) + "\n")
+        failures += 1
+    if len(users) > 1:
+        for option in ('file', 'out'):
+            values = getattr(args, option, None) or []
+            if any('{username}' not in value for value in ([values] if isinstance(values, str) else values)):
+                raise SystemExit(f"--{option} needs a {{username}} placeholder when running for several users")
+    for user in users:
+        record = {'user': user['username'], 'user_id': user['user_id'], 'command': args.command}
+        try:
+            record.update(ok=True, result=_run_command(args, user['user_id'], user['username']))
+        except (ValueError, OSError) as e:
+            record.update(ok=False, error=str(e))
+            failures += 1
+        out.write(json.dumps(record, default=str) + "\n")
+        out.flush()
+    return 1 if failures else 0
+
+def build_parser():
+    today = datetime.now()
+    parser = argparse.ArgumentParser(prog="financify", description="Batch operations on the Financify database.")
+    parser.add_argument('--db', help="database file (default: financify.db next to this script)")
+    common = argparse.ArgumentParser(add_help=False)
+    who = common.add_mutually_exclusive_group(required=True)
+    who.add_argument('--user', nargs='+', metavar='NAME')
+    who.add_argument('--all-users', action='store_true')
+    period = argparse.ArgumentParser(add_help=False)
+    period.add_argument('--month', type=int, choices=range(1, 13), default=today.month)
+    period.add_argument('--year', type=int, default=today.year)
+    span = argparse.ArgumentParser(add_help=False)
+    span.add_argument('--start', help="first date, YYYY-MM-DD")
+    span.add_argument('--end', help="last date, YYYY-MM-DD")
+    span.add_argument('--type', choices=['Income', 'Expense'])
+
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('summary', parents=[common, period], help="month totals, category spending and budgets")
+    p = sub.add_parser('import', parents=[common], help="bulk-import CSVs (or folders of them) into the user's first account")
+    p.add_argument('--file', required=True, nargs='+')
+    p.add_argument('--workers', type=int, help="parser processes for several files (default: one per core)")
+    p = sub.add_parser('export', parents=[common, span], help="stream transactions to CSV (.gz compresses)")
+    p.add_argument('--out', required=True)
+    p = sub.add_parser('report', parents=[common, span], help="write the HTML transaction report")
+    p.add_argument('--out', default="report.html")
+    p = sub.add_parser('trend', parents=[common], help="monthly, category, weekday and rolling spending over the whole history")
+    p.add_argument('--start', help="first date, YYYY-MM-DD")
+    p.add_argument('--end', help="last date, YYYY-MM-DD")
+    p.add_argument('--window', type=int, default=30, help="days in the rolling expense total")
+    p = sub.add_parser('budget', parents=[common, period], help="set the monthly or a category budget")
+    p.add_argument('--amount')
+    p.add_argument('--category', help="omit to set the overall monthly budget")
+    p.add_argument('--delete', action='store_true', help="remove the category budget instead")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'budget' and not args.delete and args.amount is None:
+        build_parser().error("budget needs --amount (or --delete)")
+    instrumentation.enable_from_env()
+    try:
+        return run(args)
+    finally:
+        db.close_connections()
+
+if __name__ == '__main__':
+    sys.exit(main())
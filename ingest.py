@@ -0,0 +1,114 @@
+import csv
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import database as db
+import dateparse
+
+# Multi-file statement import. A process pool parses, date-normalizes and validates the
+# files (database.read_import_file, one file per worker at a time) and sends the parsed
+# chunks back over a bounded queue, so parsers that get ahead wait for the writer instead
+# of piling rows up in memory. The calling process is the only writer: it deduplicates the
+# rows like import_transactions_csv and commits every BATCH_ROWS rows, across files.
+#
+# Batches are committed as they fill, so a file that fails part way (or a cancelled run)
+# keeps the rows committed before that point; importing it again skips them as duplicates.
+# Throughput grows with workers until the writer saturates; see `benchmark.py ingest`.
+
+BATCH_ROWS = 50_000   # rows per write transaction
+QUEUE_CHUNKS = 4      # parsed chunks waiting for the writer, per worker
+POLL_SECONDS = 0.5
+MP_CONTEXT = 'spawn'  # never fork the UI process with its threads and open connections
+
+_out = None
+_cancelled = None
+
+def _init_worker(out, cancelled):
+    global _out, _cancelled
+    _out, _cancelled = out, cancelled
+    out.cancel_join_thread()  # a cancelled run may leave chunks nobody reads
+
+def _parse_file(index, path, chunk_size):
+    dates = dateparse.DateParser()
+    try:
+        for parsed, read, rejected, fraction in db.read_import_file(path, chunk_size, dates):
+            if _cancelled.is_set(): return
+            _out.put(('rows', index, parsed, read, rejected, fraction))
+        _out.put(('done', index, None, dates.format, dates.ambiguous))
+    except (OSError, ValueError, csv.Error) as e:
+        _out.put(('error', index, str(e)))
+
+def ingest_files(user_id, account_id, paths, workers=None, progress=None, chunk_size=db.IMPORT_CHUNK_SIZE, batch_rows=BATCH_ROWS):
+    # progress(index, rows_read, fraction) is called for every parsed chunk of paths[index];
+    # returning False stops the run and drops the batch that was not committed yet.
+    # Returns the totals and a report per file ('error' is None for files read to the end).
+    started = time.perf_counter()
+    if account_id not in {a['account_id'] for a in db.get_accounts(user_id)}: raise ValueError("Account error")
+    files = [{'path': path, 'rows': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0, 'error': None,
+              'date_format': None, 'ambiguous_dates': False} for path in paths]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    writer = db.ImportWriter(user_id, account_id)
+    cancelled = False
+
+    def commit(batch):
+        with db.transaction() as conn:
+            for index, parsed in batch:
+                imported, duplicates = writer.Add(conn, parsed)
+                files[index]['imported'] += imported
+                files[index]['duplicates'] += duplicates
+            writer.Flush(conn)
+
+    if paths:
+        ctx = multiprocessing.get_context(MP_CONTEXT)
+        out, stop = ctx.Queue(QUEUE_CHUNKS * workers), ctx.Event()
+        pool = ProcessPoolExecutor(workers, ctx, _init_worker, (out, stop))
+        futures = {pool.submit(_parse_file, index, path, chunk_size): index for index, path in enumerate(paths)}
+        reading = set(range(len(paths)))
+        batch, batch_size = [], 0
+        try:
+            while reading:
+                try: message = out.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    # A worker that died never reports back
+                    for future, index in futures.items():
+                        if index in reading and future.done() and future.exception():
+                            files[index]['error'] = f"Parser failed: {future.exception()!r}"
+                            reading.discard(index)
+                    continue
+                kind, index = message[0], message[1]
+                if index not in reading: continue
+                if kind == 'rows':
+                    _, _, parsed, read, rejected, fraction = message
+                    files[index]['rows'] += read
+                    files[index]['rejected'] += rejected
+                    batch.append((index, parsed))
+                    batch_size += len(parsed)
+                    if progress and progress(index, files[index]['rows'], fraction) is False:
+                        cancelled = True
+                        break
+                else:
+                    files[index]['error'] = message[2]
+                    if kind == 'done': files[index]['date_format'], files[index]['ambiguous_dates'] = message[3:]
+                    reading.discard(index)
+                if batch_size >= batch_rows:
+                    commit(batch)
+                    batch, batch_size = [], 0
+            if batch and not cancelled: commit(batch)
+        finally:
+            # Stop the parsers and keep reading until they have all let go of the queue
+            stop.set()
+            for future in futures: future.cancel()
+            while not all(future.done() for future in futures):
+                try: out.get(timeout=0.05)
+                except queue.Empty: pass
+            pool.shutdown()
+
+    seconds = round(time.perf_counter() - started, 3)
+    rows = sum(f['rows'] for f in files)
+    return {'files': files, 'rows': rows, 'imported': sum(f['imported'] for f in files),
+            'duplicates': sum(f['duplicates'] for f in files), 'rejected': sum(f['rejected'] for f in files),
+            'failed': sum(1 for f in files if f['error']), 'ambiguous_dates': sum(1 for f in files if f['ambiguous_dates']),
+            'cancelled': cancelled, 'workers': workers, 'seconds': seconds, 'rows_per_sec': round(rows / seconds) if seconds else rows}
@@ -0,0 +1,310 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import database as db
+
+# Opt-in query instrumentation for database.py.
+# Enable it with FINANCIFY_INSTRUMENT=1 (see enable_from_env) or by calling enable()
+# before any connection is opened. When it is off, nothing here is installed and the
+# pooled connections are plain sqlite3.Connection objects.
+#
+# While enabled:
+#   - connections are InstrumentedConnection. Every statement is timed from execute()
+#     until its cursor is exhausted, re-executed or closed, so fetch time and row counts
+#     are included.
+#   - commit() and rollback() are timed as COMMIT / ROLLBACK statements, so fsync cost shows up.
+#   - the public database.py functions are wrapped, timed and used to attribute statements.
+#   - statements slower than FINANCIFY_SLOW_MS (default 50) go to a bounded slow-query log
+#     with their EXPLAIN QUERY PLAN.
+# snapshot() returns everything as a JSON-ready dict, dump() writes it to a file, and
+# FINANCIFY_INSTRUMENT_OUT=path dumps at exit.
+# The progress handler is left alone: QueryExecutor uses it to interrupt stale queries.
+
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOW_LOG_SIZE = 200
+# Plumbing that runs for every call, or returns context managers / plain values
+SKIP_FUNCTIONS = {'get_connection', 'close_connections', 'connection', 'transaction', 'suspended_search_index',
+                  'hash_data', 'verify_hash', 'month_range', 'smart_date_parse', 'read_import_file'}
+
+_lock = threading.Lock()
+_local = threading.local()
+_state = {'enabled': False, 'slow_ms': 50.0, 'since': None}
+_functions = {}
+_statements = {}
+_slow = deque(maxlen=SLOW_LOG_SIZE)
+_plans = {}
+_originals = {}
+
+class LatencyStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.functions = set()  # statements only: the database.py functions that ran them
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def Add(self, ms, rows=0, error=False):
+        self.calls += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        self.errors += error
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]: i += 1
+        self.buckets[i] += 1
+
+    def Percentile(self, q):
+        # Upper bound of the bucket holding the q-th sample (the max for the open-ended one)
+        target, seen = q * self.calls, 0
+        for bound, count in zip(BUCKETS_MS + (self.max_ms,), self.buckets):
+            seen += count
+            if seen >= target: return min(bound, self.max_ms)
+        return self.max_ms
+
+    def ToDict(self):
+        return {'calls': self.calls, 'total_ms': round(self.total_ms, 3), 'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+                'p50_ms': round(self.Percentile(0.5), 3), 'p95_ms': round(self.Percentile(0.95), 3), 'max_ms': round(self.max_ms, 3),
+                'rows': self.rows, 'errors': self.errors,
+                'histogram': {f"<={b}" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}": n
+                              for i, (b, n) in enumerate(zip(BUCKETS_MS + (None,), self.buckets)) if n}}
+
+def normalize_sql(sql):
+    # One entry per statement shape: whitespace collapsed, IN (?, ?, ...) lists folded
+    sql = ' '.join(sql.split())
+    return re.sub(r'\?(\s*,\s*\?)+', '?, ...', sql)
+
+def current_function():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+def _record_statement(conn, sql, params, ms, rows, error):
+    key = normalize_sql(sql)
+    function = current_function()
+    with _lock:
+        stats = _statements.get(key)
+        if stats is None: stats = _statements[key] = LatencyStats()
+        stats.Add(ms, rows, error)
+        if function: stats.functions.add(function)
+    if ms >= _state['slow_ms']:
+        _slow.append({'at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'ms': round(ms, 3), 'rows': rows, 'function': function,
+                      'thread': threading.current_thread().name, 'sql': key, 'plan': _query_plan(conn, sql, params)})
+
+def _query_plan(conn, sql, params):
+    # Captured once per statement shape, on the same connection and with the real parameters
+    key = normalize_sql(sql)
+    if key not in _plans:
+        try:
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            _plans[key] = [row[3] for row in rows]
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            _plans[key] = [f"(no plan: {e})"]
+    return _plans[key]
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _sample = None  # [sql, params, elapsed seconds, rows, error]
+
+    def execute(self, sql, parameters=()):
+        self._Finish()
+        start = time.perf_counter()
+        error = True
+        try:
+            result = super().execute(sql, parameters)
+            error = False
+            return result
+        finally:
+            self._sample = [sql, parameters, time.perf_counter() - start, 0, error]
+            if error: self._Finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._Finish()
+        start = time.perf_counter()
+        error = True
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+            error = False
+            return result
+        finally:
+            self._sample = [sql, None, time.perf_counter() - start, 0, error]
+            self._Finish()
+
+    def _Fetched(self, start, rows, exhausted):
+        sample = self._sample
+        if sample is not None:
+            sample[2] += time.perf_counter() - start
+            sample[3] += rows
+            if exhausted: self._Finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._Fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._Fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._Fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._Fetched(start, 0, True)
+            raise
+        self._Fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._Finish()
+        super().close()
+
+    def __del__(self):
+        try: self._Finish()
+        except Exception: pass  # interpreter shutdown
+
+    def _Finish(self):
+        sample, self._sample = self._sample, None
+        if sample is None: return
+        sql, params, elapsed, rows, error = sample
+        if not rows and self.rowcount > 0: rows = self.rowcount  # rows written by INSERT/UPDATE/DELETE
+        _record_statement(self.connection, sql, params if params is not None else (), elapsed * 1000, rows, error)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._Timed("COMMIT", super().commit)
+
+    def rollback(self):
+        self._Timed("ROLLBACK", super().rollback)
+
+    def _Timed(self, sql, call):
+        start, error = time.perf_counter(), True
+        try:
+            call()
+            error = False
+        finally:
+            _record_statement(self, sql, (), (time.perf_counter() - start) * 1000, 0, error)
+
+def _timed(name, fn):
+    def enter():
+        stack = _local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        return time.perf_counter()
+
+    def leave(start, error):
+        _local.stack.pop()
+        ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            _functions.setdefault(name, LatencyStats()).Add(ms, error=error)
+
+    if inspect.isgeneratorfunction(fn):
+        # Only time spent inside the generator counts, not the caller's work between batches
+        @functools.wraps(fn)
+        def timed_generator(*args, **kwargs):
+            gen, total, error = fn(*args, **kwargs), 0.0, False
+            try:
+                while True:
+                    start = enter()
+                    try: item = next(gen)
+                    except StopIteration: return
+                    except BaseException:
+                        error = True
+                        raise
+                    finally:
+                        _local.stack.pop()
+                        total += time.perf_counter() - start
+                    yield item
+            finally:
+                gen.close()
+                with _lock:
+                    _functions.setdefault(name, LatencyStats()).Add(total * 1000, error=error)
+        return timed_generator
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        start, error = enter(), True
+        try:
+            result = fn(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            leave(start, error)
+    return timed
+
+def enable(slow_ms=None):
+    # Affects connections opened from now on; call it before the first database access
+    if slow_ms is not None: _state['slow_ms'] = float(slow_ms)
+    if _state['enabled']: return
+    _state['enabled'] = True
+    _state['since'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    db.CONNECTION_FACTORY = InstrumentedConnection
+    for name, fn in list(vars(db).items()):
+        if inspect.isfunction(fn) and fn.__module__ == db.__name__ and not name.startswith('_') and name not in SKIP_FUNCTIONS:
+            _originals[name] = fn
+            setattr(db, name, _timed(name, fn))
+
+def disable():
+    if not _state['enabled']: return
+    _state['enabled'] = False
+    db.CONNECTION_FACTORY = sqlite3.Connection
+    for name, fn in _originals.items():
+        setattr(db, name, fn)
+    _originals.clear()
+
+def is_enabled():
+    return _state['enabled']
+
+def enable_from_env():
+    if os.environ.get('FINANCIFY_INSTRUMENT', '') not in ('', '0'):
+        enable(os.environ.get('FINANCIFY_SLOW_MS') or None)
+        out = os.environ.get('FINANCIFY_INSTRUMENT_OUT')
+        if out: atexit.register(dump, out)
+
+def reset():
+    with _lock:
+        _functions.clear()
+        _statements.clear()
+        _slow.clear()
+        _plans.clear()
+    _state['since'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+def snapshot():
+    with _lock:
+        statements = [{'sql': sql, 'functions': sorted(stats.functions), **stats.ToDict()} for sql, stats in _statements.items()]
+        functions = {name: stats.ToDict() for name, stats in _functions.items()}
+    statements.sort(key=lambda s: s['total_ms'], reverse=True)
+    return {'enabled': _state['enabled'], 'since': _state['since'], 'slow_ms': _state['slow_ms'],
+            'functions': dict(sorted(functions.items(), key=lambda item: item[1]['total_ms'], reverse=True)),
+            'statements': statements, 'slow_queries': list(_slow)}
+
+def dump(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, indent=2)
+    return path
@@ -1,5 +1,7 @@
 import wx
+import threading
 import database as db
+import instrumentation
 import main_app
 
 # --- COLORS ---
@@ -17,6 +19,8 @@ class LoginFrame(wx.Frame):
         # Open maximized to ensure nothing is hidden on small screens
         self.Maximize() 
         self.InitUI()
+        # Load the plotting stack while the user types, so MainFrame opens without waiting
+        threading.Thread(target=main_app.warm_imports, name="warm-imports", daemon=True).start()
 
     def InitUI(self):
         main_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -183,8 +187,10 @@ if __name__ == '__main__':
         ctypes.windll.shcore.SetProcessDpiAwareness(1)
     except: pass
 
+    instrumentation.enable_from_env()
     db.initialize_database()
     app = wx.App(False)
     frame = LoginFrame()
     frame.Show()
     app.MainLoop()
+    db.close_connections()
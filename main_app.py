@@ -1,14 +1,14 @@
 import wx
 import wx.adv 
 import database as db
-from datetime import datetime
-import matplotlib
-matplotlib.use('WXAgg')
-from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
-from matplotlib.figure import Figure
-import csv 
+import financify
+import charts
+import instrumentation
+from query_executor import QueryExecutor
+from datetime import datetime, timedelta
 import os
 import webbrowser
+from collections import OrderedDict
 
 CATEGORIES = ['Food', 'Transport', 'Rent', 'Utilities', 'Salary', 'Entertainment', 'Shopping', 'Health', 'Education', 'Groceries', 'Other']
 
@@ -21,12 +21,21 @@ COLOR_GREEN = '#27AE60'
 COLOR_RED = '#C0392B'
 COLOR_REMAINING = '#BDC3C7'
 
-def smart_date_parse(date_str):
-    formats = ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%y']
-    for fmt in formats:
-        try: return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
-        except ValueError: pass
-    return datetime.now().strftime('%Y-%m-%d')
+def warm_imports():
+    # matplotlib and numpy are by far the slowest imports, and only MainFrame needs them.
+    # The login window calls this on a background thread while the user types; the wx
+    # backend itself is imported on the UI thread by plotting().
+    import numpy
+    import matplotlib
+    matplotlib.use('WXAgg')
+    import matplotlib.figure
+    import matplotlib.backends.backend_agg
+
+def plotting():
+    warm_imports()
+    from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasWxAgg
 
 class MainFrame(wx.Frame):
     def __init__(self, user_id):
@@ -44,40 +53,97 @@ class MainFrame(wx.Frame):
         
         self.notebook = wx.Notebook(main_panel)
         self.notebook.SetBackgroundColour(COLOR_BG)
+        self.executor = QueryExecutor(wx.CallAfter)
+        import analytics
+        snapshot = analytics.load_snapshot(self.user_id)  # memory-mapped files only, no SQLite
         
-        self.dashboard_panel = DashboardPanel(self.notebook, self.user_id)
+        self.dashboard_panel = DashboardPanel(self.notebook, self.user_id, self.executor)
         self.notebook.AddPage(self.dashboard_panel, "Dashboard")
 
-        self.reports_panel = ReportsPanel(self.notebook, self.user_id)
+        self.reports_panel = ReportsPanel(self.notebook, self.user_id, self.executor)
         self.notebook.AddPage(self.reports_panel, "Reports")
         
         sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(self.notebook, 1, wx.EXPAND | wx.ALL, 15)
         main_panel.SetSizer(sizer)
         
+        self.scheduler = RefreshScheduler(self.notebook, self.user_id)
         self.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnTabChanged)
-        self.dashboard_panel.RefreshData()
+        self.Bind(wx.EVT_ACTIVATE, self.OnActivate)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        # Hidden diagnostics: Ctrl+Shift+D
+        diagnostics_id = wx.NewIdRef()
+        self.Bind(wx.EVT_MENU, self.OnDiagnostics, id=diagnostics_id)
+        self.SetAcceleratorTable(wx.AcceleratorTable([(wx.ACCEL_CTRL | wx.ACCEL_SHIFT, ord('D'), diagnostics_id)]))
+        # Nothing above has queried the database: the panels fill in from the first refresh
+        if snapshot is not None: self.ShowSnapshot(snapshot)
+        self.scheduler.RefreshPage(self.dashboard_panel)
         self.Show()
 
+    def ShowSnapshot(self, history):
+        # Cold start: draw the charts from last session's memory-mapped snapshot, without
+        # waiting for SQLite; the first refresh replaces them with live numbers
+        today = datetime.now()
+        self.dashboard_panel.ShowPreview(history, today.month, today.year)
+        self.reports_panel.ShowPreview(history, today.month, today.year)
+
+    def OnClose(self, event):
+        self.executor.Shutdown()
+        event.Skip()
+
     def OnTabChanged(self, event):
-        current_page = self.notebook.GetCurrentPage()
-        if hasattr(current_page, "RefreshData"):
-            current_page.RefreshData()
+        # Only refreshes if the page missed changes while it was hidden
+        self.scheduler.RefreshPage(self.notebook.GetCurrentPage())
+        event.Skip()
+
+    def OnActivate(self, event):
+        # Pick up writes made elsewhere (another window, an import job) when focus returns
+        if event.GetActive(): self.scheduler.NotifyChanged()
         event.Skip()
     
-    def RefreshAllTabs(self):
-        self.dashboard_panel.RefreshData()
-        self.reports_panel.RefreshData()
+    def NotifyDataChanged(self):
+        self.scheduler.NotifyChanged()
+
+    def OnDiagnostics(self, event):
+        with DiagnosticsDialog(self) as dlg: dlg.ShowModal()
+
+class RefreshScheduler:
+    # Replaces refreshing every tab after every write. Change notifications arriving within
+    # delay_ms are coalesced into one pass that compares the user's data version with the
+    # version each page last rendered: the visible page refreshes, hidden pages stay stale
+    # and refresh once when they are shown. A page records its rendered_version when the
+    # refresh for it is applied, so a refresh that fails or is superseded is tried again.
+    def __init__(self, notebook, user_id, delay_ms=100):
+        self.notebook = notebook
+        self.user_id = user_id
+        self.delay_ms = delay_ms
+        self.pending = None
+
+    def NotifyChanged(self):
+        if self.pending is None or not self.pending.IsRunning():
+            self.pending = wx.CallLater(self.delay_ms, self.Flush)
+
+    def Flush(self):
+        self.pending = None
+        self.RefreshPage(self.notebook.GetCurrentPage())
+
+    def RefreshPage(self, page):
+        if not hasattr(page, "RefreshData"): return
+        version = db.get_data_version(self.user_id)
+        if page.rendered_version != version: page.RefreshData(version=version)
 
 class DashboardPanel(wx.Panel):
-    def __init__(self, parent, user_id):
+    def __init__(self, parent, user_id, executor):
         super().__init__(parent)
         self.user_id = user_id
+        self.executor = executor
+        self.rendered_version = None  # data version on screen, see RefreshScheduler
         self.SetBackgroundColour(COLOR_WHITE)
         self.account_map = {} 
         self.selected_category = None
+        self.projections = {}
+        self.default_account_id = None  # set by the first refresh
         self.InitUI()
-        self.LoadData()
 
     def InitUI(self):
         main_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -85,17 +151,12 @@ class DashboardPanel(wx.Panel):
         # HEADER - Shows Welcome Back Message
         header_sizer = wx.BoxSizer(wx.VERTICAL)
         
-        # Fetch username for the header
-        try:
-            uname = db.get_username(self.user_id)
-        except:
-            uname = "User"
-            
+        # The username arrives with the first refresh
         # Reduced font size from 32 to 24 to prevent cut-off
-        title = wx.StaticText(self, label=f"Welcome {uname}")
-        title.SetFont(wx.Font(24, wx.FONTFAMILY_SWISS, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
-        title.SetForegroundColour(COLOR_ACCENT)
-        header_sizer.Add(title, 0, wx.ALIGN_LEFT | wx.BOTTOM, 5)
+        self.title = wx.StaticText(self, label="Welcome")
+        self.title.SetFont(wx.Font(24, wx.FONTFAMILY_SWISS, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+        self.title.SetForegroundColour(COLOR_ACCENT)
+        header_sizer.Add(self.title, 0, wx.ALIGN_LEFT | wx.BOTTOM, 5)
         
         date_str = datetime.now().strftime("%A, %d %B %Y")
         subtitle = wx.StaticText(self, label=f"Financial Overview for {date_str}")
@@ -223,6 +284,8 @@ class DashboardPanel(wx.Panel):
         self.category_list.InsertColumn(1, "Limit", width=100)
         self.category_list.InsertColumn(2, "Spent", width=100)
         self.category_list.InsertColumn(3, "Left", width=100)
+        self.category_list.InsertColumn(4, "Projected", width=100)
+        self.category_list.InsertColumn(5, "Runs out", width=90)
         self.category_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnCategorySelected)
         layout.Add(self.category_list, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 15)
         btn_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -245,10 +308,11 @@ class DashboardPanel(wx.Panel):
         lbl.SetFont(wx.Font(14, wx.FONTFAMILY_SWISS, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
         lbl.SetForegroundColour(COLOR_TEXT_MAIN)
         layout.Add(lbl, 0, wx.ALL, 15)
+        Figure, FigureCanvas = plotting()
         self.pie_figure = Figure(figsize=(4, 3)) 
         self.pie_figure.set_facecolor(COLOR_WHITE)
-        self.pie_axes = self.pie_figure.add_subplot(111) 
         self.pie_canvas = FigureCanvas(panel, -1, self.pie_figure)
+        self.pie_chart = charts.PieChart(self.pie_figure, self.pie_canvas)
         layout.Add(self.pie_canvas, 1, wx.EXPAND | wx.ALL, 15)
         panel.SetSizer(layout)
         return panel
@@ -257,36 +321,92 @@ class DashboardPanel(wx.Panel):
         accounts = db.get_accounts(self.user_id)
         self.default_account_id = accounts[0]['account_id'] if accounts else None
 
-    def RefreshData(self):
-        self.LoadData()
+    def RefreshData(self, version=None):
+        today = datetime.now()
+        self.executor.Submit('dashboard', lambda: self.FetchData(today.month, today.year), lambda fetched: self.ApplyData(fetched, version),
+                             self.OnRefreshError)
+        self.RefreshProjections()
+
+    def RefreshProjections(self):
+        # Queued behind the dashboard, so the numbers show first and the projection columns fill in after
+        if not self: return
         today = datetime.now()
-        month, year = today.month, today.year
-        data = db.get_dashboard_numbers(self.user_id, month, year)
+        self.executor.Submit('projections', lambda: self.FetchProjections(today.month, today.year), self.ApplyProjections)
+
+    def FetchData(self, month, year):
+        # Runs on the query thread: database calls only, no wx
+        return {
+            'username': db.get_username(self.user_id),
+            'accounts': db.get_accounts(self.user_id),
+            'numbers': db.get_dashboard_numbers(self.user_id, month, year),
+            'expense_data': db.get_expense_data_for_pie_chart(self.user_id, month, year),
+            'cat_budgets': db.get_budget_state(self.user_id, month, year, verify=True),
+        }
+
+    def FetchProjections(self, month, year):
+        import analytics  # numpy is loaded by the time the dashboard refreshes
+        state = db.get_budget_state(self.user_id, month, year)
+        budgets = {r['category']: r['budget'] for r in state if r['budget'] > 0}
+        # A cold history load takes seconds: it runs on its own thread, with run-rate numbers until then
+        history = analytics.history_if_loaded(self.user_id, lambda: wx.CallAfter(self.RefreshProjections))
+        if history is None: return analytics.project_run_rate({r['category']: r['spent'] for r in state}, month, year, budgets)
+        return history.ProjectMonth(month, year, budgets)
+
+    def ApplyProjections(self, projections):
+        if not self: return
+        self.projections = projections
+        for index in range(self.category_list.GetItemCount()):
+            self.ShowProjection(index)
+
+    def ShowProjection(self, index):
+        p = self.projections.get(self.category_list.GetItemText(index, 0))
+        if p is None: return
+        self.category_list.SetItem(index, 4, f"₹{db.format_money(p['projected'])}")
+        runs_out = datetime.strptime(p['exhausted_on'], '%Y-%m-%d').strftime('%b %d') if p['exhausted_on'] else ""
+        self.category_list.SetItem(index, 5, runs_out)
+
+    def OnRefreshError(self, error):
+        if self: wx.MessageBox(f"Could not load dashboard: {error}", "Error", wx.OK | wx.ICON_ERROR)
+
+    def ApplyData(self, fetched, version=None):
+        if not self: return  # window closed while the query ran
+        self.title.SetLabel(f"Welcome {fetched['username']}")
+        accounts = fetched['accounts']
+        self.default_account_id = accounts[0]['account_id'] if accounts else None
+        data = fetched['numbers']
         
-        self.budget_ctrl.SetValue(f"{data['budget']:.2f}")
-        self.income_text.SetLabel(f"Income: ₹{data['income']:.2f}")
-        self.spent_text.SetLabel(f"Spent: ₹{data['spent']:.2f}")
-        self.remaining_text.SetLabel(f"Remaining: ₹{data['remaining']:.2f}")
-        self.net_text.SetLabel(f"Net Savings: ₹{data['net']:.2f}")
+        self.budget_ctrl.SetValue(db.format_money(data['budget']))
+        self.income_text.SetLabel(f"Income: ₹{db.format_money(data['income'])}")
+        self.spent_text.SetLabel(f"Spent: ₹{db.format_money(data['spent'])}")
+        self.remaining_text.SetLabel(f"Remaining: ₹{db.format_money(data['remaining'])}")
+        self.net_text.SetLabel(f"Net Savings: ₹{db.format_money(data['net'])}")
         
         if data['remaining'] < 0: self.remaining_text.SetForegroundColour(COLOR_RED)
         else: self.remaining_text.SetForegroundColour(COLOR_ACCENT) 
         if data['net'] < 0: self.net_text.SetForegroundColour(COLOR_RED)
         else: self.net_text.SetForegroundColour(COLOR_GREEN)
 
-        self.pie_axes.clear()
-        total_budget = data['budget']
-        expense_data = db.get_expense_data_for_pie_chart(self.user_id, month, year)
-        
+        self.DrawPie([(row['category'], row['total']) for row in fetched['expense_data']], data['budget'])
+        self.RefreshCategoryBudgets(fetched['cat_budgets'])
+        self.Layout()
+        if version is not None: self.rendered_version = version
+
+    def ShowPreview(self, history, month, year):
+        start, end = db.month_range(month, year)
+        last_day = (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        # In category order, like the rollup query, so the live refresh can move the wedges in place
+        self.DrawPie(sorted(history.CategoryTotals('Expense', start, last_day)), 0)
+
+    def DrawPie(self, expense_data, total_budget):
         labels, sizes, colors = [], [], []
         std_colors = ['#3498DB', '#E74C3C', '#2ECC71', '#F1C40F', '#9B59B6', '#E67E22', '#1ABC9C', '#34495E']
         
         total_spent = 0
-        for i, row in enumerate(expense_data):
-            labels.append(row['category'])
-            sizes.append(row['total'])
+        for i, (category, total) in enumerate(expense_data):
+            labels.append(category)
+            sizes.append(total)
             colors.append(std_colors[i % len(std_colors)])
-            total_spent += row['total']
+            total_spent += total
             
         if total_budget > 0:
             remaining = total_budget - total_spent
@@ -294,32 +414,21 @@ class DashboardPanel(wx.Panel):
                 labels.append("Remaining")
                 sizes.append(remaining)
                 colors.append(COLOR_REMAINING)
-            self.pie_axes.set_title(f'Monthly Budget: ₹{total_budget:.0f}')
-        else:
-            self.pie_axes.set_title(f'Spending Breakdown')
-
-        if not sizes:
-            self.pie_axes.text(0.5, 0.5, 'No Data', ha='center', va='center')
+            title = f'Monthly Budget: ₹{db.from_cents(total_budget):.0f}'
         else:
-            def my_autopct(pct): return '%1.1f%%' % pct if pct > 5 else '' 
-            wedges, texts, autotexts = self.pie_axes.pie(sizes, labels=None, autopct=my_autopct, startangle=90, colors=colors)
-            self.pie_axes.legend(wedges, labels, title="Categories", loc="center left", bbox_to_anchor=(0.9, 0, 0.5, 1))
+            title = 'Spending Breakdown'
 
-        self.pie_figure.tight_layout()
-        self.pie_canvas.draw()
-        self.RefreshCategoryBudgets()
-        self.Layout()
+        self.pie_chart.Update(labels, sizes, colors, title)
 
-    def RefreshCategoryBudgets(self):
+    def RefreshCategoryBudgets(self, cat_budgets):
         self.category_list.DeleteAllItems()
-        today = datetime.now()
-        cat_budgets = db.get_category_budgets_with_spending(self.user_id, today.month, today.year)
         for index, item in enumerate(cat_budgets):
             remaining = item['budget'] - item['spent']
             self.category_list.InsertItem(index, item['category'])
-            self.category_list.SetItem(index, 1, f"₹{item['budget']:.2f}")
-            self.category_list.SetItem(index, 2, f"₹{item['spent']:.2f}")
-            self.category_list.SetItem(index, 3, f"₹{remaining:.2f}")
+            self.category_list.SetItem(index, 1, f"₹{db.format_money(item['budget'])}")
+            self.category_list.SetItem(index, 2, f"₹{db.format_money(item['spent'])}")
+            self.category_list.SetItem(index, 3, f"₹{db.format_money(remaining)}")
+            self.ShowProjection(index)
             if remaining < 0: self.category_list.SetItemTextColour(index, COLOR_RED)
             else: self.category_list.SetItemTextColour(index, COLOR_ACCENT)
         self.selected_category = None
@@ -335,24 +444,27 @@ class DashboardPanel(wx.Panel):
             description = self.desc_ctrl.GetValue()
 
             if not amount_str: raise ValueError("Please enter an amount.")
-            try: amount = float(amount_str)
+            try: amount = db.to_cents(amount_str)
             except ValueError: raise ValueError("Amount must be a number.")
             if amount <= 0: raise ValueError("Amount must be greater than 0.")
             if not category: raise ValueError("Please select a category.")
 
             if trans_type == 'Expense':
-                cat_budgets = db.get_category_budgets_with_spending(self.user_id, datetime.now().month, datetime.now().year)
-                this_cat = next((item for item in cat_budgets if item['category'] == category), None)
-                if this_cat and this_cat['budget'] > 0:
-                    if (this_cat['spent'] + float(amount)) > this_cat['budget']:
+                budget, spent = db.get_category_budget(self.user_id, category, datetime.now().month, datetime.now().year)
+                if budget > 0:
+                    projected = self.projections.get(category)
+                    if (spent + amount) > budget:
                          wx.MessageBox(f"⚠️ Alert: This transaction exceeds your {category} budget!", "Budget Warning", wx.OK|wx.ICON_WARNING)
+                    elif projected and projected['projected'] + amount > budget:
+                         wx.MessageBox(f"At this pace your {category} budget will run out before the month ends.", "Budget Warning", wx.OK|wx.ICON_WARNING)
 
+            if self.default_account_id is None: self.LoadData()  # submitted before the first refresh arrived
             success, message, _ = db.add_transaction(self.user_id, self.default_account_id, date_str, amount, trans_type, category, description, tags="")
             if not success: raise Exception(message)
             
             wx.MessageBox("Transaction added successfully!", "Success", wx.OK | wx.ICON_INFORMATION)
             self.ClearForm()
-            wx.GetApp().GetTopWindow().RefreshAllTabs()
+            self.GetTopLevelParent().NotifyDataChanged()
         except Exception as e: wx.MessageBox(f"Error: {str(e)}", "Input Error", wx.OK | wx.ICON_ERROR)
 
     def ClearForm(self):
@@ -366,10 +478,8 @@ class DashboardPanel(wx.Panel):
         try:
             val = self.budget_ctrl.GetValue()
             if not val: return
-            amount = float(val)
-            if amount < 0: raise ValueError
-            db.set_monthly_budget(self.user_id, datetime.now().month, datetime.now().year, amount)
-            self.RefreshData()
+            financify.set_budget(self.user_id, val, datetime.now().month, datetime.now().year)
+            self.GetTopLevelParent().NotifyDataChanged()
         except ValueError: wx.MessageBox("Please enter a valid number for the budget.", "Error")
 
     def OnCategorySelected(self, event):
@@ -379,7 +489,7 @@ class DashboardPanel(wx.Panel):
     def OnAddEditCategory(self, event):
         today = datetime.now()
         all_cats = set(CATEGORIES)
-        current_budgets = db.get_category_budgets_with_spending(self.user_id, today.month, today.year)
+        current_budgets = db.get_budget_state(self.user_id, today.month, today.year)
         used_cats = {item['category'] for item in current_budgets}
         available_cats = [c for c in all_cats if c not in used_cats and c != 'Salary']
         available_cats.sort()
@@ -393,7 +503,7 @@ class DashboardPanel(wx.Panel):
             cat, amt = dlg.GetValues()
             if cat and amt > 0:
                 db.set_category_budget(self.user_id, cat, amt, today.month, today.year)
-                self.RefreshData()
+                self.GetTopLevelParent().NotifyDataChanged()
         dlg.Destroy()
     
     def OnDeleteCategory(self, event):
@@ -401,12 +511,14 @@ class DashboardPanel(wx.Panel):
         if wx.MessageBox(f"Remove budget limit for '{self.selected_category}'?", "Confirm Delete", wx.YES_NO | wx.ICON_QUESTION) == wx.YES:
             db.delete_category_budget(self.user_id, self.selected_category, datetime.now().month, datetime.now().year)
             wx.MessageBox(f"Budget limit for '{self.selected_category}' has been removed.\nNote: If you have existing expenses, the category will remain in the list.", "Success")
-            self.RefreshData()
+            self.GetTopLevelParent().NotifyDataChanged()
 
 class ReportsPanel(wx.Panel):
-    def __init__(self, parent, user_id):
+    def __init__(self, parent, user_id, executor):
         super().__init__(parent)
         self.user_id = user_id
+        self.executor = executor
+        self.rendered_version = None  # data version on screen, see RefreshScheduler
         self.SetBackgroundColour(COLOR_WHITE)
         self.InitUI()
 
@@ -419,6 +531,7 @@ class ReportsPanel(wx.Panel):
         self.search_ctrl = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
         self.search_ctrl.SetDescriptiveText("Search transactions...")
         self.search_ctrl.Bind(wx.EVT_TEXT_ENTER, self.OnSearch)
+        self.search_ctrl.Bind(wx.EVT_TEXT, self.OnSearch)
         self.search_ctrl.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.OnSearch)
         toolbar_sizer.Add(self.search_ctrl, 1, wx.EXPAND | wx.RIGHT, 10)
         self.import_btn = wx.Button(self, label="Import CSV")
@@ -436,66 +549,47 @@ class ReportsPanel(wx.Panel):
         toolbar_sizer.Add(self.reset_btn, 0)
         main_sizer.Add(toolbar_sizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
 
-        self.trans_list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_HRULES | wx.LC_VRULES)
-        self.trans_list.InsertColumn(0, "ID", width=0)
-        self.trans_list.InsertColumn(1, "Date", width=120)
-        self.trans_list.InsertColumn(2, "Type", width=100)
-        self.trans_list.InsertColumn(3, "Amount", width=120, format=wx.LIST_FORMAT_RIGHT)
-        self.trans_list.InsertColumn(4, "Category", width=150)
-        self.trans_list.InsertColumn(5, "Account", width=0)
-        self.trans_list.InsertColumn(6, "Description", width=300)
+        self.trans_list = TransactionListCtrl(self, TransactionPageSource(self.user_id, self.executor))
         main_sizer.Add(self.trans_list, 2, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 15)
         self.SetSizer(main_sizer)
         self.trans_list.Bind(wx.EVT_LIST_ITEM_RIGHT_CLICK, self.OnRightClickTransaction)
         self.selected_trans_id = None
+        self.SetDropTarget(StatementDropTarget(self))
 
     def CreateBarChartPanel(self, parent):
         panel = wx.Panel(parent, style=wx.BORDER_SIMPLE)
         panel.SetBackgroundColour(COLOR_WHITE)
         sizer = wx.BoxSizer(wx.VERTICAL)
+        Figure, FigureCanvas = plotting()
         self.bar_figure = Figure(figsize=(5, 2.5)) 
         self.bar_figure.set_facecolor(COLOR_WHITE)
-        self.bar_axes = self.bar_figure.add_subplot(111) 
         self.bar_canvas = FigureCanvas(panel, -1, self.bar_figure)
+        self.bar_chart = charts.BarChart(self.bar_figure, self.bar_canvas, ['Income', 'Expense'], [COLOR_GREEN, COLOR_RED],
+                                         'Income vs Expenses Trend', 'Amount (₹)')
         sizer.Add(self.bar_canvas, 1, wx.EXPAND | wx.ALL, 5)
         panel.SetSizer(sizer)
         return panel
 
-    def RefreshData(self, search_term=""):
-        bar_data = db.get_monthly_comparison_data(self.user_id)
-        self.bar_axes.clear()
-        if not bar_data: 
-            self.bar_axes.text(0.5, 0.5, 'No Data Available', ha='center')
-        else:
-            import numpy as np
-            months = [r['month'] for r in bar_data]
-            income = [r['income'] for r in bar_data]
-            expense = [r['expense'] for r in bar_data]
-            x = np.arange(len(months))
-            width = 0.35
-            self.bar_axes.bar(x - width/2, income, width, label='Income', color=COLOR_GREEN)
-            self.bar_axes.bar(x + width/2, expense, width, label='Expense', color=COLOR_RED)
-            self.bar_axes.set_ylabel('Amount (₹)')
-            self.bar_axes.set_title('Income vs Expenses Trend')
-            self.bar_axes.set_xticks(x)
-            self.bar_axes.set_xticklabels(months)
-            self.bar_axes.legend()
-            self.bar_figure.autofmt_xdate()
-        self.bar_canvas.draw()
-        
-        self.trans_list.DeleteAllItems()
-        rows = db.get_transactions_by_filter(self.user_id, search_term)
-        for i, r in enumerate(rows):
-            self.trans_list.InsertItem(i, str(r['transaction_id']))
-            self.trans_list.SetItem(i, 1, r['date'])
-            self.trans_list.SetItem(i, 2, r['type'])
-            v = f"₹{r['amount']}" if r['type']=='Expense' else f"+₹{r['amount']}"
-            self.trans_list.SetItem(i, 3, v)
-            self.trans_list.SetItem(i, 4, r['category'])
-            self.trans_list.SetItem(i, 5, r['account_name'])
-            self.trans_list.SetItem(i, 6, r['description'])
-            if r['type'] == 'Income': self.trans_list.SetItemTextColour(i, COLOR_GREEN)
-            else: self.trans_list.SetItemTextColour(i, COLOR_RED)
+    def RefreshData(self, search_term=None, version=None):
+        # Chart data and the list count load together; results of older searches are dropped
+        if search_term is None: search_term = self.search_ctrl.GetValue()
+        def fetch():
+            return db.get_monthly_comparison_data(self.user_id), search_term, db.count_transactions(self.user_id, search_term)
+        self.executor.Submit('reports', fetch, lambda fetched: self.ApplyData(fetched, version))
+
+    def ApplyData(self, fetched, version=None):
+        if not self: return
+        bar_data, search_term, count = fetched
+        months = [r['month'] for r in bar_data]
+        self.bar_chart.Update(months, [[db.from_cents(r['income']) for r in bar_data], [db.from_cents(r['expense']) for r in bar_data]])
+        self.trans_list.Reload(search_term, count)
+        if version is not None: self.rendered_version = version
+
+    def ShowPreview(self, history, month, year):
+        # Same window as get_monthly_comparison_data: six months back plus this one
+        start_year, start_month = divmod(year * 12 + month - 1 - 6, 12)
+        totals = history.MonthlyTotals(f"{start_year:04d}-{start_month + 1:02d}-01")
+        self.bar_chart.Update(totals['months'], [list(map(db.from_cents, totals['income'])), list(map(db.from_cents, totals['expense']))])
     
     def OnSearch(self, event): self.RefreshData(self.search_ctrl.GetValue())
 
@@ -512,80 +606,280 @@ class ReportsPanel(wx.Panel):
         menu.Destroy()
 
     def OnClone(self, event):
-        trans = [t for t in db.get_transactions_by_filter(self.user_id) if t['transaction_id'] == self.selected_trans_id][0]
+        trans = db.get_transaction(self.user_id, self.selected_trans_id)
+        if not trans: return
         db.add_transaction(self.user_id, trans['account_id'], datetime.now().strftime('%Y-%m-%d'), 
                            abs(trans['amount']), trans['type'], trans['category'], trans['description'] + " (Clone)", "")
-        wx.GetApp().GetTopWindow().RefreshAllTabs()
+        self.GetTopLevelParent().NotifyDataChanged()
         wx.MessageBox("Transaction cloned successfully!", "Success")
 
     def OnEdit(self, event):
-        trans = [t for t in db.get_transactions_by_filter(self.user_id) if t['transaction_id'] == self.selected_trans_id]
+        trans = db.get_transaction(self.user_id, self.selected_trans_id)
         if not trans: return
-        dlg = TransactionEditDialog(self, self.user_id, trans[0], db.get_accounts(self.user_id))
-        if dlg.ShowModal() == wx.ID_OK: wx.GetApp().GetTopWindow().RefreshAllTabs()
+        dlg = TransactionEditDialog(self, self.user_id, trans, db.get_accounts(self.user_id))
+        if dlg.ShowModal() == wx.ID_OK: self.GetTopLevelParent().NotifyDataChanged()
         dlg.Destroy()
 
     def OnDelete(self, event):
         if wx.MessageBox("Are you sure you want to delete this transaction?", "Confirm Delete", wx.YES_NO | wx.ICON_WARNING) == wx.YES:
             db.delete_transaction(self.selected_trans_id, self.user_id)
-            wx.GetApp().GetTopWindow().RefreshAllTabs()
+            self.GetTopLevelParent().NotifyDataChanged()
 
     def OnGenerateReport(self, event):
-        path = os.path.abspath("report.html")
-        rows = db.get_transactions_by_filter(self.user_id)
-        html = "<html><body style='font-family: sans-serif; padding: 20px;'>"
-        html += "<h1 style='color: #2C3E50;'>Financify Transaction Report</h1>"
-        html += f"<p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>"
-        html += "<table border='1' cellspacing='0' cellpadding='8' style='width:100%; border-collapse: collapse;'>"
-        html += "<tr style='background-color: #ECF0F1;'><th>Date</th><th>Type</th><th>Amount</th><th>Category</th><th>Description</th></tr>"
-        for r in rows:
-            color = "green" if r['type']=='Income' else "red"
-            html += f"<tr><td>{r['date']}</td><td>{r['type']}</td><td style='color:{color}; font-weight:bold;'>{r['amount']}</td><td>{r['category']}</td><td>{r['description']}</td></tr>"
-        html += "</table></body></html>"
-        with open(path, "w") as f: f.write(html)
-        webbrowser.open('file://' + path)
+        report = financify.generate_report(self.user_id, os.path.abspath("report.html"))
+        webbrowser.open('file://' + report['path'])
 
     def OnExportCSV(self, event):
-        with wx.FileDialog(self, "Save CSV", wildcard="*.csv", style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT) as dlg:
+        with wx.FileDialog(self, "Save CSV", wildcard="CSV files (*.csv)|*.csv|Compressed CSV (*.csv.gz)|*.csv.gz", style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT) as dlg:
             if dlg.ShowModal() == wx.ID_CANCEL: return
             try:
-                rows = db.get_transactions_by_filter(self.user_id)
-                with open(dlg.GetPath(), 'w', newline='', encoding='utf-8') as f:
-                    w = csv.DictWriter(f, fieldnames=rows[0].keys())
-                    w.writeheader()
-                    for r in rows: w.writerow(dict(r))
+                financify.export_transactions(self.user_id, dlg.GetPath())
                 wx.MessageBox("Data exported successfully!", "Export")
             except Exception as e: wx.MessageBox(str(e))
 
     def OnImportCSV(self, event):
-        with wx.FileDialog(self, "Open CSV", wildcard="*.csv", style=wx.FD_OPEN) as dlg:
+        with wx.FileDialog(self, "Open CSV", wildcard="*.csv", style=wx.FD_OPEN | wx.FD_MULTIPLE) as dlg:
             if dlg.ShowModal() == wx.ID_CANCEL: return
-            try:
-                acc = db.get_accounts(self.user_id)[0]['account_id']
-                conn = db.get_db_connection()
-                conn.execute('BEGIN')
-                with open(dlg.GetPath(), 'r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
-                    for r in reader:
-                        d_str = smart_date_parse(r['date'])
-                        if not db.check_transaction_exists(self.user_id, d_str, abs(float(r['amount'])), r.get('description',''), conn):
-                            t_type = r.get('type', 'Expense').capitalize()
-                            if t_type not in ['Income', 'Expense']: t_type = 'Expense'
-                            db.add_transaction(self.user_id, acc, d_str, abs(float(r['amount'])), 
-                                               t_type, r.get('category','Other'), r.get('description', ''), "", conn)
-                conn.commit()
-                conn.close()
-                wx.MessageBox("CSV Imported successfully!", "Import")
-                wx.GetApp().GetTopWindow().RefreshAllTabs()
-            except Exception as e: wx.MessageBox(str(e))
+            self.ImportFiles(dlg.GetPaths())
+
+    def ImportFiles(self, paths):
+        # A single file is imported all-or-nothing; several files or a folder go through the parser pool
+        try: files = financify.statement_files(paths)
+        except ValueError as e:
+            wx.MessageBox(str(e))
+            return
+        progress = wx.ProgressDialog("Import CSV", "Importing transactions...", maximum=100, parent=self,
+                                     style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+        fractions = [0.0] * len(files)
+        def file_progress(index, rows, fraction):
+            fractions[index] = fraction
+            message = f"{os.path.basename(files[index])}: {rows:,} rows read ({sum(f == 1.0 for f in fractions)} of {len(files)} files)"
+            return progress.Update(int(sum(fractions) / len(files) * 100), message)[0]
+        try:
+            if len(files) == 1 and not os.path.isdir(paths[0]):
+                stats = financify.import_csv(self.user_id, files[0],
+                                             progress=lambda rows, fraction: progress.Update(int(fraction * 100), f"{rows:,} rows read")[0])
+            else:
+                stats = financify.import_files(self.user_id, files, progress=file_progress)
+        except Exception as e:
+            wx.MessageBox(str(e))
+            return
+        finally: progress.Destroy()
+        if stats['cancelled'] and not stats['imported']:
+            wx.MessageBox("Import cancelled. No transactions were added.", "Import")
+            return
+        failed = [f"{os.path.basename(f['path'])}: {f['error']}" for f in stats.get('files', []) if f['error']]
+        title = "Import cancelled" if stats['cancelled'] else "CSV Imported successfully!"
+        wx.MessageBox(f"{title}\n\nImported: {stats['imported']:,}\nDuplicates skipped: {stats['duplicates']:,}\n"
+                      f"Rejected rows: {stats['rejected']:,}\n({stats['rows_per_sec']:,} rows/sec)"
+                      + ("\n\nFiles with errors:\n" + "\n".join(failed[:10]) if failed else "")
+                      + ("\n\nSome dates fit both DD/MM/YYYY and MM/DD/YYYY and were read as MM/DD/YYYY." if stats['ambiguous_dates'] else ""), "Import")
+        self.GetTopLevelParent().NotifyDataChanged()
 
     def OnReset(self, event):
         if wx.MessageBox("⚠️ WARNING: This will permanently delete ALL your data.\nAre you sure?", "FACTORY RESET", wx.YES_NO|wx.ICON_ERROR) == wx.YES:
             db.wipe_user_data(self.user_id)
-            wx.GetApp().GetTopWindow().RefreshAllTabs()
+            self.GetTopLevelParent().NotifyDataChanged()
             wx.MessageBox("All data has been wiped.", "Reset Complete")
 
+class StatementDropTarget(wx.FileDropTarget):
+    # Statements or folders of them dropped on the Reports tab are imported like Import CSV
+    def __init__(self, panel):
+        super().__init__()
+        self.panel = panel
+
+    def OnDropFiles(self, x, y, filenames):
+        wx.CallAfter(self.panel.ImportFiles, list(filenames))  # not from inside the drag and drop loop
+        return True
+
+class TransactionPageSource:
+    # Pages of the transaction listing, fetched on demand with keyset pagination and kept
+    # in an LRU cache with their running balances. page_starts maps a page number to the
+    # key it starts after. Pages load on the query thread; until one arrives its rows read
+    # as None, and on_loaded(first, last) is called on the UI thread once they can be shown.
+    def __init__(self, user_id, executor, page_size=100, max_pages=50):
+        self.user_id = user_id
+        self.executor = executor
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.on_loaded = None
+        self.generation = 0
+        self.Reset(count=0)  # empty until the panel's first refresh
+
+    def Reset(self, search_term="", count=None):
+        self.generation += 1  # pages still loading for the old listing are dropped
+        self.search_term = search_term
+        self.pages = OrderedDict()
+        self.page_starts = {0: None}
+        self.loading = set()
+        self.count = db.count_transactions(self.user_id, search_term) if count is None else count
+        return self.count
+
+    def GetRow(self, index):
+        page_no, offset = divmod(index, self.page_size)
+        page = self.pages.get(page_no)
+        if page is None:
+            self.LoadPage(page_no)
+            return None
+        self.pages.move_to_end(page_no)
+        return page[0][offset] if offset < len(page[0]) else None
+
+    def GetBalance(self, index):
+        # Balance of the row's account just after that transaction
+        row = self.GetRow(index)
+        return None if row is None else self.pages[index // self.page_size][1].get(row['transaction_id'])
+
+    def IsLoading(self, index):
+        return index // self.page_size in self.loading
+
+    def LoadPage(self, page_no):
+        if page_no in self.loading or page_no * self.page_size >= self.count: return
+        self.loading.add(page_no)
+        user_id, search_term, generation = self.user_id, self.search_term, self.generation
+        known, start = page_no in self.page_starts, self.page_starts.get(page_no)
+
+        def fetch():
+            key = start
+            if not known:
+                # Jumped past unseen pages (e.g. dragged the scrollbar): find the boundary key
+                key = db.get_listing_key_at(user_id, search_term, page_no * self.page_size - 1)
+                if key is None: return key, [], {}
+            page = db.get_transactions_page(user_id, search_term, key, self.page_size)
+            return key, page, db.get_running_balances(page)
+
+        def loaded(result):
+            if generation != self.generation: return
+            key, page, balances = result
+            self.loading.discard(page_no)
+            self.page_starts[page_no] = key
+            if page: self.page_starts[page_no + 1] = (page[-1]['date'], page[-1]['transaction_id'])
+            self.pages[page_no] = page, balances
+            if len(self.pages) > self.max_pages: self.pages.popitem(last=False)
+            if self.on_loaded: self.on_loaded(page_no * self.page_size, min((page_no + 1) * self.page_size, self.count) - 1)
+
+        def failed(error):
+            if generation == self.generation: self.loading.discard(page_no)  # the next paint asks again
+
+        # A channel per page: the rows on screen can span two pages, and both must load
+        self.executor.Submit(('listing', page_no), fetch, loaded, failed)
+
+class TransactionListCtrl(wx.ListCtrl):
+    # Virtual list: wx asks for the text of visible rows only, which come from the page source
+    def __init__(self, parent, source):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_HRULES | wx.LC_VRULES)
+        self.source = source
+        self.InsertColumn(0, "ID", width=0)
+        self.InsertColumn(1, "Date", width=120)
+        self.InsertColumn(2, "Type", width=100)
+        self.InsertColumn(3, "Amount", width=120, format=wx.LIST_FORMAT_RIGHT)
+        self.InsertColumn(4, "Balance", width=120, format=wx.LIST_FORMAT_RIGHT)
+        self.InsertColumn(5, "Category", width=150)
+        self.InsertColumn(6, "Account", width=0)
+        self.InsertColumn(7, "Description", width=300)
+        self.income_attr = wx.ItemAttr()
+        self.income_attr.SetTextColour(wx.Colour(COLOR_GREEN))
+        self.expense_attr = wx.ItemAttr()
+        self.expense_attr.SetTextColour(wx.Colour(COLOR_RED))
+        source.on_loaded = self.OnPageLoaded
+
+    def OnPageLoaded(self, first, last):
+        if self and first <= last: self.RefreshItems(first, last)
+
+    def Reload(self, search_term="", count=None):
+        self.SetItemCount(self.source.Reset(search_term, count))
+        self.Refresh()
+
+    def OnGetItemText(self, item, col):
+        r = self.source.GetRow(item)
+        if r is None: return "Loading..." if col == 1 and self.source.IsLoading(item) else ""
+        if col == 0: return str(r['transaction_id'])
+        if col == 1: return r['date']
+        if col == 2: return r['type']
+        if col == 3: return f"₹{db.format_money(r['amount'])}" if r['type']=='Expense' else f"+₹{db.format_money(r['amount'])}"
+        if col == 4:
+            balance = self.source.GetBalance(item)
+            return "" if balance is None else f"₹{db.format_money(balance)}"
+        if col == 5: return r['category']
+        if col == 6: return r['account_name']
+        return r['description'] or ""
+
+    def OnGetItemAttr(self, item):
+        r = self.source.GetRow(item)
+        if r is None: return None
+        return self.income_attr if r['type'] == 'Income' else self.expense_attr
+
+class DiagnosticsDialog(wx.Dialog):
+    # Query instrumentation results: per-function and per-statement latency, and the slow-query log
+    def __init__(self, parent):
+        super().__init__(parent, title="Diagnostics", size=(1000, 650), style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        panel = wx.Panel(self)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        self.status = wx.StaticText(panel)
+        sizer.Add(self.status, 0, wx.ALL, 10)
+        book = wx.Notebook(panel)
+        self.functions = self.CreateList(book, [("Function", 260), ("Calls", 70), ("Mean ms", 90), ("p95 ms", 90), ("Max ms", 90), ("Total ms", 100)])
+        self.statements = self.CreateList(book, [("Statement", 420), ("Calls", 70), ("Mean ms", 90), ("p95 ms", 90), ("Max ms", 90), ("Rows", 90)])
+        slow_panel = wx.Panel(book)
+        slow_sizer = wx.BoxSizer(wx.VERTICAL)
+        self.slow = self.CreateList(slow_panel, [("At", 150), ("ms", 80), ("Function", 200), ("Statement", 450)])
+        self.slow.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnSlowSelected)
+        self.plan = wx.TextCtrl(slow_panel, style=wx.TE_MULTILINE | wx.TE_READONLY, size=(-1, 120))
+        slow_sizer.Add(self.slow, 1, wx.EXPAND)
+        slow_sizer.Add(self.plan, 0, wx.EXPAND | wx.TOP, 5)
+        slow_panel.SetSizer(slow_sizer)
+        book.AddPage(self.functions, "Functions")
+        book.AddPage(self.statements, "Statements")
+        book.AddPage(slow_panel, "Slow queries")
+        sizer.Add(book, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 10)
+        btn_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        for label, handler in [("Refresh", self.OnRefresh), ("Reset", self.OnReset), ("Save JSON...", self.OnSave)]:
+            btn = wx.Button(panel, label=label)
+            btn.Bind(wx.EVT_BUTTON, handler)
+            btn.Enable(instrumentation.is_enabled())
+            btn_sizer.Add(btn, 0, wx.RIGHT, 10)
+        btn_sizer.Add(wx.Button(panel, wx.ID_CLOSE), 0)
+        self.SetEscapeId(wx.ID_CLOSE)
+        sizer.Add(btn_sizer, 0, wx.ALIGN_RIGHT | wx.ALL, 10)
+        panel.SetSizer(sizer)
+        self.LoadData()
+
+    def CreateList(self, parent, columns):
+        ctrl = wx.ListCtrl(parent, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for i, (label, width) in enumerate(columns): ctrl.InsertColumn(i, label, width=width)
+        return ctrl
+
+    def LoadData(self):
+        if not instrumentation.is_enabled():
+            self.status.SetLabel("Instrumentation is off. Start Financify with FINANCIFY_INSTRUMENT=1 to collect query timings.")
+            return
+        snap = instrumentation.snapshot()
+        self.slow_queries = snap['slow_queries'][::-1]
+        self.status.SetLabel(f"Collecting since {snap['since']}. Slow-query threshold: {snap['slow_ms']:g} ms.")
+        for ctrl in (self.functions, self.statements, self.slow): ctrl.DeleteAllItems()
+        for name, s in snap['functions'].items():
+            self.functions.Append([name, s['calls'], f"{s['mean_ms']:.2f}", f"{s['p95_ms']:.2f}", f"{s['max_ms']:.2f}", f"{s['total_ms']:.1f}"])
+        for s in snap['statements']:
+            self.statements.Append([s['sql'], s['calls'], f"{s['mean_ms']:.2f}", f"{s['p95_ms']:.2f}", f"{s['max_ms']:.2f}", s['rows']])
+        for q in self.slow_queries:
+            self.slow.Append([q['at'], f"{q['ms']:.1f}", q['function'] or "", q['sql']])
+
+    def OnSlowSelected(self, event):
+        q = self.slow_queries[event.GetIndex()]
+        self.plan.SetValue(q['sql'] + "\n\n" + "\n".join(q['plan']))
+
+    def OnRefresh(self, event): self.LoadData()
+
+    def OnReset(self, event):
+        instrumentation.reset()
+        self.LoadData()
+
+    def OnSave(self, event):
+        with wx.FileDialog(self, "Save diagnostics", defaultFile="financify-diagnostics.json", wildcard="JSON files (*.json)|*.json",
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+            if dlg.ShowModal() == wx.ID_CANCEL: return
+            try: instrumentation.dump(dlg.GetPath())
+            except OSError as e: wx.MessageBox(str(e))
+
 class CategoryBudgetDialog(wx.Dialog):
     def __init__(self, parent, available_categories):
         # We DO NOT set a fixed height here anymore to avoid clipping. 
@@ -614,8 +908,8 @@ class CategoryBudgetDialog(wx.Dialog):
         self.SetMinSize(self.GetSize())
 
     def GetValues(self):
-        try: amt = float(self.amt_ctrl.GetValue())
-        except ValueError: amt = 0.0
+        try: amt = db.to_cents(self.amt_ctrl.GetValue())
+        except ValueError: amt = 0
         return self.cat_choice.GetStringSelection(), amt
 
 class TransactionEditDialog(wx.Dialog):
@@ -654,13 +948,13 @@ class TransactionEditDialog(wx.Dialog):
         wxdt = wx.DateTime(dt.day, dt.month-1, dt.year)
         self.date.SetValue(wxdt)
         self.type.SetStringSelection(self.t['type'])
-        self.amt.SetValue(str(abs(self.t['amount'])))
+        self.amt.SetValue(db.format_money(abs(self.t['amount'])))
         self.cat.SetValue(self.t['category'])
         self.desc.SetValue(self.t['description'])
 
     def OnSave(self, e):
         try:
-            v = float(self.amt.GetValue())
+            v = db.to_cents(self.amt.GetValue())
             if v <= 0: raise ValueError
             acc_id = list(self.amap.values())[0]
             nd = {'date': self.date.GetValue().FormatISODate(), 'type': self.type.GetStringSelection(), 'amount': v,
@@ -0,0 +1,68 @@
+import queue
+import sqlite3
+import threading
+
+import database as db
+
+# Runs database.py calls on a worker thread so panel refreshes never block the UI.
+# Every job belongs to a channel (e.g. "dashboard"). Submitting to a channel supersedes
+# whatever is queued or running there: queued stale jobs are skipped, a running query is
+# interrupted through sqlite3's progress handler, and stale results are never delivered.
+
+class QueryExecutor:
+    def __init__(self, deliver, progress_ops=10000):
+        # deliver(fn, *args) must run fn on the UI thread, e.g. wx.CallAfter
+        self.deliver = deliver
+        self.progress_ops = progress_ops
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.running = None
+        self.thread = threading.Thread(target=self._Run, name="financify-queries", daemon=True)
+        self.thread.start()
+
+    def Submit(self, channel, fetch, on_result, on_error=None):
+        with self.lock:
+            generation = self.generations.get(channel, 0) + 1
+            self.generations[channel] = generation
+        self.jobs.put((channel, generation, fetch, on_result, on_error))
+        return generation
+
+    def IsCurrent(self, channel, generation):
+        return self.generations.get(channel) == generation
+
+    def Shutdown(self, timeout=2.0):
+        with self.lock:
+            self.generations = {channel: gen + 1 for channel, gen in self.generations.items()}
+        self.jobs.put(None)
+        self.thread.join(timeout)
+
+    def _IsStale(self):
+        running = self.running
+        return 1 if running and not self.IsCurrent(*running) else 0
+
+    def _Run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None: break
+            channel, generation, fetch, on_result, on_error = job
+            if not self.IsCurrent(channel, generation): continue
+            # Set per job: the pooled connection may have been replaced since the last one
+            db.get_connection().set_progress_handler(self._IsStale, self.progress_ops)
+            self.running = (channel, generation)
+            try:
+                result, callback = fetch(), on_result
+            except sqlite3.OperationalError as e:
+                if not self.IsCurrent(channel, generation): continue  # interrupted as obsolete
+                result, callback = e, on_error
+            except Exception as e:
+                result, callback = e, on_error
+            finally:
+                self.running = None
+            if callback and self.IsCurrent(channel, generation):
+                self.deliver(self._Deliver, channel, generation, callback, result)
+
+    def _Deliver(self, channel, generation, callback, result):
+        # Runs on the UI thread; a newer job may have been submitted while this one waited
+        if self.IsCurrent(channel, generation):
+            callback(result)
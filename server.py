@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import database as db
+import exporter
+import financify
+
+# Local multi-user HTTP/JSON server, so several household members can share one financify.db.
+# Standard library only: asyncio handles the sockets, and every database.py call runs in a
+# bounded thread pool whose threads each keep their pooled connection. Large listings are
+# streamed with chunked transfer encoding one keyset page at a time, so the server never
+# holds a whole history in memory.
+#
+# POST /login {"username", "password"} returns a token; send it as "Authorization: Bearer
+# <token>" on every other request. Amounts are major units, as in financify.py. Errors come
+# back as {"error": message} with a 4xx status.
+#
+#   POST   /login, /logout
+#   GET    /accounts
+#   GET    /transactions?search=&after=DATE,ID&limit=100     one page, with the key of the next
+#   GET    /transactions/stream?search=                       every row, JSON Lines
+#   GET    /transactions/ID
+#   POST   /transactions {date, amount, type, category, description, account_id}
+#   PUT    /transactions/ID {same}
+#   DELETE /transactions/ID
+#   GET    /dashboard?month=&year=                            financify.summary()
+#   GET    /budgets?month=&year=
+#   PUT    /budgets {amount, month, year, category}           no category: the monthly budget
+#   DELETE /budgets?category=&month=&year=
+#   POST   /import                                            CSV statement as the request body
+#   GET    /export?start=&end=&type=                          CSV, like exporter.export_csv
+#
+# Usage: python server.py [--db PATH] [--host 127.0.0.1] [--port 8765] [--threads 8]
+
+DB_THREADS = 8
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 1000      # rows per database call while streaming
+TOKEN_IDLE_SECONDS = 8 * 3600
+MAX_JSON_BYTES = 1 << 20
+MAX_IMPORT_BYTES = 256 << 20
+MAX_HEADER_BYTES = 16 << 10
+IDLE_TIMEOUT = 60            # seconds a keep-alive connection may wait for its next request
+
+STATUS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+          411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def transaction_record(row):
+    record = dict(row)
+    record['amount'] = db.from_cents(record['amount'])
+    return record
+
+class Request:
+    def __init__(self, method, target, headers, reader):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path.rstrip('/') or '/'
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.reader = reader
+        self.user_id = None
+        self.params = ()
+        self.body_read = False
+
+    @property
+    def length(self):
+        try: return int(self.headers.get('content-length', 0))
+        except ValueError: return -1
+
+    async def Json(self):
+        if self.length < 0: raise HttpError(400, "Bad Content-Length")
+        if self.length > MAX_JSON_BYTES: raise HttpError(413, "Request body too large")
+        body = await self.reader.readexactly(self.length) if self.length else b'{}'
+        self.body_read = True
+        try: data = json.loads(body)
+        except ValueError: raise HttpError(400, "Body must be JSON")
+        if not isinstance(data, dict): raise HttpError(400, "Body must be a JSON object")
+        return data
+
+    def Int(self, name, default=None):
+        value = self.query.get(name)
+        if value is None:
+            if default is None: raise HttpError(400, f"Missing {name}")
+            return default
+        try: return int(value)
+        except ValueError: raise HttpError(400, f"{name} must be a number")
+
+class Server:
+    def __init__(self, threads=DB_THREADS):
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="financify-db")
+        self.writes = db.WriteQueue()  # POST /transactions, committed in groups
+        self.tokens = {}  # token -> [user_id, last used]
+        self.routes = [('POST', r'/login', self.Login, False),
+                       ('POST', r'/logout', self.Logout, True),
+                       ('GET', r'/accounts', self.Accounts, True),
+                       ('GET', r'/transactions', self.Transactions, True),
+                       ('GET', r'/transactions/stream', self.StreamTransactions, True),
+                       ('GET', r'/transactions/(\d+)', self.GetTransaction, True),
+                       ('POST', r'/transactions', self.AddTransaction, True),
+                       ('PUT', r'/transactions/(\d+)', self.UpdateTransaction, True),
+                       ('DELETE', r'/transactions/(\d+)', self.DeleteTransaction, True),
+                       ('GET', r'/dashboard', self.Dashboard, True),
+                       ('GET', r'/budgets', self.Budgets, True),
+                       ('PUT', r'/budgets', self.SetBudget, True),
+                       ('DELETE', r'/budgets', self.DeleteBudget, True),
+                       ('POST', r'/import', self.Import, True),
+                       ('GET', r'/export', self.Export, True)]
+        self.routes = [(method, re.compile(pattern), handler, auth) for method, pattern, handler, auth in self.routes]
+
+    def Run(self, fn, *args):
+        # Blocking database.py/financify.py work, off the event loop
+        return asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def Serve(self, host, port):
+        return asyncio.start_server(self.HandleConnection, host, port, limit=MAX_HEADER_BYTES)
+
+    def Close(self):
+        self.writes.Close()
+        self.pool.shutdown(wait=True)
+        db.close_connections()
+
+    # --- HTTP ---
+
+    async def HandleConnection(self, reader, writer):
+        try:
+            while True:
+                try: head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError, ConnectionError): break
+                lines = head.decode('latin-1').split('\r\n')
+                try: method, target, version = lines[0].split(' ')
+                except ValueError: break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name: headers[name.strip().lower()] = value.strip()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                request = Request(method, target, headers, reader)
+                if not await self.Respond(request, writer, keep_alive): break
+                if not keep_alive: break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def Respond(self, request, writer, keep_alive):
+        # False when the connection cannot be reused (body left unread, broken stream)
+        try:
+            if 'transfer-encoding' in request.headers: raise HttpError(411, "Send a Content-Length, not a chunked body")
+            handler, request.params, needs_auth = self.Route(request)
+            if needs_auth: request.user_id = self.Authenticate(request)
+            result = await handler(request)
+            if isinstance(result, Chunks): return await self.SendStream(writer, result, keep_alive)
+            status = 200
+        except HttpError as e:
+            status, result = e.status, {'error': str(e)}
+        except LookupError as e:
+            status, result = 404, {'error': str(e)}
+        except ValueError as e:
+            status, result = 400, {'error': str(e)}
+        except Exception as e:
+            status, result = 500, {'error': f"{type(e).__name__}: {e}"}
+        keep_alive = keep_alive and (request.body_read or not request.length and 'transfer-encoding' not in request.headers)
+        await self.Send(writer, status, result, keep_alive)
+        return keep_alive
+
+    def Route(self, request):
+        allowed = False
+        for method, pattern, handler, auth in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match:
+                if method == request.method: return handler, match.groups(), auth
+                allowed = True
+        if allowed: raise HttpError(405, f"{request.method} not allowed on {request.path}")
+        raise HttpError(404, f"No such endpoint: {request.path}")
+
+    def Authenticate(self, request):
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        entry = self.tokens.get(token) if scheme.lower() == 'bearer' else None
+        now = time.monotonic()
+        if entry is None or now - entry[1] > TOKEN_IDLE_SECONDS:
+            self.tokens.pop(token, None)
+            raise HttpError(401, "Log in first")
+        entry[1] = now
+        return entry[0]
+
+    async def Send(self, writer, status, data, keep_alive):
+        body = json.dumps(data, default=str).encode()
+        writer.write(self.Head(status, 'application/json', keep_alive, f"Content-Length: {len(body)}") + body)
+        await writer.drain()
+
+    async def SendStream(self, writer, chunks, keep_alive):
+        # Chunked transfer encoding; drain() after every chunk holds the producer to the client's pace
+        writer.write(self.Head(200, chunks.content_type, keep_alive, "Transfer-Encoding: chunked"))
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+        except Exception:
+            return False  # the status line is gone; dropping the connection is the only error left
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    def Head(self, status, content_type, keep_alive, length):
+        return (f"HTTP/1.1 {status} {STATUS.get(status, '')}\r\nContent-Type: {content_type}\r\n{length}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode()
+
+    # --- ENDPOINTS ---
+
+    async def Login(self, request):
+        data = await request.Json()
+        ok, message, user_id = await self.Run(db.login_user, str(data.get('username', '')), str(data.get('password', '')))
+        if not ok: raise HttpError(401, message)
+        token, now = secrets.token_urlsafe(32), time.monotonic()
+        # Tokens nobody presents again would otherwise stay until the server stops
+        for expired in [t for t, (_, last_used) in self.tokens.items() if now - last_used > TOKEN_IDLE_SECONDS]:
+            del self.tokens[expired]
+        self.tokens[token] = [user_id, now]
+        return {'token': token, 'user_id': user_id}
+
+    async def Logout(self, request):
+        self.tokens.pop(request.headers['authorization'].partition(' ')[2], None)
+        return {'ok': True}
+
+    async def Accounts(self, request):
+        rows = await self.Run(db.get_accounts, request.user_id)
+        return [{**dict(r), 'current_balance': db.from_cents(r['current_balance'])} for r in rows]
+
+    async def Transactions(self, request):
+        limit = min(max(request.Int('limit', PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        after = request.query.get('after')
+        if after:
+            day, _, transaction_id = after.partition(',')
+            if not transaction_id.isdigit(): raise HttpError(400, "after must be DATE,ID")
+            after = (day, int(transaction_id))
+        rows = await self.Run(db.get_transactions_page, request.user_id, request.query.get('search', ''), after, limit)
+        last = rows[-1] if len(rows) == limit else None
+        return {'rows': [transaction_record(r) for r in rows], 'next': f"{last['date']},{last['transaction_id']}" if last else None}
+
+    def Pages(self, user_id, search="", start_date=None, end_date=None, trans_type=None):
+        # Keyset pages of the listing (newest first), each fetched in the pool
+        async def pages():
+            after = None
+            while True:
+                rows = await self.Run(db.get_transactions_page, user_id, search, after, STREAM_PAGE_SIZE, start_date, end_date, trans_type)
+                if rows: yield rows
+                if len(rows) < STREAM_PAGE_SIZE: return
+                after = (rows[-1]['date'], rows[-1]['transaction_id'])
+        return pages()
+
+    async def StreamTransactions(self, request):
+        async def lines():
+            async for rows in self.Pages(request.user_id, request.query.get('search', '')):
+                yield ''.join(json.dumps(transaction_record(r)) + '\n' for r in rows).encode()
+        return Chunks(lines(), 'application/x-ndjson')
+
+    async def GetTransaction(self, request):
+        row = await self.Run(db.get_transaction, request.user_id, int(request.params[0]))
+        if row is None: raise HttpError(404, "Transaction not found.")
+        return transaction_record(row)
+
+    async def AddTransaction(self, request):
+        data = await request.Json()
+        future = await self.Run(financify.queue_transaction, request.user_id, data.get('date'), data.get('amount'), data.get('type'),
+                                data.get('category'), data.get('description'), data.get('account_id'), self.writes)
+        return await asyncio.wrap_future(future)
+
+    async def UpdateTransaction(self, request):
+        data = await request.Json()
+        return await self.Run(financify.update_transaction, request.user_id, int(request.params[0]), data.get('date'), data.get('amount'),
+                              data.get('type'), data.get('category'), data.get('description'), data.get('account_id'))
+
+    async def DeleteTransaction(self, request):
+        return await self.Run(financify.delete_transaction, request.user_id, int(request.params[0]))
+
+    def Period(self, request):
+        today = datetime.now()
+        month, year = request.Int('month', today.month), request.Int('year', today.year)
+        if not 1 <= month <= 12: raise HttpError(400, "month must be 1-12")
+        return month, year
+
+    async def Dashboard(self, request):
+        return await self.Run(financify.summary, request.user_id, *self.Period(request))
+
+    async def Budgets(self, request):
+        month, year = self.Period(request)
+        rows = await self.Run(db.get_category_budgets_with_spending, request.user_id, month, year)
+        return [{'category': r['category'], 'budget': db.from_cents(r['budget']), 'spent': db.from_cents(r['spent'])} for r in rows]
+
+    async def SetBudget(self, request):
+        data = await request.Json()
+        today = datetime.now()
+        try: month, year = int(data.get('month', today.month)), int(data.get('year', today.year))
+        except (TypeError, ValueError): raise HttpError(400, "month and year must be numbers")
+        if not 1 <= month <= 12: raise HttpError(400, "month must be 1-12")
+        return await self.Run(financify.set_budget, request.user_id, data.get('amount'), month, year, data.get('category'))
+
+    async def DeleteBudget(self, request):
+        if not request.query.get('category'): raise HttpError(400, "Missing category")
+        return await self.Run(financify.delete_budget, request.user_id, request.query['category'], *self.Period(request))
+
+    async def Import(self, request):
+        # The body is spooled to a temporary file and imported like a statement picked in the app
+        if 'content-length' not in request.headers: raise HttpError(411, "Content-Length required")
+        if request.length < 0: raise HttpError(400, "Bad Content-Length")
+        if request.length > MAX_IMPORT_BYTES: raise HttpError(413, "Statement too large")
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                remaining = request.length
+                while remaining:
+                    data = await request.reader.read(min(remaining, 1 << 16))
+                    if not data: raise HttpError(400, "Incomplete body")
+                    f.write(data)
+                    remaining -= len(data)
+            request.body_read = True
+            return await self.Run(financify.import_csv, request.user_id, path)
+        finally:
+            os.remove(path)
+
+    async def Export(self, request):
+        start, end, trans_type = request.query.get('start'), request.query.get('end'), request.query.get('type')
+        amount = exporter.CSV_FIELDS.index('amount')
+        async def rows():
+            out = io.StringIO()
+            w = csv.writer(out)
+            w.writerow(exporter.CSV_FIELDS)
+            yield out.getvalue().encode()
+            async for page in self.Pages(request.user_id, "", start, end, trans_type):
+                out.seek(0)
+                out.truncate()
+                w.writerows([*r[:amount], db.format_money(r[amount]), *r[amount + 1:]] for r in page)
+                yield out.getvalue().encode()
+        return Chunks(rows(), 'text/csv')
+
+class Chunks:
+    # Streamed response body: an async iterator of bytes and its content type
+    def __init__(self, chunks, content_type):
+        self.chunks = chunks
+        self.content_type = content_type
+
+    def __aiter__(self):
+        return self.chunks.__aiter__()
+
+async def serve(host, port, threads=DB_THREADS, ready=None):
+    # ready(server) is called once the socket is listening, e.g. to learn the port picked for port=0
+    app = Server(threads)
+    server = await app.Serve(host, port)
+    if ready: ready(server)
+    try:
+        async with server: await server.serve_forever()
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, app.Close)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve financify.db over HTTP/JSON to several users on this machine or network.")
+    parser.add_argument('--db', help="database file (default: financify.db next to this script)")
+    parser.add_argument('--host', default='127.0.0.1', help="0.0.0.0 to accept other devices on the network")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--threads', type=int, default=DB_THREADS, help="database worker threads")
+    args = parser.parse_args(argv)
+    if args.db: db.DB_NAME = os.path.abspath(args.db)
+    db.initialize_database()
+    print(f"Serving {db.DB_NAME} on http://{args.host}:{args.port}")
+    try: asyncio.run(serve(args.host, args.port, args.threads))
+    except KeyboardInterrupt: pass
+
+if __name__ == '__main__':
+    main()